@@ -0,0 +1,61 @@
+"""
+Throughput of the streaming savegame decompressors, one line per savegame.
+
+Each savegame is fed to its decompressor one MAP_DATA packet at a time, like during a
+map download. The format is taken from the savegame header, so pass one savegame per
+compression format (OTTN, OTTX, OTTZ, OTTD) to compare them. savegen.py writes all
+four with --compression, from the same made-up contents given the same options.
+
+Usage: python benchmarks/decompression.py save.sav [save.sav ...]
+"""
+
+import argparse
+import time
+
+from openttd_protocol.wire.write import SEND_TCP_MTU
+
+from ottd_prayer.compression import create_decompressor
+from ottd_prayer.saveload import SAVELOAD_HEADER_SIZE
+
+MAP_DATA_SIZE = SEND_TCP_MTU - 3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("savegame", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'format':6} {'compressed':>12} {'decompressed':>14} {'time':>9}"
+        f" {'in MiB/s':>9} {'out MiB/s':>10}  savegame"
+    )
+    for filename in args.savegame:
+        with open(filename, "rb") as f:
+            savegame = memoryview(f.read())
+        compression = savegame[:4].tobytes()
+        data = savegame[SAVELOAD_HEADER_SIZE:]
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            decompressed = 0
+            start = time.perf_counter()
+            decompressor = create_decompressor(compression)
+            for offset in range(0, len(data), MAP_DATA_SIZE):
+                for piece in decompressor.decompress(
+                    data[offset : offset + MAP_DATA_SIZE]
+                ):
+                    decompressed += len(piece)
+            best = min(best, time.perf_counter() - start)
+
+        compressed_mib = len(data) / (1 << 20)
+        decompressed_mib = decompressed / (1 << 20)
+        print(
+            f"{compression.decode():6} {compressed_mib:8.1f} MiB"
+            f" {decompressed_mib:10.1f} MiB {best:7.3f} s"
+            f" {compressed_mib / best:9.1f} {decompressed_mib / best:10.1f}  {filename}"
+        )
+
+
+if __name__ == "__main__":
+    main()
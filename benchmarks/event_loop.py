@@ -0,0 +1,140 @@
+"""
+Packets per second per core of the GameProtocol receive path, for every event loop.
+
+A server process sends a never-ending stream of packets, half of them FRAMEs and the
+other half CHAT and COMMAND packets that the bot ignores, like a busy server does.
+The fewer packets per write, the more the event loop itself costs. For every event
+loop, a fresh process receives them with GameProtocol for a while, and the packets
+it got through are divided by the CPU time it used.
+
+Usage: python benchmarks/event_loop.py [--seconds N] [--packets-per-write N]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from ottd_prayer.bot_structures import ServerFrame
+from ottd_prayer.config import EventLoop
+from ottd_prayer.event_loop import run
+from ottd_prayer.game_protocol import GameProtocol, PacketGameType
+
+
+def packet(packet_type: PacketGameType, payload: bytes) -> bytes:
+    return struct.pack("<HB", len(payload) + 3, packet_type) + payload
+
+
+def packet_stream(packets: int) -> bytes:
+    frame = packet(PacketGameType.PACKET_SERVER_FRAME, struct.pack("<IIB", 1, 2, 3))
+    chat = packet(
+        PacketGameType.PACKET_SERVER_CHAT, b"\x03\x01\0\0\0\0hello\0" + bytes(8)
+    )
+    command = packet(PacketGameType.PACKET_SERVER_COMMAND, bytes(40))
+    return (frame + chat + frame + command) * (packets // 4)
+
+
+def serve(port: int, packets_per_write: int) -> None:
+    stream = packet_stream(max(4, packets_per_write))
+
+    async def send_forever(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                writer.write(stream)
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def run_server() -> None:
+        server = await asyncio.start_server(send_forever, "127.0.0.1", port)
+        await server.serve_forever()
+
+    asyncio.run(run_server())
+
+
+class FrameCounter:
+    def __init__(self) -> None:
+        self.frames = 0
+
+    async def receive_PACKET_SERVER_FRAME(
+        self, source: Any, server_frame: ServerFrame
+    ) -> None:
+        self.frames += 1
+
+
+def measure(port: int, event_loop: EventLoop, seconds: float) -> tuple[str, float]:
+    """Runs in a fresh process for every event loop"""
+
+    async def receive() -> tuple[str, float]:
+        loop = asyncio.get_running_loop()
+        counter = FrameCounter()
+        transport, protocol = await loop.create_connection(
+            lambda: GameProtocol(counter), "127.0.0.1", port
+        )
+        await asyncio.sleep(0.5)  # warm up
+
+        def received() -> int:
+            return counter.frames + sum(protocol.ignored_packets.values())
+
+        start_packets = received()
+        start_cpu = time.process_time()
+        await asyncio.sleep(seconds)
+        packets = received() - start_packets
+        cpu = time.process_time() - start_cpu
+
+        protocol.task.cancel()
+        transport.close()
+        return type(loop).__module__, packets / cpu
+
+    return run(receive(), event_loop)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument(
+        "--loop",
+        action="append",
+        type=EventLoop,
+        choices=[EventLoop.ASYNCIO, EventLoop.UVLOOP],
+        help="default: both",
+    )
+    parser.add_argument(
+        "--packets-per-write",
+        type=int,
+        default=4,
+        help="how many packets the server sends at once, at least 4",
+    )
+    parser.add_argument("--port", type=int, default=13979)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    server = context.Process(
+        target=serve, args=(args.port, args.packets_per_write), daemon=True
+    )
+    server.start()
+    time.sleep(1)
+
+    print(f"{'event loop':20} {'packets/s/core':>15}")
+    try:
+        for event_loop in args.loop or [EventLoop.ASYNCIO, EventLoop.UVLOOP]:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                try:
+                    loop_module, rate = pool.submit(
+                        measure, args.port, event_loop, args.seconds
+                    ).result()
+                except ImportError as e:
+                    print(f"{event_loop.value:20} {e}")
+                    continue
+            print(f"{loop_module:20} {rate:15.0f}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Memory and CPU overhead per bot when running a fleet of bots in one process.
+
+The stand-in server of standin_server.py runs in its own process with an empty map,
+lets every bot join company 1 next to a human player, then sends a frame every tick
+like a real server. For every fleet size, a fresh process runs that many bots on one
+event loop, and reports how much its memory grew and how much CPU it used per bot
+once all bots are playing. The memory of the process before starting any bot is
+what every bot would cost on top of that if it ran in its own process. Memory is the
+resident set size on Linux, and the peak resident set size on other Unix systems.
+
+Usage: python benchmarks/fleet_overhead.py [--bots 1 10 100] [--seconds N]
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from saveload_memory import peak_rss_mib
+from standin_server import StandInOptions, serve
+
+from ottd_prayer.config import Bot, FleetConfig, Ottd, Server
+from ottd_prayer.fleet import run_fleet
+
+
+def rss_mib() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except FileNotFoundError:
+        return peak_rss_mib()
+
+
+def measure(port: int, bots: int, seconds: float) -> tuple[float, float, float]:
+    """Runs in a fresh process for every fleet size"""
+    logging.basicConfig(level=logging.ERROR)
+    config = FleetConfig(
+        servers=[
+            Server(
+                player_name="bot %d" % i,
+                server_host="127.0.0.1",
+                server_port=port,
+                company_id=1,
+            )
+            for i in range(bots)
+        ],
+        bot=Bot(cache_dir=None),
+        ottd=Ottd(network_revision="14.1", revision_major=14, revision_minor=1),
+    )
+
+    async def run() -> tuple[float, float, float]:
+        start_rss = rss_mib()
+        fleet = asyncio.create_task(run_fleet(config))
+        # Bots wait a second before joining, to see if they are banned
+        await asyncio.sleep(3)
+        start_cpu = time.process_time()
+        await asyncio.sleep(seconds)
+        cpu = time.process_time() - start_cpu
+        fleet_rss = rss_mib() - start_rss
+        fleet.cancel()
+        return start_rss, fleet_rss, cpu / seconds
+
+    return asyncio.run(run())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bots", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=13979)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    server = context.Process(
+        target=serve, args=(StandInOptions(), args.port), daemon=True
+    )
+    server.start()
+    time.sleep(1)
+
+    print(f"{'bots':>5} {'process MiB':>12} {'MiB/bot':>8} {'CPU %/bot':>10}")
+    try:
+        for bots in args.bots:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                process_mib, fleet_mib, cpu = pool.submit(
+                    measure, args.port, bots, args.seconds
+                ).result()
+            print(
+                f"{bots:5d} {process_mib:12.1f} {fleet_mib / bots:8.2f}"
+                f" {cpu * 100 / bots:10.2f}"
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+How many bots a machine can hold, running fleets of growing size against a stand-in
+server.
+
+The stand-in server of standin_server.py runs in its own process, with the given
+savegame as its map, or a small generated one. For every fleet size, a fresh process
+runs that many bots on one event loop, each joining a company by name, so that every
+bot downloads and decodes the map. Once the bots had time to join, the CPU the
+process uses and how much its memory grew are measured, per bot. The server reports
+how long bots took from connecting to being moved to their company, and how many
+frames behind the current one their ACKs were. Everything runs on this machine,
+without a network.
+
+Usage: python benchmarks/load_test.py [--bots 1 10 100] [--seconds N] [SAVEGAME]
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fleet_overhead import rss_mib
+from savegen import SavegameSpec, write_savegame
+from standin_server import StandInOptions, StandInStats, serve
+
+from ottd_prayer.config import AutoReconnectCondition, Bot, FleetConfig, Ottd, Server
+from ottd_prayer.fleet import run_fleet
+from ottd_prayer.map_decoder import shutdown_decode_pool
+
+
+def percentiles(values: list[float]) -> str:
+    if len(values) == 0:
+        return "-"
+    values = sorted(values)
+    return "/".join(
+        "%.2f" % values[min(int(len(values) * p), len(values) - 1)]
+        for p in (0.5, 0.9, 0.99)
+    )
+
+
+def run_bots(
+    port: int, bots: int, companies: int, join_seconds: float, seconds: float
+) -> tuple[float, float, float]:
+    """Runs in a fresh process for every fleet size"""
+    logging.basicConfig(level=logging.ERROR)
+    config = FleetConfig(
+        servers=[
+            Server(
+                player_name="bot %d" % i,
+                server_host="127.0.0.1",
+                server_port=port,
+                company_name="Company %d" % (i % companies + 1),
+            )
+            for i in range(bots)
+        ],
+        bot=Bot(
+            cache_dir=None,
+            auto_reconnect_if=[AutoReconnectCondition.CONNECTION_LOST],
+        ),
+        ottd=Ottd(),
+    )
+
+    async def run() -> tuple[float, float, float]:
+        start_rss = rss_mib()
+        fleet = asyncio.create_task(run_fleet(config))
+        await asyncio.sleep(join_seconds)
+        start_cpu = time.process_time()
+        await asyncio.sleep(seconds)
+        cpu = time.process_time() - start_cpu
+        fleet_rss = rss_mib() - start_rss
+        fleet.cancel()
+        await asyncio.wait([fleet])
+        return start_rss, fleet_rss, cpu / seconds
+
+    try:
+        return asyncio.run(run())
+    finally:
+        shutdown_decode_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "savegame",
+        nargs="?",
+        help="map for the server to send, default: a generated one",
+    )
+    parser.add_argument("--bots", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument(
+        "--companies",
+        type=int,
+        default=15,
+        help="companies in the savegame, named Company 1 and so on",
+    )
+    parser.add_argument(
+        "--join-seconds",
+        type=float,
+        default=10,
+        help="how long to give the bots to join before measuring",
+    )
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--ticks-per-second", type=float, default=1 / 0.03)
+    parser.add_argument(
+        "--churn-interval",
+        type=float,
+        default=1,
+        help="seconds between made-up human players joining, moving or quitting",
+    )
+    parser.add_argument("--port", type=int, default=13979)
+    args = parser.parse_args()
+
+    savegame: Optional[str] = args.savegame
+    if savegame is None:
+        fd, savegame = tempfile.mkstemp(suffix=".sav")
+        with os.fdopen(fd, "wb") as f:
+            write_savegame(f, SavegameSpec(companies=args.companies, scripts=1))
+
+    context = multiprocessing.get_context("spawn")
+    control, server_control = context.Pipe()
+    options = StandInOptions(
+        savegame=savegame,
+        companies=args.companies,
+        ticks_per_second=args.ticks_per_second,
+        churn_interval=args.churn_interval,
+    )
+    server = context.Process(
+        target=serve, args=(options, args.port, server_control), daemon=True
+    )
+    server.start()
+    time.sleep(1)
+
+    print(
+        f"{'bots':>5} {'joined':>6} {'join s p50/p90/p99':>19}"
+        f" {'ACK lag ms p50/p90/p99':>23} {'process MiB':>12} {'MiB/bot':>8}"
+        f" {'CPU %/bot':>10}"
+    )
+    try:
+        for bots in args.bots:
+            control.send("stats")
+            control.recv()  # start afresh
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                process_mib, fleet_mib, cpu = pool.submit(
+                    run_bots,
+                    args.port,
+                    bots,
+                    args.companies,
+                    args.join_seconds,
+                    args.seconds,
+                ).result()
+            control.send("stats")
+            stats: StandInStats = control.recv()
+            ack_lags = [lag * 1000 / args.ticks_per_second for lag in stats.ack_lags]
+            print(
+                f"{bots:5d} {len(stats.join_latencies):6d}"
+                f" {percentiles(stats.join_latencies):>19}"
+                f" {percentiles(ack_lags):>23} {process_mib:12.1f}"
+                f" {fleet_mib / bots:8.2f} {cpu * 100 / bots:10.2f}"
+            )
+    finally:
+        control.send(None)
+        server.join(5)
+        server.terminate()
+        if args.savegame is None:
+            os.remove(savegame)
+
+
+if __name__ == "__main__":
+    main()
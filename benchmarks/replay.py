@@ -0,0 +1,124 @@
+"""
+Throughput and latency of the bot's whole receive path, replaying a recorded session.
+
+Record a session by setting record_dir in the bot's config, then replay any of the
+files it wrote. The packets are fed to a GameProtocol and PrayerBot pair, set up with
+the same config, over a transport that goes nowhere, as fast as the bot takes them or
+at the speed they were recorded. Latency is the time from feeding the bot a bunch of
+packets that arrived together until it has handled all of them.
+
+The replayed server doesn't answer the bot, it only says what it said back then. For
+the bot to behave the same, leave its cache as it was while recording: with
+--no-cache, a bot that knew its company ID back then looks it up in the map, and the
+move it then asks for comes after the server has already confirmed it. With
+decode_workers, the CPU time of decoding the map is not counted.
+
+Usage: python benchmarks/replay.py RECORDING CONFIG [--recorded-speed] [--no-cache]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from dataclasses import replace
+
+from ottd_prayer.config import Config, load_config
+from ottd_prayer.game_protocol import GameProtocol
+from ottd_prayer.prayer_bot import PrayerBot
+from ottd_prayer.recording import ReplayTransport, read_recording
+
+
+def count_packets(packets: bytes) -> int:
+    count = 0
+    offset = 0
+    while offset < len(packets):
+        offset += packets[offset] | packets[offset + 1] << 8
+        count += 1
+    return count
+
+
+async def replay(
+    recording: list[tuple[float, bytes]], config: Config, recorded_speed: bool
+) -> None:
+    bot = PrayerBot(config)
+    protocol = GameProtocol(bot)
+    transport = ReplayTransport(protocol)
+    protocol.connection_made(transport)
+    # Waits for a second, then sends JOIN into the void
+    await bot.set_protocol_and_join(protocol)
+
+    packets = 0
+    latencies = []
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    for elapsed, chunk in recording:
+        if recorded_speed:
+            await asyncio.sleep(start + elapsed - time.perf_counter())
+        if protocol.task.done():
+            print("The bot disconnected, stopping the replay early")
+            break
+
+        fed = time.perf_counter()
+        protocol.data_received(chunk)
+        # Let the bot handle everything, including the last packet taken off the queue
+        while not protocol._queue.empty() and not protocol.task.done():
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        latencies.append(time.perf_counter() - fed)
+        packets += count_packets(chunk)
+
+    if bot.company_lookup_task is not None:
+        await asyncio.wait([bot.company_lookup_task])
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    transport.close()
+
+    latencies.sort()
+    print(
+        f"{packets} packets in {len(latencies)} bunches, {wall:.3f}s wall,"
+        f" {cpu:.3f}s CPU, {packets / wall:.0f} packets/s,"
+        f" {packets / cpu:.0f} packets/s/core"
+    )
+    if len(latencies) != 0:
+        print(
+            f"latency per bunch: median {statistics.median(latencies) * 1e6:.0f}us,"
+            f" p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us,"
+            f" max {latencies[-1] * 1e6:.0f}us;"
+            f" bot sent {transport.packets_sent} packets"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recording", help="file written to the record_dir of a bot")
+    parser.add_argument("config", help="config of the bot to replay it to")
+    parser.add_argument(
+        "--recorded-speed",
+        action="store_true",
+        help="feed packets as they were recorded, instead of as fast as possible",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="don't use the cache directory, so that the map is always decoded",
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if not isinstance(config, Config):
+        config = config.bot_config(config.servers[0])
+    cache_dir = None if args.no_cache else config.bot.cache_dir
+    config = replace(
+        config, bot=replace(config.bot, cache_dir=cache_dir, record_dir=None)
+    )
+    logging.basicConfig(level=logging.WARNING)
+
+    recording = list(read_recording(args.recording))
+    for _ in range(args.repeat):
+        asyncio.run(replay(recording, config, args.recorded_speed))
+
+
+if __name__ == "__main__":
+    main()
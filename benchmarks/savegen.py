@@ -0,0 +1,335 @@
+"""
+Generator of synthetic savegames for benchmarking the savegame decoder.
+
+The savegames are valid as far as SaveloadBuffer is concerned, but their contents are
+made up: the per-tile map chunks of a map of the given size, a PLYR chunk with the
+given number of companies, AIPL and GSDT chunks with nested script data, and any
+number of table chunks whose rows have nested structs, repeated fields and strings.
+The savegame is written as it is generated, so even 4096x4096 maps don't need to fit
+in memory.
+
+It is compressed like OpenTTD does with --compression: OTTN (none, the default), OTTX
+(LZMA), OTTZ (zlib) or OTTD (LZO). LZO needs the lzallright package; without it, an
+OTTD savegame can be made by OpenTTD itself, by saving a game after setting
+savegame_format = lzo in the [misc] section of openttd.cfg, if it was built with LZO.
+
+Usage: python benchmarks/savegen.py [--map-size 4096] [--rows 10000] out.sav
+"""
+
+import argparse
+import lzma
+import random
+import struct
+import zlib
+from dataclasses import dataclass, fields
+from typing import Any, BinaryIO, Callable, Iterator, Optional
+
+from ottd_prayer.saveload import FIELD_WIDTHS
+
+SAVELOAD_VERSION = 300
+# Compression preset OpenTTD uses for OTTX savegames
+LZMA_PRESET = 2
+# Compression level OpenTTD uses for OTTZ savegames
+ZLIB_LEVEL = 6
+# OpenTTD compresses LZO savegames in blocks of this many bytes
+LZO_BUFFER_SIZE = 8192
+# Map chunks are made up of this many different rows of tiles, since real maps are
+# very repetitive and compress well too
+TILE_ROW_VARIANTS = 64
+# Per-tile map chunks and how many bytes they take per tile
+MAP_CHUNKS = [
+    (b"MAPT", 1),
+    (b"MAPH", 1),
+    (b"MAPO", 1),
+    (b"MAP2", 2),
+    (b"M3LO", 1),
+    (b"M3HI", 1),
+    (b"MAP5", 1),
+    (b"MAPE", 1),
+    (b"MAP7", 1),
+    (b"MAP8", 2),
+]
+# Most tiles are alike, so skew tile bytes towards a few values like real maps do
+TILE_BYTES = bytes(0 if b < 160 else b & 0x0F for b in range(256))
+LETTERS = bytes(ord("a") + b % 26 for b in range(256))
+FIELD_FORMATS = {1: "b", 2: "B", 3: "h", 4: "H", 5: "i", 6: "I", 7: "q", 8: "Q", 9: "H"}
+
+# Header fields are (type, name, fields of the struct if the type is 11)
+Header = list[tuple[int, str, Optional["Header"]]]
+
+PLYR_HEADER: Header = [
+    (4, "name_1", None),
+    (6, "name_2", None),
+    (0x1A, "name", None),
+    (4, "president_name_1", None),
+    (6, "president_name_2", None),
+    (0x1A, "president_name", None),
+    (6, "face", None),
+    (7, "money", None),
+    (7, "current_loan", None),
+    (0x16, "share_owners", None),
+    (2, "months_of_bankruptcy", None),
+    (
+        0x1B,
+        "old_economy",
+        [(7, "income", None), (7, "expenses", None), (0x16, "delivered_cargo", None)],
+    ),
+    (11, "settings", [(2, "engine_renew", None), (5, "engine_renew_money", None)]),
+]
+SCRIPT_HEADER: Header = [
+    (0x1A, "name", None),
+    (0x1A, "settings", None),
+    (5, "version", None),
+    (2, "is_random", None),
+]
+
+
+@dataclass
+class SavegameSpec:
+    map_size: int = 256
+    companies: int = 15
+    tables: int = 4
+    rows: int = 1000
+    nesting: int = 2
+    repeated: int = 4
+    scripts: int = 15
+    script_depth: int = 4
+    script_width: int = 4
+    compression: str = "OTTN"
+    seed: int = 0
+
+
+def encode_gamma(value: int) -> bytes:
+    if value < 0x80:
+        return bytes([value])
+    if value < 0x4000:
+        return struct.pack(">H", 0x8000 | value)
+    if value < 0x200000:
+        return struct.pack(">BH", 0xC0 | value >> 16, value & 0xFFFF)
+    if value < 0x10000000:
+        return struct.pack(">I", 0xE0000000 | value)
+    return b"\xf0" + struct.pack(">I", value)
+
+
+def encode_header(header: Header) -> bytes:
+    """Encode a table header, with the structs following in depth-first order"""
+    data = bytearray()
+    for field_type, name, _ in header:
+        data.append(field_type)
+        data += encode_gamma(len(name)) + name.encode("UTF-8")
+    data.append(0)
+    for _, _, struct_header in header:
+        if struct_header is not None:
+            data += encode_header(struct_header)
+    return bytes(data)
+
+
+def table_header(nesting: int) -> Header:
+    """Header of a generic table, with structs nested nesting levels deep"""
+    header: Header = [
+        (6, "index", None),
+        (4, "type", None),
+        (7, "value", None),
+        (0x1A, "name", None),
+        (0x16, "list", None),
+        (2, "flags", None),
+    ]
+    if nesting > 0:
+        header.append((11, "inner", table_header(nesting - 1)))
+        header.append((0x1B, "inner_list", table_header(nesting - 1)))
+    return header
+
+
+class RowGenerator:
+    def __init__(self, spec: SavegameSpec) -> None:
+        self.spec = spec
+        self.random = random.Random(spec.seed)
+
+    def row(self, header: Header, **values: bytes) -> bytes:
+        data = bytearray()
+        for field_type, name, struct_header in header:
+            base_type = field_type & 0xF
+            if base_type == 10:
+                # Strings always have a length field
+                value = values[name] if name in values else self.string()
+                data += encode_gamma(len(value)) + value
+                continue
+
+            count = 1
+            if field_type & 0x10:
+                count = self.spec.repeated
+                data += encode_gamma(count)
+            for _ in range(count):
+                if struct_header is not None:
+                    data += self.row(struct_header)
+                else:
+                    value_int = self.random.getrandbits(FIELD_WIDTHS[base_type] * 8 - 1)
+                    data += struct.pack(">" + FIELD_FORMATS[base_type], value_int)
+        return bytes(data)
+
+    def string(self) -> bytes:
+        return self.random.randbytes(self.random.randint(0, 24)).translate(LETTERS)
+
+    def script_data(self, depth: int) -> bytes:
+        """SQSL data, as saved by ScriptInstance::SaveObject"""
+        if depth == 0:
+            match self.random.randint(0, 3):
+                case 0:
+                    return b"\x00" + struct.pack(">q", self.random.getrandbits(63))
+                case 1:
+                    value = self.string()
+                    return b"\x01" + bytes([len(value)]) + value
+                case 2:
+                    return b"\x04" + bytes([self.random.randint(0, 1)])
+                case _:
+                    return b"\x05"
+        elements = [self.script_data(depth - 1) for _ in range(self.spec.script_width)]
+        if depth % 2 == 0:
+            return b"\x02" + b"".join(elements) + b"\xff"
+        keys = [self.script_data(0) for _ in elements]
+        return b"\x03" + b"".join(k + v for k, v in zip(keys, elements)) + b"\xff"
+
+
+class LzoCompressor:
+    """Compresses blocks the way OpenTTD writes OTTD savegames"""
+
+    def __init__(self) -> None:
+        try:
+            from lzallright import LZOCompressor  # type: ignore
+        except ImportError:
+            raise Exception(
+                "OTTD savegames need lzallright, install it with pip"
+            ) from None
+        self.compress_block: Callable[[bytes], bytes] = LZOCompressor().compress
+        self.pending = bytearray()
+
+    def compress(self, data: bytes) -> bytes:
+        self.pending += data
+        end = len(self.pending) - len(self.pending) % LZO_BUFFER_SIZE
+        blocks = b"".join(
+            self._block(self.pending[offset : offset + LZO_BUFFER_SIZE])
+            for offset in range(0, end, LZO_BUFFER_SIZE)
+        )
+        del self.pending[:end]
+        return blocks
+
+    def flush(self) -> bytes:
+        block = self._block(self.pending) if len(self.pending) != 0 else b""
+        self.pending.clear()
+        return block
+
+    def _block(self, data: bytearray) -> bytes:
+        compressed = self.compress_block(bytes(data))
+        size = struct.pack(">I", len(compressed))
+        # The checksum covers the size too
+        return struct.pack(">I", zlib.adler32(size + compressed, 0)) + size + compressed
+
+
+class SavegameWriter:
+    def __init__(self, f: BinaryIO, compression: str) -> None:
+        self.f = f
+        self.compressor: Optional[Any] = None
+        match compression:
+            case "OTTN":
+                pass
+            case "OTTX":
+                self.compressor = lzma.LZMACompressor(preset=LZMA_PRESET)
+            case "OTTZ":
+                self.compressor = zlib.compressobj(ZLIB_LEVEL)
+            case "OTTD":
+                self.compressor = LzoCompressor()
+            case _ as x:
+                raise Exception("Unsupported compression mode ", x)
+        self.size = 0
+        f.write(compression.encode() + struct.pack(">HH", SAVELOAD_VERSION, 0))
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.f.write(data)
+
+    def riff_chunk(self, name: bytes, size: int, pieces: Iterator[bytes]) -> None:
+        self.write(name + bytes([size >> 24 << 4]) + struct.pack(">I", size)[1:])
+        for piece in pieces:
+            self.write(piece)
+
+    def table_chunk(self, name: bytes, header: Header, rows: Iterator[bytes]) -> None:
+        self.write(name + b"\x03")
+        encoded_header = encode_header(header)
+        self.write(encode_gamma(len(encoded_header) + 1) + encoded_header)
+        for row in rows:
+            self.write(encode_gamma(len(row) + 1) + row)
+        self.write(encode_gamma(0))
+
+    def close(self) -> None:
+        self.write(b"\x00\x00\x00\x00")
+        if self.compressor is not None:
+            self.f.write(self.compressor.flush())
+
+
+def write_savegame(f: BinaryIO, spec: SavegameSpec) -> int:
+    """Write a savegame, returning its size when decompressed"""
+    rows = RowGenerator(spec)
+    writer = SavegameWriter(f, spec.compression)
+
+    for name, tile_size in MAP_CHUNKS:
+        tile_rows = [
+            rows.random.randbytes(spec.map_size * tile_size).translate(TILE_BYTES)
+            for _ in range(TILE_ROW_VARIANTS)
+        ]
+        writer.riff_chunk(
+            name,
+            spec.map_size * spec.map_size * tile_size,
+            (rows.random.choice(tile_rows) for _ in range(spec.map_size)),
+        )
+
+    writer.table_chunk(
+        b"PLYR",
+        PLYR_HEADER,
+        (
+            rows.row(PLYR_HEADER, name=b"Company %d" % (i + 1))
+            for i in range(spec.companies)
+        ),
+    )
+
+    header = table_header(spec.nesting)
+    for i in range(spec.tables):
+        writer.table_chunk(
+            b"T%03d" % i, header, (rows.row(header) for _ in range(spec.rows))
+        )
+
+    # One row for the deity, and one for each AI
+    for name, count in ((b"GSDT", 1), (b"AIPL", spec.scripts)):
+        writer.table_chunk(
+            name,
+            SCRIPT_HEADER,
+            (
+                rows.row(SCRIPT_HEADER) + b"\x01" + rows.script_data(spec.script_depth)
+                for _ in range(count)
+            ),
+        )
+
+    writer.close()
+    return writer.size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("output")
+    for spec_field in fields(SavegameSpec):
+        parser.add_argument(
+            "--" + spec_field.name.replace("_", "-"),
+            type=type(spec_field.default),
+            default=spec_field.default,
+        )
+    args = vars(parser.parse_args())
+    output = args.pop("output")
+
+    with open(output, "wb") as f:
+        size = write_savegame(f, SavegameSpec(**args))
+    print(f"wrote {output}, {size / (1 << 20):.1f} MiB uncompressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Decoding throughput of SaveloadBuffer on a savegame, in rows per second.
+
+The savegame is decompressed up front, and an uncompressed (OTTN) copy of it is
+decoded, so that the numbers only cover the chunk parser.
+
+With --tracemalloc, the Python allocations made while decoding are traced too. This
+is a lot slower, so the timings are not comparable to untraced runs.
+
+Usage: python benchmarks/saveload_decode.py [--repeat N] [--tracemalloc] save.sav
+"""
+
+import argparse
+import lzma
+import time
+import tracemalloc
+
+from openttd_protocol.wire.write import SEND_TCP_MTU
+
+from ottd_prayer.saveload import (
+    SAVELOAD_HEADER_SIZE,
+    ChSparseTable,
+    ChTable,
+    SaveloadBuffer,
+)
+
+MAP_DATA_SIZE = SEND_TCP_MTU - 3
+
+
+def load_uncompressed(filename: str) -> bytes:
+    with open(filename, "rb") as f:
+        raw = f.read()
+    header, data = raw[:SAVELOAD_HEADER_SIZE], raw[SAVELOAD_HEADER_SIZE:]
+    match header[:4]:
+        case b"OTTN":
+            pass
+        case b"OTTX":
+            data = lzma.decompress(data)
+        case _ as x:
+            raise Exception("Unsupported compression mode ", x)
+    return b"OTTN" + header[4:] + data
+
+
+def decode(savegame: bytes) -> int:
+    saveload = SaveloadBuffer()
+    view = memoryview(savegame)
+    for offset in range(0, len(view), MAP_DATA_SIZE):
+        saveload.append(view[offset : offset + MAP_DATA_SIZE])
+
+    rows = 0
+    for chunk in saveload.decode().values():
+        if isinstance(chunk, (ChTable, ChSparseTable)):
+            rows += len(chunk.elements)
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("savegame")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tracemalloc", action="store_true")
+    args = parser.parse_args()
+
+    savegame = load_uncompressed(args.savegame)
+    best = float("inf")
+    peak = 0
+    for _ in range(args.repeat):
+        if args.tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        rows = decode(savegame)
+        best = min(best, time.perf_counter() - start)
+        if args.tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    print(f"uncompressed: {len(savegame) / (1 << 20):10.1f} MiB")
+    print(f"rows:         {rows:10d}")
+    print(f"best time:    {best:10.3f} s")
+    print(f"throughput:   {len(savegame) / (1 << 20) / best:10.1f} MiB/s")
+    print(f"              {rows / best:10.0f} rows/s")
+    if args.tracemalloc:
+        print(f"traced peak:  {peak / (1 << 20):10.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Peak memory of downloading and decoding a savegame, the way PrayerBot does it.
+
+The savegame is read from disk one MAP_DATA packet at a time, so that the file
+itself does not count towards the peak. Unix only, since it relies on getrusage.
+
+Usage: python benchmarks/saveload_memory.py [--chunk PLYR ...] /path/to/save.sav
+"""
+
+import argparse
+import resource
+import sys
+import time
+
+from openttd_protocol.wire.write import SEND_TCP_MTU
+
+from ottd_prayer.saveload import SaveloadBuffer
+
+# MAP_DATA packets carry the packet size and type in front of the map data
+MAP_DATA_SIZE = SEND_TCP_MTU - 3
+
+
+def peak_rss_mib() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, macOS reports bytes
+    return peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("savegame")
+    parser.add_argument(
+        "--chunk",
+        action="append",
+        help="only decode these chunks, like PrayerBot does with PLYR",
+    )
+    args = parser.parse_args()
+
+    start_rss = peak_rss_mib()
+    start = time.perf_counter()
+    downloaded = 0
+
+    saveload = SaveloadBuffer(set(args.chunk) if args.chunk else None)
+    with open(args.savegame, "rb") as f:
+        while packet := f.read(MAP_DATA_SIZE):
+            downloaded += len(packet)
+            saveload.append(memoryview(packet))
+    saveload.decode()
+
+    print(f"map data:      {downloaded / (1 << 20):10.1f} MiB")
+    print(f"time:          {time.perf_counter() - start:10.2f} s")
+    print(f"peak RSS:      {peak_rss_mib():10.1f} MiB")
+    print(f"peak RSS gain: {peak_rss_mib() - start_rss:10.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Decoding benchmarks of SaveloadBuffer on synthetic savegames, compared to a baseline.
+
+For every scenario, a savegame is generated with savegen.py (and kept around for the
+next run), then downloaded and decoded the way PrayerBot does it, in a fresh process
+so that the peak memory of one scenario doesn't affect another. The best of several
+runs is reported as map data MiB/s and rows/s, along with the peak RSS gain.
+
+Results are compared to the baselines stored with --save-baseline, and any metric
+that got worse by more than the tolerance is reported as a regression. Baselines
+only make sense on the machine they were made on. Unix only, since peak memory
+relies on getrusage.
+
+Usage: python benchmarks/saveload_suite.py [--scenario NAME ...] [--save-baseline]
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+
+from savegen import SavegameSpec, write_savegame
+from saveload_memory import MAP_DATA_SIZE, peak_rss_mib
+
+from ottd_prayer.saveload import ChSparseTable, ChTable, SaveloadBuffer
+
+SCENARIOS = {
+    # Lots of small rows, mostly fixed-width fields
+    "tables": SavegameSpec(tables=8, rows=5000, nesting=0),
+    # Rows with structs in structs, repeated a lot
+    "nested": SavegameSpec(tables=2, rows=1000, nesting=3, repeated=6),
+    # Big GameScript and AI savegame data
+    "scripts": SavegameSpec(tables=0, script_depth=7, script_width=4),
+    # Compressed savegame of the biggest map OpenTTD allows
+    "map-4k": SavegameSpec(
+        map_size=4096, tables=8, rows=5000, nesting=1, compression="OTTX"
+    ),
+}
+# Metrics, whether a higher value is better, and the smallest baseline to compare
+# against, so that noise in tiny values doesn't show up as a regression
+METRICS = {
+    "mib_per_s": (True, 0.0),
+    "rows_per_s": (True, 0.0),
+    "peak_mib": (False, 8.0),
+}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+def savegame_for(scenario: str, spec: SavegameSpec, save_dir: str) -> str:
+    spec_hash = hashlib.sha1(repr(asdict(spec)).encode()).hexdigest()[:8]
+    filename = os.path.join(save_dir, f"{scenario}-{spec_hash}.sav")
+    if not os.path.exists(filename):
+        print(f"generating {filename}", file=sys.stderr)
+        os.makedirs(save_dir, exist_ok=True)
+        with open(filename + ".tmp", "wb") as f:
+            write_savegame(f, spec)
+        os.replace(filename + ".tmp", filename)
+    return filename
+
+
+def measure(filename: str, repeat: int) -> dict[str, float]:
+    """Runs in a fresh process for every scenario"""
+    start_rss = peak_rss_mib()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        saveload = SaveloadBuffer()
+        with open(filename, "rb") as f:
+            while packet := f.read(MAP_DATA_SIZE):
+                saveload.append(memoryview(packet))
+        chunks = saveload.decode()
+        best = min(best, time.perf_counter() - start)
+
+        rows = sum(
+            len(chunk.elements)
+            for chunk in chunks.values()
+            if isinstance(chunk, (ChTable, ChSparseTable))
+        )
+        del saveload, chunks
+
+    return {
+        "mib_per_s": os.path.getsize(filename) / (1 << 20) / best,
+        "rows_per_s": rows / best,
+        "peak_mib": peak_rss_mib() - start_rss,
+    }
+
+
+def relative_change(value: float, baseline: float) -> float:
+    return (value - baseline) / baseline if baseline else 0.0
+
+
+def is_regression(value: float, baseline: float, metric: str, tolerance: float) -> bool:
+    higher_is_better, minimum = METRICS[metric]
+    change = relative_change(value, max(baseline, minimum))
+    return (-change if higher_is_better else change) > tolerance
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS, help="default: all"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply rows by")
+    parser.add_argument(
+        "--save-dir",
+        default=os.path.join(tempfile.gettempdir(), "ottd-prayer-benchmarks"),
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    baselines: dict[str, dict[str, float]] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    print(f"{'scenario':10} {'MiB/s':>16} {'rows/s':>20} {'peak MiB':>16}")
+    results: dict[str, dict[str, float]] = {}
+    regressions = []
+    for scenario in args.scenario or SCENARIOS:
+        spec = SCENARIOS[scenario]
+        spec = replace(spec, rows=int(spec.rows * args.scale))
+        filename = savegame_for(scenario, spec, args.save_dir)
+        with ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            result = pool.submit(measure, filename, args.repeat).result()
+        results[scenario] = result
+
+        line = f"{scenario:10}"
+        for metric in METRICS:
+            cell = f"{result[metric]:.1f}"
+            if scenario in baselines:
+                baseline = baselines[scenario][metric]
+                cell += f" ({relative_change(result[metric], baseline):+.0%})"
+                if is_regression(result[metric], baseline, metric, args.tolerance):
+                    regressions.append(f"{scenario} {metric}")
+            line += f" {cell:>{20 if metric == 'rows_per_s' else 16}}"
+        print(line)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(baselines | results, f, indent=2)
+        print(f"baselines saved to {args.baseline}")
+    if regressions:
+        print("regressions:", ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Skipping speed of GameScript and AI savegame data (SQSL), checked and unchecked.
+
+A GSDT chunk is generated for every shape of script data: deeply nested arrays and
+tables, which used to hit the recursion limit, and wide ones with lots of elements.
+Each chunk is decoded once checking the script data is well-formed, and once jumping
+over it using the row size.
+
+Usage: python benchmarks/script_data.py [--size N] [--repeat N]
+"""
+
+import argparse
+import io
+import struct
+import time
+
+from savegen import SCRIPT_HEADER, RowGenerator, SavegameSpec, SavegameWriter
+
+from ottd_prayer.saveload import SaveloadBuffer
+
+
+def deep_arrays(size: int) -> bytes:
+    return b"\x02" * size + b"\x05" + b"\xff" * size
+
+
+def deep_tables(size: int) -> bytes:
+    # Every table has a single key whose value is the next table
+    return (b"\x03\x04\x01") * size + b"\x05" + b"\xff" * size
+
+
+def wide_array(size: int) -> bytes:
+    return b"\x02" + (b"\x00" + struct.pack(">q", 42)) * size + b"\xff"
+
+
+def wide_table(size: int) -> bytes:
+    pair = b"\x01\x03key" + b"\x01\x05value"
+    return b"\x03" + pair * size + b"\xff"
+
+
+SHAPES = {
+    "deep arrays": deep_arrays,
+    "deep tables": deep_tables,
+    "wide array": wide_array,
+    "wide table": wide_table,
+}
+
+
+def savegame_with_script_data(script_data: bytes) -> bytes:
+    f = io.BytesIO()
+    rows = RowGenerator(SavegameSpec())
+    writer = SavegameWriter(f, "OTTN")
+    writer.table_chunk(
+        b"GSDT", SCRIPT_HEADER, iter([rows.row(SCRIPT_HEADER) + b"\x01" + script_data])
+    )
+    writer.close()
+    return f.getvalue()
+
+
+def decode(savegame: bytes, skip_script_data: bool) -> float:
+    start = time.perf_counter()
+    saveload = SaveloadBuffer(skip_script_data=skip_script_data)
+    saveload.append(memoryview(savegame))
+    saveload.decode()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'shape':12} {'MiB':>6} {'checked MiB/s':>14} {'skipped MiB/s':>14}")
+    for shape, make_script_data in SHAPES.items():
+        script_data = make_script_data(args.size)
+        savegame = savegame_with_script_data(script_data)
+        mib = len(script_data) / (1 << 20)
+        checked = min(decode(savegame, False) for _ in range(args.repeat))
+        skipped = min(decode(savegame, True) for _ in range(args.repeat))
+        print(f"{shape:12} {mib:6.1f} {mib / checked:14.1f} {mib / skipped:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
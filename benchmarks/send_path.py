@@ -0,0 +1,141 @@
+"""
+Send syscalls and CPU time per packet of the bot's send path, against the old one.
+
+A bot connects to a local server that swallows everything, and sends packets the way
+PrayerBot does: one ACK per frame, and bursts of packets sent in the same event loop
+iteration, like MAP_OK followed by MOVE. The old send path, which encodes every
+packet from scratch and writes it to the transport right away, is measured the same
+way. Syscalls are counted on the socket itself.
+
+Usage: python benchmarks/send_path.py [--packets N]
+"""
+
+import argparse
+import asyncio
+import socket
+import time
+from typing import Any, Callable, Coroutine
+
+from openttd_protocol.wire.tcp import TCPProtocol
+from openttd_protocol.wire.write import (
+    SEND_TCP_MTU,
+    write_init,
+    write_presend,
+    write_string,
+    write_uint8,
+    write_uint32,
+)
+
+from ottd_prayer.game_protocol import GameProtocol, PacketGameType
+
+Sender = Callable[[GameProtocol, int], Coroutine[Any, Any, None]]
+
+
+class CountingSocket(socket.socket):
+    sends = 0
+
+    def send(self, data: Any, flags: int = 0) -> int:
+        self.sends += 1
+        return super().send(data, flags)
+
+    def sendmsg(self, buffers: Any, *args: Any) -> int:
+        self.sends += 1
+        return super().sendmsg(buffers, *args)
+
+
+async def old_ack(protocol: GameProtocol, frame: int) -> None:
+    data = write_init(PacketGameType.PACKET_CLIENT_ACK)
+    write_uint32(data, frame)
+    write_uint8(data, 7)
+    write_presend(data, SEND_TCP_MTU)
+    await TCPProtocol.send_packet(protocol, data)
+
+
+async def old_burst(protocol: GameProtocol, frame: int) -> None:
+    data = write_init(PacketGameType.PACKET_CLIENT_MAP_OK)
+    write_presend(data, SEND_TCP_MTU)
+    await TCPProtocol.send_packet(protocol, data)
+    data = write_init(PacketGameType.PACKET_CLIENT_MOVE)
+    write_uint8(data, frame & 0x0F)
+    write_string(data, "")
+    write_presend(data, SEND_TCP_MTU)
+    await TCPProtocol.send_packet(protocol, data)
+
+
+async def new_ack(protocol: GameProtocol, frame: int) -> None:
+    await protocol.send_PACKET_CLIENT_ACK(frame, 7)
+
+
+async def new_burst(protocol: GameProtocol, frame: int) -> None:
+    await protocol.send_PACKET_CLIENT_MAP_OK()
+    await protocol.send_PACKET_CLIENT_MOVE(frame & 0x0F, "")
+
+
+SCENARIOS: dict[str, tuple[Sender, Sender, int]] = {
+    # Packets sent in every event loop iteration
+    "ack": (old_ack, new_ack, 1),
+    "map_ok+move": (old_burst, new_burst, 2),
+}
+
+
+async def swallow(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    while await reader.read(1 << 16):
+        pass
+    writer.close()
+
+
+async def measure(
+    port: int, send: Sender, packets_per_send: int, packets: int
+) -> tuple[float, float]:
+    loop = asyncio.get_running_loop()
+    sock = CountingSocket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    await loop.sock_connect(sock, ("127.0.0.1", port))
+    transport, protocol = await loop.create_connection(
+        lambda: GameProtocol(object()), sock=sock
+    )
+
+    sends = packets // packets_per_send
+    start_cpu = time.process_time()
+    for frame in range(sends):
+        await send(protocol, frame)
+        # Let the event loop go around, like between two received packets
+        await asyncio.sleep(0)
+    cpu = time.process_time() - start_cpu
+
+    protocol.task.cancel()
+    transport.close()
+    # Let the server see the connection close
+    await asyncio.sleep(0.1)
+    return sock.sends / (sends * packets_per_send), cpu / packets * 1e6
+
+
+async def run(packets: int) -> None:
+    server = await asyncio.start_server(swallow, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    await measure(port, new_burst, 2, packets // 10)  # warm up
+
+    print(f"{'scenario':12} {'old syscalls':>13} {'new syscalls':>13}", end="")
+    print(f" {'old us':>8} {'new us':>8}   (per packet)")
+    for scenario, (old, new, packets_per_send) in SCENARIOS.items():
+        old_syscalls, old_us = await measure(port, old, packets_per_send, packets)
+        new_syscalls, new_us = await measure(port, new, packets_per_send, packets)
+        print(
+            f"{scenario:12} {old_syscalls:13.2f} {new_syscalls:13.2f}"
+            f" {old_us:8.2f} {new_us:8.2f}"
+        )
+
+    server.close()
+    await server.wait_closed()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--packets", type=int, default=100000)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.packets))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+Stand-in OpenTTD server, speaking enough of the server side of the game protocol for
+bots to join a company and stay there, without OpenTTD or a network.
+
+Clients go through GAME_INFO, JOIN, the game password if there is one, the NewGRF
+check and WELCOME, then download the map, which is a savegame file sent as it is.
+Once they have the map, the server tells them about every client, and sends a FRAME
+every tick to everyone, with a token every so often that clients have to ACK. Moves
+to companies are checked against the company passwords. Meanwhile, made-up human
+players join, move between companies and quit, when churn_interval is set.
+
+Unlike OpenTTD, the server keeps statistics of how fast clients join a company, and
+how far behind the current frame their ACKs are.
+
+Usage: python benchmarks/standin_server.py [SAVEGAME] [--port 3979] [--companies 15]
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import struct
+import time
+from dataclasses import dataclass, field
+from hashlib import md5
+from multiprocessing.connection import Connection
+from typing import Optional
+
+from openttd_protocol.wire.write import SEND_TCP_MTU
+
+from ottd_prayer.bot_structures import NetworkErrorCode
+from ottd_prayer.game_protocol import PacketGameType
+
+logger = logging.getLogger(__name__)
+COMPANY_SPECTATOR = 255
+SERVER_ID = "stand-in-server"
+# How many frames apart tokens are sent, like OpenTTD does once a day
+TOKEN_FRAMES = 74
+
+
+@dataclass
+class StandInOptions:
+    savegame: Optional[str] = None
+    companies: int = 15
+    network_revision: str = "14.1"
+    game_password: Optional[str] = None
+    company_passwords: dict[int, str] = field(default_factory=dict)
+    ticks_per_second: float = 1 / 0.03
+    # Human players in a company from the start
+    humans: int = 1
+    # Seconds between made-up human players joining, moving or quitting
+    churn_interval: Optional[float] = None
+    game_seed: int = 1234
+
+
+@dataclass
+class StandInStats:
+    # Seconds from connecting until first being moved to a company
+    join_latencies: list[float] = field(default_factory=list)
+    # Frames the current frame was ahead of the frame being ACKed
+    ack_lags: list[int] = field(default_factory=list)
+    connections: int = 0
+    errors: int = 0
+
+
+def packet(packet_type: PacketGameType, payload: bytes = b"") -> bytes:
+    return struct.pack("<HB", len(payload) + 3, packet_type) + payload
+
+
+def string(value: str) -> bytes:
+    return value.encode("UTF-8") + b"\0"
+
+
+def read_string(data: bytes) -> tuple[str, bytes]:
+    end = data.index(b"\0")
+    return data[:end].decode("UTF-8"), data[end + 1 :]
+
+
+# GenerateCompanyPasswordHash from src/network/network.cpp
+def company_password_hash(password: str, game_seed: int) -> str:
+    password_bytes = password.encode("UTF-8")
+    server_id = SERVER_ID.encode("UTF-8")
+    salted_password = bytes(
+        (
+            (password_bytes[i] if i < len(password_bytes) else 0)
+            ^ (server_id[i] if i < len(server_id) else 0)
+            ^ (game_seed >> (i % 32))
+        )
+        & 0xFF
+        for i in range(32)
+    )
+    return md5(salted_password).hexdigest().upper()
+
+
+class StandInServer:
+    """The game, shared by every connection"""
+
+    def __init__(self, options: StandInOptions) -> None:
+        self.options = options
+        self.map_data = b""
+        if options.savegame is not None:
+            with open(options.savegame, "rb") as f:
+                self.map_data = f.read()
+        self.frame = 0
+        self.token = 0
+        self.next_client_id = 1
+        # Company of every client, be it connected or made up
+        self.client_companies: dict[int, int] = {}
+        self.client_names: dict[int, str] = {}
+        self.playing: set["StandInClient"] = set()
+        self.humans: list[int] = []
+        self.stats = StandInStats()
+        for i in range(options.humans):
+            self.humans.append(
+                self.add_client("human %d" % (i + 1), i % options.companies)
+            )
+
+    def add_client(self, name: str, company: int) -> int:
+        client_id = self.next_client_id
+        self.next_client_id += 1
+        self.client_companies[client_id] = company
+        self.client_names[client_id] = name
+        return client_id
+
+    def client_info(self, client_id: int) -> bytes:
+        return packet(
+            PacketGameType.PACKET_SERVER_CLIENT_INFO,
+            struct.pack("<IB", client_id, self.client_companies[client_id])
+            + string(self.client_names[client_id]),
+        )
+
+    def broadcast(self, data: bytes) -> None:
+        for client in self.playing:
+            client.write(data)
+
+    def move(self, client_id: int, company: int) -> None:
+        self.client_companies[client_id] = company
+        self.broadcast(
+            packet(
+                PacketGameType.PACKET_SERVER_MOVE,
+                struct.pack("<IB", client_id, company),
+            )
+        )
+
+    def remove_client(self, client_id: int) -> None:
+        del self.client_companies[client_id]
+        del self.client_names[client_id]
+        self.broadcast(
+            packet(PacketGameType.PACKET_SERVER_QUIT, struct.pack("<I", client_id))
+        )
+
+    async def tick(self) -> None:
+        tick = 1 / self.options.ticks_per_second
+        next_tick = time.monotonic()
+        while True:
+            self.frame += 1
+            if self.frame % TOKEN_FRAMES == 0:
+                self.token = random.randrange(256)
+                frame = struct.pack("<IIB", self.frame, self.frame + 1, self.token)
+            else:
+                frame = struct.pack("<II", self.frame, self.frame + 1)
+            self.broadcast(packet(PacketGameType.PACKET_SERVER_FRAME, frame))
+            next_tick += tick
+            await asyncio.sleep(next_tick - time.monotonic())
+
+    async def churn(self, interval: float) -> None:
+        companies = list(range(self.options.companies)) + [COMPANY_SPECTATOR]
+        while True:
+            await asyncio.sleep(interval)
+            action = random.randrange(3) if len(self.humans) != 0 else 0
+            if action == 0:
+                client_id = self.add_client(
+                    "human %d" % self.next_client_id, random.choice(companies)
+                )
+                self.humans.append(client_id)
+                self.broadcast(self.client_info(client_id))
+            elif action == 1:
+                self.move(random.choice(self.humans), random.choice(companies))
+            else:
+                client_id = self.humans.pop(random.randrange(len(self.humans)))
+                self.remove_client(client_id)
+
+    def take_stats(self) -> StandInStats:
+        stats = self.stats
+        self.stats = StandInStats()
+        return stats
+
+
+class StandInClient(asyncio.Protocol):
+    def __init__(self, server: StandInServer) -> None:
+        self.server = server
+        self.data = b""
+        self.client_id: Optional[int] = None
+        self.connected_at = time.monotonic()
+        self.joined_company = False
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+        self.map_task: Optional[asyncio.Task[None]] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        assert isinstance(transport, asyncio.Transport)
+        self.transport = transport
+        self.server.stats.connections += 1
+
+    def pause_writing(self) -> None:
+        self.can_write.clear()
+
+    def resume_writing(self) -> None:
+        self.can_write.set()
+
+    def write(self, data: bytes) -> None:
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+    def error(self, error_code: NetworkErrorCode) -> None:
+        self.server.stats.errors += 1
+        self.write(packet(PacketGameType.PACKET_SERVER_ERROR, bytes([error_code])))
+        self.transport.close()
+
+    def data_received(self, data: bytes) -> None:
+        self.data += data
+        while len(self.data) >= 3:
+            (length,) = struct.unpack_from("<H", self.data)
+            if len(self.data) < length:
+                break
+            self.handle(self.data[2], self.data[3:length])
+            self.data = self.data[length:]
+
+    def handle(self, packet_type: int, payload: bytes) -> None:
+        server = self.server
+        match packet_type:
+            case PacketGameType.PACKET_CLIENT_GAME_INFO:
+                self.write(self.game_info())
+            case PacketGameType.PACKET_CLIENT_JOIN:
+                network_revision, payload = read_string(payload)
+                if network_revision != server.options.network_revision:
+                    self.error(NetworkErrorCode.NETWORK_ERROR_WRONG_REVISION)
+                elif server.options.game_password is not None:
+                    self.write(packet(PacketGameType.PACKET_SERVER_NEED_GAME_PASSWORD))
+                else:
+                    self.write(packet(PacketGameType.PACKET_SERVER_CHECK_NEWGRFS))
+            case PacketGameType.PACKET_CLIENT_GAME_PASSWORD:
+                password, _ = read_string(payload)
+                if password != server.options.game_password:
+                    self.error(NetworkErrorCode.NETWORK_ERROR_WRONG_PASSWORD)
+                else:
+                    self.write(packet(PacketGameType.PACKET_SERVER_CHECK_NEWGRFS))
+            case PacketGameType.PACKET_CLIENT_NEWGRFS_CHECKED:
+                self.client_id = server.add_client(
+                    "client %d" % server.next_client_id, COMPANY_SPECTATOR
+                )
+                welcome = struct.pack("<II", self.client_id, server.options.game_seed)
+                self.write(
+                    packet(
+                        PacketGameType.PACKET_SERVER_WELCOME,
+                        welcome + string(SERVER_ID),
+                    )
+                )
+            case PacketGameType.PACKET_CLIENT_GETMAP:
+                self.map_task = asyncio.create_task(self.send_map())
+            case PacketGameType.PACKET_CLIENT_MAP_OK:
+                assert self.client_id is not None
+                server.broadcast(server.client_info(self.client_id))
+                server.playing.add(self)
+                for client_id in server.client_companies:
+                    self.write(server.client_info(client_id))
+            case PacketGameType.PACKET_CLIENT_ACK:
+                frame, token = struct.unpack("<IB", payload)
+                # Clients ACK the frame they are allowed to run up to, one ahead
+                server.stats.ack_lags.append(server.frame + 1 - frame)
+            case PacketGameType.PACKET_CLIENT_MOVE:
+                assert self.client_id is not None
+                company = payload[0]
+                hashed_password, _ = read_string(payload[1:])
+                if company != COMPANY_SPECTATOR and (
+                    company >= server.options.companies
+                    or not self.is_company_password(company, hashed_password)
+                ):
+                    # OpenTTD doesn't say anything either
+                    return
+                if company != COMPANY_SPECTATOR and not self.joined_company:
+                    self.joined_company = True
+                    server.stats.join_latencies.append(
+                        time.monotonic() - self.connected_at
+                    )
+                server.move(self.client_id, company)
+
+    def is_company_password(self, company: int, hashed_password: str) -> bool:
+        password = self.server.options.company_passwords.get(company)
+        if password is None:
+            return True
+        return hashed_password == company_password_hash(
+            password, self.server.options.game_seed
+        )
+
+    def game_info(self) -> bytes:
+        options = self.server.options
+        info = bytes([7]) + struct.pack("<Q", self.server.frame)
+        # NewGRFs by ID and MD5 sum, no game script, no NewGRFs
+        info += b"\x00" + struct.pack("<i", -1) + string("") + b"\x00"
+        info += struct.pack("<II", 0, 0)
+        info += bytes([options.companies, options.companies, 10])
+        info += string("Stand-in server") + string(options.network_revision)
+        info += bytes([options.game_password is not None, 255, 0, 0])
+        info += struct.pack("<HH", 256, 256) + bytes([0, 1])
+        return packet(PacketGameType.PACKET_SERVER_GAME_INFO, info)
+
+    async def send_map(self) -> None:
+        map_data = self.server.map_data
+        self.write(
+            packet(
+                PacketGameType.PACKET_SERVER_MAP_BEGIN,
+                struct.pack("<I", self.server.frame),
+            )
+            + packet(
+                PacketGameType.PACKET_SERVER_MAP_SIZE, struct.pack("<I", len(map_data))
+            )
+        )
+        chunk_size = SEND_TCP_MTU - 3
+        for offset in range(0, len(map_data), chunk_size):
+            # Don't pile the whole map up in the transport for every client
+            await self.can_write.wait()
+            self.write(
+                packet(
+                    PacketGameType.PACKET_SERVER_MAP_DATA,
+                    map_data[offset : offset + chunk_size],
+                )
+            )
+        self.write(packet(PacketGameType.PACKET_SERVER_MAP_DONE))
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self.map_task is not None:
+            self.map_task.cancel()
+        self.server.playing.discard(self)
+        if self.client_id is not None:
+            self.server.remove_client(self.client_id)
+
+
+async def run_server(
+    options: StandInOptions, port: int, control: Optional[Connection] = None
+) -> None:
+    """
+    Serve until cancelled. With a control connection, whatever is received on it is
+    answered with the statistics since the last time, until None is received.
+    """
+    loop = asyncio.get_running_loop()
+    server = StandInServer(options)
+    listener = await loop.create_server(
+        lambda: StandInClient(server), "127.0.0.1", port
+    )
+    tasks = [asyncio.create_task(server.tick())]
+    if options.churn_interval is not None:
+        tasks.append(asyncio.create_task(server.churn(options.churn_interval)))
+
+    try:
+        if control is None:
+            await listener.serve_forever()
+        else:
+            while await loop.run_in_executor(None, control.recv) is not None:
+                control.send(server.take_stats())
+    finally:
+        for task in tasks:
+            task.cancel()
+        listener.close()
+
+
+def serve(
+    options: StandInOptions, port: int, control: Optional[Connection] = None
+) -> None:
+    """Entry point of a server process"""
+    asyncio.run(run_server(options, port, control))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "savegame", nargs="?", help="map to send, leave out to send an empty one"
+    )
+    parser.add_argument("--port", type=int, default=3979)
+    parser.add_argument("--companies", type=int, default=15)
+    parser.add_argument("--network-revision", default="14.1")
+    parser.add_argument("--game-password")
+    parser.add_argument(
+        "--company-password",
+        action="append",
+        default=[],
+        metavar="COMPANY_ID=PASSWORD",
+        help="password of a company, counting companies from 1",
+    )
+    parser.add_argument("--ticks-per-second", type=float, default=1 / 0.03)
+    parser.add_argument("--humans", type=int, default=1)
+    parser.add_argument("--churn-interval", type=float)
+    args = parser.parse_args()
+
+    company_passwords: dict[int, str] = {}
+    for company_password in args.company_password:
+        company_id, password = company_password.split("=", 1)
+        company_passwords[int(company_id) - 1] = password
+    options = StandInOptions(
+        savegame=args.savegame,
+        companies=args.companies,
+        network_revision=args.network_revision,
+        game_password=args.game_password,
+        company_passwords=company_passwords,
+        ticks_per_second=args.ticks_per_second,
+        humans=args.humans,
+        churn_interval=args.churn_interval,
+    )
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Serving on port %d", args.port)
+    serve(options, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import struct
+import time
+from collections import Counter
+from typing import Any, ClassVar, Optional, Union
+
+from openttd_protocol.wire.exceptions import SocketClosed
+from openttd_protocol.wire.tcp import TCPProtocol
+from openttd_protocol.wire.write import SEND_TCP_MTU, write_init, write_presend
+
+from . import metrics
+from .recording import Recorder
+
+logger = logging.getLogger(__name__)
+
+
+class PacketTemplate:
+    """
+    A packet with a fixed layout, encoded once. Sending it only patches in the values
+    of its fields, which are given in struct format.
+    """
+
+    __slots__ = ("data", "fields")
+
+    def __init__(self, packet_type: int, fields: str = "") -> None:
+        self.fields = struct.Struct("<" + fields)
+        data = write_init(packet_type)
+        data += bytes(self.fields.size)
+        self.data = write_presend(data, SEND_TCP_MTU)
+
+    def fill(self, *values: Any) -> Union[bytes, bytearray]:
+        if not values:
+            return self.data
+        data = bytearray(self.data)
+        self.fields.pack_into(data, 3, *values)
+        return data
+
+
+class BotProtocol(TCPProtocol):
+    """
+    TCPProtocol that drops the packets listed in IGNORED_PACKETS as soon as they are
+    framed, without parsing them or passing them to the bot. They are only counted,
+    in ignored_packets.
+
+    Packets sent in the same event loop iteration are written to the transport all at
+    once, at the end of the iteration. packets_sent and writes count how well that
+    works out.
+
+    Given a record_file, every packet received is also written to it, see Recorder.
+    """
+
+    IGNORED_PACKETS: ClassVar[frozenset[int]] = frozenset()
+
+    def __init__(self, callback_class: Any, record_file: Optional[str] = None) -> None:
+        super().__init__(callback_class)
+        self.record_file = record_file
+        self.recorder: Optional[Recorder] = None
+        self.ignored_packets: Counter[int] = Counter()
+        self.send_queue: list[Union[bytes, bytearray]] = []
+        self.packets_sent = 0
+        self.writes = 0
+
+    def connection_made(self, transport: Any) -> None:
+        if self.record_file is not None:
+            try:
+                self.recorder = Recorder(self.record_file)
+            except OSError as e:
+                logger.warning("Cannot record to %s: %s", self.record_file, e)
+        super().connection_made(transport)
+
+    def receive_data(self, queue: asyncio.Queue[memoryview], data: memoryview) -> bytes:
+        # Same framing as TCPProtocol.receive_data
+        ignored_packets = self.IGNORED_PACKETS
+        recording = metrics.enabled
+        recorder = self.recorder
+        if recorder is not None:
+            now = time.monotonic()
+        while len(data) > 2:
+            length = data[0] | data[1] << 8
+            if length < 2:
+                # Let TCPProtocol drop the connection
+                return super().receive_data(  # type: ignore[no-untyped-call,no-any-return]
+                    queue, data
+                )
+            if len(data) < length:
+                break
+
+            if recording:
+                self._record(metrics.packets_received, metrics.bytes_received, data)
+            if recorder is not None:
+                recorder.record(data[0:length], now)
+            if length > 2 and data[2] in ignored_packets:
+                self.ignored_packets[data[2]] += 1
+            else:
+                queue.put_nowait(data[0:length])
+            data = data[length:]
+
+        return data.tobytes()
+
+    async def send_packet(self, data: Union[bytes, bytearray]) -> int:
+        # Same checks as TCPProtocol.send_packet
+        await self._can_write.wait()  # type: ignore[attr-defined]
+        if self.transport.is_closing():
+            raise SocketClosed
+
+        if metrics.enabled:
+            self._record(metrics.packets_sent, metrics.bytes_sent, data)
+        if len(self.send_queue) == 0:
+            asyncio.get_running_loop().call_soon(self._flush_send_queue)
+        self.send_queue.append(data)
+        return len(data)
+
+    def _flush_send_queue(self) -> None:
+        send_queue = self.send_queue
+        self.send_queue = []
+        if self.transport.is_closing():
+            # The next send_packet will find out
+            return
+        self.transport.writelines(send_queue)
+        self.packets_sent += len(send_queue)
+        self.writes += 1
+
+    def _record(
+        self,
+        packets: metrics.Counter,
+        bytes: metrics.Counter,
+        data: Union[bytes, bytearray, memoryview],
+    ) -> None:
+        length = data[0] | data[1] << 8
+        labels = (metrics.current_bot.get(), self._packet_name(data[2]))
+        packets.inc(labels)
+        bytes.inc(labels, length)
+
+    def _packet_name(self, packet_type: int) -> str:
+        try:
+            return str(self.PacketType(packet_type).name)
+        except ValueError:
+            return str(packet_type)
+
+    def connection_lost(self, exc: Any) -> None:
+        if self.ignored_packets:
+            logger.debug(
+                "Ignored packets: %s",
+                ", ".join(
+                    "%s: %d" % (self.PacketType(packet_type).name, count)
+                    for packet_type, count in self.ignored_packets.items()
+                ),
+            )
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        super().connection_lost(exc)
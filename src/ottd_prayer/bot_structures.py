@@ -2,8 +2,6 @@ from dataclasses import dataclass
 from enum import IntEnum, auto
 from typing import Optional
 
-from dataclass_wizard import JSONSerializable
-
 ClientId = int
 CompanyId = int
 
@@ -33,33 +31,35 @@ class NetworkErrorCode(IntEnum):
     NETWORK_ERROR_END = auto()
 
 
-@dataclass
-class ServerError(JSONSerializable):
+# Messages the protocols pass to the bots as they are, without converting them to
+# dicts and back, since some arrive several times a second
+@dataclass(slots=True)
+class ServerError:
     error_code: int
     error_str: str
 
 
-@dataclass
-class ServerProperties(JSONSerializable):
+@dataclass(slots=True)
+class ServerProperties:
     client_id: ClientId
     game_seed: int
     server_id: str
 
 
-@dataclass
-class PlayerMovement(JSONSerializable):
+@dataclass(slots=True)
+class PlayerMovement:
     client_id: ClientId
     company_id: CompanyId
 
 
-@dataclass
-class ServerFrame(JSONSerializable):
+@dataclass(slots=True)
+class ServerFrame:
     frame_counter_server: int
     frame_counter_max: int
     token: Optional[int]
 
 
-@dataclass
-class RemoteServer(JSONSerializable):
+@dataclass(slots=True)
+class RemoteServer:
     host: str
     port: int
@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCache:
+    """
+    Key-value store kept in a JSON file, so that what the bot learns about a server
+    survives reconnects and restarts. The file is re-read on every access, as several
+    bots may share it. Without a filename, entries only live as long as the object.
+    """
+
+    def __init__(self, filename: Optional[str]) -> None:
+        self.filename = filename
+        self.entries: dict[str, Any] = {}
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[Any]:
+        self._load()
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if max_age is not None and time.time() - entry["time"] > max_age:
+            logger.debug("Cache entry %s expired", key)
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        self._load()
+        self.entries[key] = {"value": value, "time": time.time()}
+        self._save()
+
+    def invalidate(self, key: str) -> None:
+        self._load()
+        if self.entries.pop(key, None) is not None:
+            self._save()
+
+    def _load(self) -> None:
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename, encoding="UTF-8") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable cache %s: %s", self.filename, e)
+            self.entries = {}
+
+    def _save(self) -> None:
+        if self.filename is None:
+            return
+        try:
+            directory = os.path.dirname(self.filename) or "."
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file first, so that readers never see half a file
+            fd, temp_filename = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="UTF-8") as f:
+                json.dump(self.entries, f)
+            os.replace(temp_filename, self.filename)
+        except OSError as e:
+            logger.warning("Cannot write cache %s: %s", self.filename, e)
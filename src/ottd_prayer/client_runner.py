@@ -1,4 +1,4 @@
-from asyncio import AbstractEventLoop, CancelledError
+from asyncio import AbstractEventLoop, wait
 from typing import Any, Callable, Coroutine, TypeVar
 
 from openttd_protocol.wire.tcp import TCPProtocol
@@ -23,9 +23,11 @@ async def run_client(
 
     await app_initializer(app, protocol)
     try:
-        await protocol.task
-    except CancelledError:
-        pass
+        # Awaiting the task itself would mistake the bot getting cancelled for the
+        # connection being closed, and carry on
+        await wait([protocol.task])
+        if not protocol.task.cancelled():
+            protocol.task.result()
     finally:
         transport.close()
 
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import dataclasses
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+try:
+    import numpy as np
+    import numpy.typing as npt
+except ImportError as e:
+    raise ImportError(
+        "Decoding table chunks into columns needs NumPy, install ottd_prayer[numpy]"
+    ) from e
+
+from .saveload import FIELD_WIDTHS, ChTableReader, Cursor, Parser, _trace, parse_gamma
+
+# NumPy types of the fixed-width field types, big-endian like in the savegame
+FIELD_DTYPES: dict[int, str] = {
+    1: "i1",
+    2: "u1",
+    3: ">i2",
+    4: ">u2",
+    5: ">i4",
+    6: ">u4",
+    7: ">i8",
+    8: ">u8",
+    9: ">u2",
+}
+# Walks over a (sub)struct of a row, noting down where the values of its fields are
+StructWalker = Callable[[Cursor], None]
+
+
+@dataclass
+class ChColumns:
+    """
+    A table chunk decoded into one NumPy array per field, rather than a dict per row.
+    Fields of structs are named by their path, like "cur_economy.income".
+
+    index holds the position of every row in a table, or its index in a sparse table.
+    Rows without any data are left out.
+
+    Fields that have a length (strings, repeated fields and repeated structs) also
+    have an array in offsets, so that the values of row i are
+    values[offsets[i]:offsets[i + 1]]. Repeated structs have offsets only, which index
+    into the arrays of their fields.
+    """
+
+    index: npt.NDArray[np.int64]
+    columns: dict[str, npt.NDArray[Any]]
+    offsets: dict[str, npt.NDArray[np.int64]]
+    structs: dict[ChTableReader.StructKey, ChTableReader.Header] = dataclasses.field(
+        default_factory=dict, repr=False
+    )
+
+    @staticmethod
+    def parse(sparse: bool, special: bool) -> Parser[ChColumns]:
+        reader = ChTableReader()
+        yield from reader.parse_header()
+
+        # Copy the rows into one buffer, without their sizes and indices in between
+        body = bytearray()
+        row_starts: list[int] = []
+        index: list[int] = []
+        row_number = 0
+        while True:
+            row_size = yield from parse_gamma()
+            if row_size == 0:
+                break
+            row = yield row_size - 1
+            if sparse:
+                cursor = Cursor(row)
+                idx = cursor.read_gamma()
+                row = row[cursor.pos :]
+            else:
+                idx = row_number
+                row_number += 1
+            if len(row) != 0:
+                index.append(idx)
+                row_starts.append(len(body))
+                body += row
+
+        _trace("Decoding %d rows into columns", len(index))
+        return _ColumnBuilder(reader, special).build(body, row_starts, index)
+
+
+class _Field:
+    """Where the values of a field are in the table body"""
+
+    __slots__ = ("dtype", "positions", "offset", "counts")
+
+    def __init__(
+        self,
+        dtype: str,
+        positions: list[int],
+        offset: int = 0,
+        counts: Optional[list[int]] = None,
+    ) -> None:
+        self.dtype = dtype
+        self.positions = positions
+        self.offset = offset
+        self.counts = counts
+
+
+class _ColumnBuilder:
+    def __init__(self, reader: ChTableReader, special: bool) -> None:
+        self.reader = reader
+        self.special = special
+        self.fields: dict[str, _Field] = {}
+        self.struct_counts: dict[str, list[int]] = {}
+
+    def build(
+        self, body: bytearray, row_starts: list[int], index: list[int]
+    ) -> ChColumns:
+        index_array = np.array(index, dtype=np.int64)
+        header = self.reader.structs[ChTableReader.root_struct_key]
+        row_dtype = self._fixed_row_dtype(header)
+        if (
+            row_dtype is not None
+            and row_dtype.itemsize != 0
+            and len(body) == len(row_starts) * row_dtype.itemsize
+        ):
+            # Every row is the same handful of numbers, so view the body as records
+            rows = np.frombuffer(body, dtype=row_dtype)
+            return ChColumns(
+                index=index_array,
+                columns={key: rows[key] for _, key in header},
+                offsets={},
+                structs=self.reader.structs,
+            )
+
+        walk_row = self._compile_struct(ChTableReader.root_struct_key, "")
+        cursor = Cursor(memoryview(body))
+        for row_start, row_end in zip(row_starts, row_starts[1:] + [len(body)]):
+            cursor.pos = row_start
+            walk_row(cursor)
+            # Script data of special chunks follows the row, and is left alone
+            if cursor.pos > row_end or (cursor.pos != row_end and not self.special):
+                raise Exception(
+                    "Table row size mismatch: expected row to end at ",
+                    row_end,
+                    ", got ",
+                    cursor.pos,
+                )
+
+        data = np.frombuffer(body, dtype=np.uint8)
+        columns: dict[str, npt.NDArray[Any]] = {}
+        offsets: dict[str, npt.NDArray[np.int64]] = {}
+        for name, field in self.fields.items():
+            columns[name], field_offsets = _gather(data, field)
+            if field_offsets is not None:
+                offsets[name] = field_offsets
+        for name, counts in self.struct_counts.items():
+            offsets[name] = _counts_to_offsets(np.array(counts, dtype=np.int64))
+        return ChColumns(
+            index=index_array,
+            columns=columns,
+            offsets=offsets,
+            structs=self.reader.structs,
+        )
+
+    @staticmethod
+    def _fixed_row_dtype(header: ChTableReader.Header) -> Optional[np.dtype[Any]]:
+        if any(t & 0x10 or t & 0xF not in FIELD_DTYPES for t, _ in header):
+            return None
+        return np.dtype([(key, FIELD_DTYPES[t & 0xF]) for t, key in header])
+
+    def _compile_struct(
+        self, struct_key: ChTableReader.StructKey, prefix: str
+    ) -> StructWalker:
+        """
+        Turn a header struct into a walker over its rows. Like when decoding rows into
+        dicts, runs of fixed-width fields are stepped over in one go, noting down only
+        where the run starts.
+        """
+        walkers: list[StructWalker] = []
+        run_positions: list[int] = []
+        run_width = 0
+
+        def end_run() -> None:
+            nonlocal run_positions, run_width
+            if run_width != 0:
+                walkers.append(_walk_run(run_positions, run_width))
+            run_positions = []
+            run_width = 0
+
+        for field_type, key in self.reader.structs[struct_key]:
+            name = prefix + key
+            width = FIELD_WIDTHS.get(field_type & 0xF)
+            has_length = field_type & 0x10 != 0
+            if width is not None and not has_length:
+                self.fields[name] = _Field(
+                    FIELD_DTYPES[field_type & 0xF], run_positions, run_width
+                )
+                run_width += width
+                continue
+
+            end_run()
+            match field_type & 0xF:
+                case _ if width is not None:
+                    field = _Field(FIELD_DTYPES[field_type & 0xF], [], counts=[])
+                    walkers.append(_walk_repeated(field, width))
+                case 10:
+                    field = _Field("u1", [], counts=[])
+                    walkers.append(_walk_bytes(field, has_length))
+                case 11:
+                    walk_child = self._compile_struct(struct_key + (key,), name + ".")
+                    if has_length:
+                        self.struct_counts[name] = []
+                        walkers.append(
+                            _walk_repeated_struct(walk_child, self.struct_counts[name])
+                        )
+                    else:
+                        walkers.append(walk_child)
+                    continue
+                case _ as x:
+                    raise Exception("Unhandled field type ", x)
+            self.fields[name] = field
+        end_run()
+
+        def walk_struct(cursor: Cursor) -> None:
+            for walker in walkers:
+                walker(cursor)
+
+        return walk_struct
+
+
+def _walk_run(positions: list[int], width: int) -> StructWalker:
+    def walk_run(cursor: Cursor) -> None:
+        positions.append(cursor.pos)
+        cursor.skip(width)
+
+    return walk_run
+
+
+def _walk_repeated(field: _Field, width: int) -> StructWalker:
+    assert field.counts is not None
+    positions, counts = field.positions, field.counts
+
+    def walk_repeated(cursor: Cursor) -> None:
+        count = cursor.read_gamma()
+        positions.append(cursor.pos)
+        counts.append(count)
+        cursor.skip(count * width)
+
+    return walk_repeated
+
+
+def _walk_bytes(field: _Field, has_length: bool) -> StructWalker:
+    assert field.counts is not None
+    positions, counts = field.positions, field.counts
+
+    def walk_bytes(cursor: Cursor) -> None:
+        count = cursor.read_gamma() if has_length else 1
+        positions.append(cursor.pos)
+        counts.append(count)
+        cursor.skip(count)
+
+    return walk_bytes
+
+
+def _walk_repeated_struct(walk_struct: StructWalker, counts: list[int]) -> StructWalker:
+    def walk_repeated_struct(cursor: Cursor) -> None:
+        count = cursor.read_gamma()
+        counts.append(count)
+        for _ in range(count):
+            walk_struct(cursor)
+
+    return walk_repeated_struct
+
+
+def _counts_to_offsets(counts: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _gather(
+    data: npt.NDArray[np.uint8], field: _Field
+) -> tuple[npt.NDArray[Any], Optional[npt.NDArray[np.int64]]]:
+    """Copy the values of a field out of the table body, all at once"""
+    dtype = np.dtype(field.dtype)
+    starts = np.array(field.positions, dtype=np.int64) + field.offset
+    offsets = None
+    if field.counts is not None:
+        counts = np.array(field.counts, dtype=np.int64)
+        offsets = _counts_to_offsets(counts)
+        # Every value of a row follows the previous one
+        starts = np.repeat(starts, counts) + dtype.itemsize * (
+            np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1], counts)
+        )
+    values = data[starts[:, np.newaxis] + np.arange(dtype.itemsize)]
+    return values.reshape(-1).view(dtype), offsets
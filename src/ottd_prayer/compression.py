@@ -0,0 +1,180 @@
+import lzma
+import struct
+import zlib
+from typing import Iterator, Protocol
+
+# Map data is very compressible, so bound how much a single packet can decompress to
+DECOMPRESS_PIECE_SIZE = 1 << 20
+# OpenTTD compresses LZO savegames in blocks of at most this many bytes
+LZO_BUFFER_SIZE = 8192
+LZO_BLOCK_HEADER = struct.Struct(">II")
+LZO_M2_MAX_OFFSET = 0x0800
+
+
+class StreamDecompressor(Protocol):
+    """Decompresses a savegame that is fed to it a packet at a time"""
+
+    def decompress(self, data: memoryview) -> Iterator[bytes]:
+        """Decompress a packet, yielding the decompressed data in bounded pieces"""
+        ...
+
+
+class NoDecompressor:
+    def decompress(self, data: memoryview) -> Iterator[bytes]:
+        yield data.tobytes()
+
+
+class LzmaDecompressor:
+    def __init__(self) -> None:
+        self.decompressor = lzma.LZMADecompressor()
+
+    def decompress(self, data: memoryview) -> Iterator[bytes]:
+        yield self.decompressor.decompress(data, DECOMPRESS_PIECE_SIZE)
+        while not self.decompressor.needs_input and not self.decompressor.eof:
+            yield self.decompressor.decompress(b"", DECOMPRESS_PIECE_SIZE)
+
+
+class ZlibDecompressor:
+    def __init__(self) -> None:
+        self.decompressor = zlib.decompressobj()
+
+    def decompress(self, data: memoryview) -> Iterator[bytes]:
+        yield self.decompressor.decompress(data, DECOMPRESS_PIECE_SIZE)
+        while self.decompressor.unconsumed_tail:
+            yield self.decompressor.decompress(
+                self.decompressor.unconsumed_tail, DECOMPRESS_PIECE_SIZE
+            )
+
+
+class LzoDecompressor:
+    """
+    Savegames compressed with LZO are a series of blocks, each of which is prefixed by
+    an Adler-32 checksum and the compressed size of the block.
+    """
+
+    def __init__(self) -> None:
+        self.pending = bytearray()
+
+    def decompress(self, data: memoryview) -> Iterator[bytes]:
+        self.pending += data
+        offset = 0
+        while len(self.pending) - offset >= LZO_BLOCK_HEADER.size:
+            checksum, size = LZO_BLOCK_HEADER.unpack_from(self.pending, offset)
+            if size > LZO_BUFFER_SIZE + LZO_BUFFER_SIZE // 16 + 64 + 3:
+                raise Exception("Inconsistent LZO block size ", size)
+            end = offset + LZO_BLOCK_HEADER.size + size
+            if len(self.pending) < end:
+                break
+
+            # The checksum covers the size field too
+            block = bytes(self.pending[offset + 4 : end])
+            if zlib.adler32(block, 0) != checksum:
+                raise Exception("Bad LZO block checksum")
+            yield lzo1x_decompress(memoryview(block)[4:])
+            offset = end
+        del self.pending[:offset]
+
+
+def create_decompressor(compression: bytes) -> StreamDecompressor:
+    match compression:
+        case b"OTTN":
+            return NoDecompressor()
+        case b"OTTX":
+            return LzmaDecompressor()
+        case b"OTTZ":
+            return ZlibDecompressor()
+        case b"OTTD":
+            return LzoDecompressor()
+        case _:
+            raise Exception("Unsupported compression mode ", compression)
+
+
+def lzo1x_decompress(src: memoryview) -> bytes:
+    """Pure Python port of lzo1x_decompress_safe"""
+    out = bytearray()
+    ip = 0
+    state = 0
+
+    def read_length(t: int, bits: int) -> int:
+        nonlocal ip
+        # A zero length means the length continues in the following bytes
+        if t != 0:
+            return t
+        zeros_start = ip
+        while src[ip] == 0:
+            ip += 1
+        t = (ip - zeros_start) * 255 + bits + src[ip]
+        ip += 1
+        return t
+
+    def copy_match(distance: int, length: int) -> None:
+        start = len(out) - distance
+        if start < 0:
+            raise Exception("LZO lookbehind overrun")
+        if distance >= length:
+            out.extend(out[start : start + length])
+        else:
+            pattern = out[start:]
+            out.extend((pattern * (length // distance + 1))[:length])
+
+    try:
+        if src[0] > 17:
+            t = src[0] - 17
+            ip = 1
+            out += src[ip : ip + t]
+            ip += t
+            state = t if t < 4 else 4
+
+        while True:
+            t = src[ip]
+            ip += 1
+            if t < 16:
+                if state == 0:
+                    # Literal run
+                    t = read_length(t, 15) + 3
+                    out += src[ip : ip + t]
+                    ip += t
+                    state = 4
+                    continue
+                if state != 4:
+                    # Two byte match close by
+                    next = t & 3
+                    copy_match(1 + (t >> 2) + (src[ip] << 2), 2)
+                    ip += 1
+                else:
+                    # Three byte match further away
+                    next = t & 3
+                    copy_match(1 + LZO_M2_MAX_OFFSET + (t >> 2) + (src[ip] << 2), 3)
+                    ip += 1
+            elif t >= 64:
+                next = t & 3
+                copy_match(1 + ((t >> 2) & 7) + (src[ip] << 3), (t >> 5) + 1)
+                ip += 1
+            elif t >= 32:
+                length = read_length(t & 31, 31) + 2
+                next = src[ip] | src[ip + 1] << 8
+                ip += 2
+                copy_match(1 + (next >> 2), length)
+                next &= 3
+            else:
+                length = read_length(t & 7, 7) + 2
+                next = src[ip] | src[ip + 1] << 8
+                ip += 2
+                distance = ((t & 8) << 11) + (next >> 2)
+                if distance == 0:
+                    break  # End of stream marker
+                copy_match(distance + 0x4000, length)
+                next &= 3
+
+            # Up to 3 literals can follow a match
+            out += src[ip : ip + next]
+            ip += next
+            state = next
+    except IndexError:
+        raise Exception("LZO input overrun") from None
+
+    if ip != len(src):
+        raise Exception("LZO input not fully consumed")
+    if len(out) > LZO_BUFFER_SIZE:
+        raise Exception("LZO output overrun")
+    return bytes(out)
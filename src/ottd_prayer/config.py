@@ -1,8 +1,11 @@
-from dataclasses import dataclass, field
+import os
+import sys
+from dataclasses import dataclass, field, replace
 from enum import Enum
 from typing import Optional, Union, cast
 
-from dataclass_wizard import YAMLWizard
+import yaml
+from dataclass_wizard import YAMLWizard, fromdict
 
 
 @dataclass
@@ -41,6 +44,20 @@ class AutoReconnectCondition(Enum):
     WRONG_REVISION = "WRONG_REVISION"
 
 
+class EventLoop(Enum):
+    AUTO = "AUTO"
+    UVLOOP = "UVLOOP"
+    ASYNCIO = "ASYNCIO"
+
+
+def _default_cache_dir() -> str:
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "ottd-prayer")
+
+
 @dataclass
 class Bot:
     spectate_if_alone: bool = True
@@ -50,12 +67,43 @@ class Bot:
     reconnect_count: int = 3
     log_level: Union[str, int] = "INFO"
     saveload_dump_file: Optional[str] = None
+    cache_dir: Optional[str] = field(default_factory=_default_cache_dir)
+    decode_workers: int = 0
+    map_spill_threshold_mib: Optional[int] = 64
+    event_loop: EventLoop = EventLoop.AUTO
+    invite_code_cache_ttl: int = 3600
+    metrics_port: Optional[int] = None
+    metrics_host: str = "127.0.0.1"
+    profile_file: Optional[str] = None
+    profile_sample_rate: float = 0.01
+    profile_interval: int = 60
+    record_dir: Optional[str] = None
 
     def __post_init__(self) -> None:
         if self.auto_reconnect_wait <= 0:
             raise ValueError("auto_reconnect_wait must be greater than 0")
         if self.reconnect_count <= 0:
             raise ValueError("reconnect_count must be greater than 0")
+        if self.invite_code_cache_ttl < 0:
+            raise ValueError("invite_code_cache_ttl may not be negative")
+        if self.metrics_port is not None and not 0 < self.metrics_port < 65536:
+            raise ValueError("metrics_port, if set, must be between 1 and 65535")
+        if not 0 < self.profile_sample_rate <= 1:
+            raise ValueError("profile_sample_rate must be greater than 0 and at most 1")
+        if self.profile_interval <= 0:
+            raise ValueError("profile_interval must be greater than 0")
+        if self.decode_workers < 0:
+            raise ValueError("decode_workers may not be negative")
+        if (
+            self.map_spill_threshold_mib is not None
+            and self.map_spill_threshold_mib < 0
+        ):
+            raise ValueError("map_spill_threshold_mib, if set, may not be negative")
+
+    def cache_file(self, name: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, name)
 
 
 @dataclass
@@ -79,3 +127,30 @@ class Config(YAMLWizard):
     server: Server
     bot: Bot
     ottd: Ottd = field(default_factory=Ottd)
+
+
+@dataclass
+class FleetConfig(YAMLWizard):
+    servers: list[Server]
+    bot: Bot
+    ottd: Ottd = field(default_factory=Ottd)
+
+    def __post_init__(self) -> None:
+        if len(self.servers) == 0:
+            raise ValueError("servers may not be empty")
+
+    def bot_config(self, server: Server) -> Config:
+        # Every bot gets its own Ottd, since the network revision is set per server
+        return Config(server=server, bot=self.bot, ottd=replace(self.ottd))
+
+    def bot_configs(self) -> list[Config]:
+        return [self.bot_config(server) for server in self.servers]
+
+
+def load_config(filename: str) -> Union[Config, FleetConfig]:
+    """Load a config for a single bot, or for a fleet of bots if it lists servers"""
+    with open(filename, encoding="UTF-8") as f:
+        data = yaml.safe_load(f)
+    if isinstance(data, dict) and "servers" in data:
+        return fromdict(FleetConfig, data)
+    return fromdict(Config, data)
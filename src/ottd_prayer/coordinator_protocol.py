@@ -1,17 +1,20 @@
 from openttd_protocol.protocol.coordinator import PacketCoordinatorType
 from openttd_protocol.wire.read import read_string, read_uint8, read_uint16
-from openttd_protocol.wire.tcp import TCPProtocol
 from openttd_protocol.wire.write import write_init, write_string, write_uint8
 
+from .bot_protocol import BotProtocol
 from .bot_structures import RemoteServer, ServerError
 from .decorators import Receive, data_consumer, data_producer
 
 NETWORK_COORDINATOR_VERSION = 6
 
 
-class CoordinatorProtocol(TCPProtocol):
+class CoordinatorProtocol(BotProtocol):
     PacketType = PacketCoordinatorType
     PACKET_END = PacketCoordinatorType.PACKET_COORDINATOR_END
+    IGNORED_PACKETS = frozenset(
+        {PacketCoordinatorType.PACKET_COORDINATOR_GC_CONNECTING}
+    )
 
     ### RECEIVERS ###
 
@@ -21,15 +24,9 @@ class CoordinatorProtocol(TCPProtocol):
         error_code, data = read_uint8(data)
         error_str, data = read_string(data)
 
-        return ServerError(error_code=error_code, error_str=error_str).to_dict(), data
-
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_COORDINATOR_GC_CONNECTING(data: memoryview) -> Receive:
-        _, data = read_string(data)  # token
-        _, data = read_string(data)  # invite token
-
-        return {}, data
+        return {
+            "server_error": ServerError(error_code=error_code, error_str=error_str)
+        }, data
 
     @staticmethod
     @data_consumer
@@ -46,7 +43,7 @@ class CoordinatorProtocol(TCPProtocol):
         host, data = read_string(data)
         port, data = read_uint16(data)
 
-        return RemoteServer(host=host, port=port).to_dict(), data
+        return {"remote_server": RemoteServer(host=host, port=port)}, data
 
     @staticmethod
     @data_consumer
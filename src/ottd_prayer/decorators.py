@@ -1,14 +1,30 @@
+import asyncio
 import logging
+import random
+import time
+from dataclasses import dataclass
 from functools import wraps
-from typing import Any, Callable, Concatenate, Coroutine, ParamSpec, TypeVar, cast
+from typing import (
+    Any,
+    Callable,
+    Concatenate,
+    Coroutine,
+    ParamSpec,
+    TypeVar,
+    cast,
+)
 
 from openttd_protocol.wire.exceptions import PacketInvalidData
 from openttd_protocol.wire.source import Source
 from openttd_protocol.wire.tcp import TCPProtocol
 from openttd_protocol.wire.write import SEND_TCP_MTU, write_presend
 
+from . import metrics
+
+logger = logging.getLogger(__name__)
 T = TypeVar("T")
 P = ParamSpec("P")
+# Keyword arguments of the bot's receive_ method, and what is left of the packet
 Receive = tuple[dict[str, Any], memoryview]
 
 
@@ -47,12 +63,156 @@ def app_consumer(
     def decorator(
         func: Callable[Concatenate[T, P], Coroutine[Any, Any, None]],
     ) -> Callable[P, Coroutine[Any, Any, None]]:
+        packet_name = func.__name__.removeprefix("receive_")
+
         @wraps(func)
         async def wrapper_app_consumer(*args: P.args, **kwargs: P.kwargs) -> None:
             logger.debug("%s: %s", func.__name__, kwargs)
             self = cast(T, args[0])
-            await func(self, **kwargs)  # type: ignore[call-arg]
+            if not metrics.enabled:
+                await func(self, **kwargs)  # type: ignore[call-arg]
+                return
+
+            start = time.perf_counter()
+            try:
+                await func(self, **kwargs)  # type: ignore[call-arg]
+            finally:
+                metrics.handler_seconds.observe(
+                    (metrics.current_bot.get(), packet_name),
+                    time.perf_counter() - start,
+                )
 
         return wrapper_app_consumer
 
     return decorator
+
+
+@dataclass
+class Timing:
+    samples: int = 0
+    wall_time: float = 0
+    cpu_time: float = 0
+
+
+# Set on the receivers that a Profiler has replaced with timed ones
+PROFILED = "_ottd_prayer_profiled"
+
+
+class Profiler:
+    """
+    Times a sample of the calls to receivers made by data_consumer, which parse
+    packets, and by app_consumer, which handle them, in wall and CPU time. Nothing is
+    timed until instrument() replaces the receivers of a class with timed ones, so
+    that classes that are not instrumented run as fast as ever.
+
+    Handlers that wait on something are charged with the CPU time of whatever else
+    runs in the meantime, which the bot's handlers hardly ever do.
+    """
+
+    def __init__(self, sample_rate: float) -> None:
+        self.sample_rate = sample_rate
+        self.timings: dict[tuple[str, str], Timing] = {}
+        self.started = time.monotonic()
+
+    def instrument(self, cls: type) -> None:
+        """
+        Time the receivers of a protocol, for parsing, or of a bot, for handling.
+        Receivers that are already timed, by this or another profiler, are left as
+        they are, so that instrumenting a class twice doesn't time its calls twice.
+        """
+        for name, attr in list(vars(cls).items()):
+            if not name.startswith("receive_PACKET_"):
+                continue
+            func = attr.__func__ if isinstance(attr, staticmethod) else attr
+            if getattr(func, PROFILED, False):
+                continue
+            packet_name = name.removeprefix("receive_")
+            if isinstance(attr, staticmethod):
+                setattr(cls, name, staticmethod(self._time_parser(func, packet_name)))
+            else:
+                setattr(cls, name, self._time_handler(func, packet_name))
+
+    def _time_parser(
+        self, func: Callable[..., dict[str, Any]], packet_name: str
+    ) -> Callable[..., dict[str, Any]]:
+        timing = self.timings.setdefault((packet_name, "parse"), Timing())
+
+        @wraps(func)
+        def timed_parser(*args: Any) -> dict[str, Any]:
+            if random.random() >= self.sample_rate:
+                return func(*args)
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                return func(*args)
+            finally:
+                timing.cpu_time += time.thread_time() - cpu_start
+                timing.wall_time += time.perf_counter() - wall_start
+                timing.samples += 1
+
+        setattr(timed_parser, PROFILED, True)
+        return timed_parser
+
+    def _time_handler(
+        self, func: Callable[..., Coroutine[Any, Any, None]], packet_name: str
+    ) -> Callable[..., Coroutine[Any, Any, None]]:
+        timing = self.timings.setdefault((packet_name, "handle"), Timing())
+
+        @wraps(func)
+        async def timed_handler(*args: Any, **kwargs: Any) -> None:
+            if random.random() >= self.sample_rate:
+                await func(*args, **kwargs)
+                return
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                await func(*args, **kwargs)
+            finally:
+                timing.cpu_time += time.thread_time() - cpu_start
+                timing.wall_time += time.perf_counter() - wall_start
+                timing.samples += 1
+
+        setattr(timed_handler, PROFILED, True)
+        return timed_handler
+
+    def summary(self, limit: int = 20) -> str:
+        """The most expensive receivers, by their estimated total CPU time"""
+        timings = sorted(
+            (item for item in self.timings.items() if item[1].samples > 0),
+            key=lambda item: item[1].cpu_time,
+            reverse=True,
+        )
+        lines = [
+            "Sampled %.1f%% of calls over %.0f seconds"
+            % (self.sample_rate * 100, time.monotonic() - self.started),
+            "%-40s %-6s %8s %10s %10s %10s"
+            % ("packet", "stage", "samples", "wall us", "CPU us", "total CPU s"),
+        ]
+        for (packet_name, stage), timing in timings[:limit]:
+            lines.append(
+                "%-40s %-6s %8d %10.1f %10.1f %10.3f"
+                % (
+                    packet_name,
+                    stage,
+                    timing.samples,
+                    timing.wall_time / timing.samples * 1e6,
+                    timing.cpu_time / timing.samples * 1e6,
+                    timing.cpu_time / self.sample_rate,
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, filename: str) -> None:
+        try:
+            with open(filename, "w", encoding="UTF-8") as f:
+                f.write(self.summary())
+        except OSError as e:
+            logger.warning("Cannot write profile %s: %s", filename, e)
+
+    async def write_summaries(self, filename: str, interval: float) -> None:
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                self.write_summary(filename)
+        finally:
+            self.write_summary(filename)
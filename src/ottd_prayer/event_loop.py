@@ -0,0 +1,25 @@
+import asyncio
+import logging
+from typing import Any, Coroutine, TypeVar
+
+from .config import EventLoop
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+def run(main: Coroutine[Any, Any, T], event_loop: EventLoop) -> T:
+    """Like asyncio.run, but on the uvloop event loop if so configured"""
+    if event_loop != EventLoop.ASYNCIO:
+        try:
+            import uvloop
+        except ImportError as e:
+            if event_loop == EventLoop.UVLOOP:
+                raise ImportError(
+                    "event_loop is set to UVLOOP, but uvloop is not installed,"
+                    " install ottd_prayer[uvloop]"
+                ) from e
+            logger.debug("uvloop is not installed, using the asyncio event loop")
+        else:
+            return uvloop.run(main)
+    return asyncio.run(main)
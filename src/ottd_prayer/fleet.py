@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+import logging
+from enum import Enum
+from typing import Optional
+
+from .config import Bot, Config, FleetConfig, Server
+from .coordinator_protocol import CoordinatorProtocol
+from .decorators import Profiler
+from .game_protocol import GameProtocol
+from .ip_finder import IpFinder
+from .metrics import current_bot
+from .prayer_bot import PrayerBot
+from .server_connector import run_bot
+
+logger = logging.getLogger(__name__)
+LOG_FORMAT = "%(levelname)s:%(bot)s:%(name)s:%(message)s"
+
+
+class BotContextFilter(logging.Filter):
+    """Adds the name of the bot that logged a record to it, as the bot attribute"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.bot = current_bot.get()
+        return True
+
+
+def bot_name(server: Server) -> str:
+    company = server.company_name or "#%s" % server.company_id
+    if server.server_host is not None:
+        return "%s@%s:%d" % (company, server.server_host, server.server_port)
+    return "%s@%s" % (company, server.invite_code)
+
+
+class BotState(Enum):
+    RUNNING = "RUNNING"
+    STOPPED = "STOPPED"
+    FAILED = "FAILED"
+
+
+class Fleet:
+    """
+    Bots running on the same event loop. Every bot has its own reconnect state, and
+    a bot that stops, for whatever reason, leaves the others running. Bots can be
+    added while the fleet is running.
+
+    Bots are numbered in the order they are added, unless they are given a number,
+    and their states are kept by number, since several bots may share a name.
+    """
+
+    def __init__(self, fleet_config: FleetConfig) -> None:
+        self.fleet_config = fleet_config
+        self.states: dict[int, BotState] = {}
+        self.tasks: set[asyncio.Task[None]] = set()
+        self.indices = itertools.count()
+
+    def add(self, server: Server, index: Optional[int] = None) -> int:
+        if index is None:
+            index = next(self.indices)
+        task = asyncio.create_task(
+            self._run_bot(index, self.fleet_config.bot_config(server))
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return index
+
+    async def wait(self) -> None:
+        """Wait until every bot has stopped"""
+        while len(self.tasks) != 0:
+            await asyncio.wait(self.tasks)
+
+    async def _run_bot(self, index: int, config: Config) -> None:
+        # Tasks get a copy of the context, so this only applies to this bot
+        current_bot.set(bot_name(config.server))
+        self.states[index] = BotState.RUNNING
+        try:
+            await run_bot(config, asyncio.get_running_loop())
+        except Exception:
+            logger.exception("Bot stopped")
+            self.states[index] = BotState.FAILED
+        else:
+            logger.info("Bot stopped")
+            self.states[index] = BotState.STOPPED
+
+
+def add_bot_context_filter() -> None:
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(BotContextFilter())
+
+
+def start_profiler(bot: Bot, profile_file: str) -> "asyncio.Task[None]":
+    """Time a sample of the packets parsed and handled from now on"""
+    profiler = Profiler(bot.profile_sample_rate)
+    for cls in (GameProtocol, CoordinatorProtocol, PrayerBot, IpFinder):
+        profiler.instrument(cls)
+    logger.info("Writing profile to %s", profile_file)
+    return asyncio.create_task(
+        profiler.write_summaries(profile_file, bot.profile_interval)
+    )
+
+
+async def run_fleet(fleet_config: FleetConfig) -> None:
+    """Run a bot for every server on the same event loop"""
+    add_bot_context_filter()
+
+    fleet = Fleet(fleet_config)
+    logger.info("Running %d bots", len(fleet_config.servers))
+    for server in fleet_config.servers:
+        fleet.add(server)
+    await fleet.wait()
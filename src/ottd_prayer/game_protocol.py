@@ -2,14 +2,12 @@ from enum import IntEnum, auto
 
 from openttd_protocol.wire.exceptions import PacketTooShort
 from openttd_protocol.wire.read import (
-    read_bytes,
     read_string,
     read_uint8,
     read_uint16,
     read_uint32,
     read_uint64,
 )
-from openttd_protocol.wire.tcp import TCPProtocol
 from openttd_protocol.wire.write import (
     write_init,
     write_string,
@@ -17,6 +15,7 @@ from openttd_protocol.wire.write import (
     write_uint32,
 )
 
+from .bot_protocol import BotProtocol, PacketTemplate
 from .bot_structures import PlayerMovement, ServerError, ServerFrame, ServerProperties
 from .decorators import Receive, data_consumer, data_producer
 
@@ -71,9 +70,37 @@ class PacketGameType(IntEnum):
     PACKET_END = auto()
 
 
-class GameProtocol(TCPProtocol):
+# NewGRFSerializationType from src/network/core/network_game_info.h
+class NewGrfSerialisation(IntEnum):
+    GRFID_MD5 = 0
+    GRFID_MD5_NAME = auto()
+    LOOKUP_ID = auto()
+
+
+# Packets that always look the same, save for the values of their fields
+CLIENT_GAME_INFO = PacketTemplate(PacketGameType.PACKET_CLIENT_GAME_INFO)
+CLIENT_NEWGRFS_CHECKED = PacketTemplate(PacketGameType.PACKET_CLIENT_NEWGRFS_CHECKED)
+CLIENT_GETMAP = PacketTemplate(PacketGameType.PACKET_CLIENT_GETMAP)
+CLIENT_MAP_OK = PacketTemplate(PacketGameType.PACKET_CLIENT_MAP_OK)
+CLIENT_ACK = PacketTemplate(PacketGameType.PACKET_CLIENT_ACK, "IB")
+
+
+class GameProtocol(BotProtocol):
     PacketType = PacketGameType
     PACKET_END = PacketGameType.PACKET_END
+    # Packets the bot has nothing to do with, which on busy servers are most of them
+    IGNORED_PACKETS = frozenset(
+        {
+            PacketGameType.PACKET_SERVER_WAIT,
+            PacketGameType.PACKET_SERVER_JOIN,
+            PacketGameType.PACKET_SERVER_SYNC,
+            PacketGameType.PACKET_SERVER_COMMAND,
+            PacketGameType.PACKET_SERVER_CHAT,
+            PacketGameType.PACKET_SERVER_EXTERNAL_CHAT,
+            PacketGameType.PACKET_SERVER_COMPANY_UPDATE,
+            PacketGameType.PACKET_SERVER_CONFIG_UPDATE,
+        }
+    )
 
     ### RECEIVERS ###
 
@@ -96,7 +123,9 @@ class GameProtocol(TCPProtocol):
         except PacketTooShort:
             error_str = "no details provided"
 
-        return ServerError(error_code=error_code, error_str=error_str).to_dict(), data
+        return {
+            "server_error": ServerError(error_code=error_code, error_str=error_str)
+        }, data
 
     @staticmethod
     @data_consumer
@@ -112,15 +141,27 @@ class GameProtocol(TCPProtocol):
         # From OpenTTD's SerializeNetworkGameInfo
         if network_game_info_version >= 7:
             _, data = read_uint64(data)
+        newgrf_serialisation: int = NewGrfSerialisation.GRFID_MD5
         if network_game_info_version >= 6:
-            _, data = read_uint8(data)
+            newgrf_serialisation, data = read_uint8(data)
+            if newgrf_serialisation > NewGrfSerialisation.LOOKUP_ID:
+                raise Exception("Unhandled NewGRF serialisation ", newgrf_serialisation)
         if network_game_info_version >= 5:
             _, data = read_uint32(data)
             _, data = read_string(data)
         if network_game_info_version >= 4:
             grf_count, data = read_uint8(data)
             for i in range(grf_count):
-                _, data = read_string(data)
+                if newgrf_serialisation == NewGrfSerialisation.LOOKUP_ID:
+                    # Index into a table only the game coordinator sends
+                    _, data = read_uint32(data)
+                    continue
+                # GRF ID and MD5 sum
+                if len(data) < 20:
+                    raise PacketTooShort
+                data = data[20:]
+                if newgrf_serialisation == NewGrfSerialisation.GRFID_MD5_NAME:
+                    _, data = read_string(data)
         if network_game_info_version >= 3:
             _, data = read_uint32(data)
             _, data = read_uint32(data)
@@ -162,12 +203,11 @@ class GameProtocol(TCPProtocol):
         game_seed, data = read_uint32(data)
         server_id, data = read_string(data)
 
-        return (
-            ServerProperties(
+        return {
+            "server_properties": ServerProperties(
                 client_id=client_id, game_seed=game_seed, server_id=server_id
-            ).to_dict(),
-            data,
-        )
+            )
+        }, data
 
     @staticmethod
     @data_consumer
@@ -176,14 +216,9 @@ class GameProtocol(TCPProtocol):
         playas, data = read_uint8(data)
         _, data = read_string(data)  # name
 
-        return PlayerMovement(client_id=client_id, company_id=playas).to_dict(), data
-
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_SERVER_WAIT(data: memoryview) -> Receive:
-        _, data = read_uint8(data)  # waiting
-
-        return {}, data
+        return {
+            "player_movement": PlayerMovement(client_id=client_id, company_id=playas)
+        }, data
 
     @staticmethod
     @data_consumer
@@ -195,9 +230,9 @@ class GameProtocol(TCPProtocol):
     @staticmethod
     @data_consumer
     def receive_PACKET_SERVER_MAP_SIZE(data: memoryview) -> Receive:
-        _, data = read_uint32(data)  # bytes total
+        bytes_total, data = read_uint32(data)
 
-        return {}, data
+        return {"bytes_total": bytes_total}, data
 
     @staticmethod
     @data_consumer
@@ -212,13 +247,6 @@ class GameProtocol(TCPProtocol):
     def receive_PACKET_SERVER_MAP_DONE(data: memoryview) -> Receive:
         return {}, data
 
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_SERVER_JOIN(data: memoryview) -> Receive:
-        _, data = read_uint32(data)  # client ID
-
-        return {}, data
-
     @staticmethod
     @data_consumer
     def receive_PACKET_SERVER_FRAME(data: memoryview) -> Receive:
@@ -229,51 +257,13 @@ class GameProtocol(TCPProtocol):
         except PacketTooShort:
             token = None
 
-        return (
-            ServerFrame(
+        return {
+            "server_frame": ServerFrame(
                 frame_counter_server=frame_counter_server,
                 frame_counter_max=frame_counter_max,
                 token=token,
-            ).to_dict(),
-            data,
-        )
-
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_SERVER_SYNC(data: memoryview) -> Receive:
-        _, data = read_uint32(data)  # sync frame
-        _, data = read_uint32(data)  # sync seed 1
-
-        return {}, data
-
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_SERVER_COMMAND(data: memoryview) -> Receive:
-        # yeet the data out of the window
-        data = memoryview(bytes())
-
-        return {}, data
-
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_SERVER_CHAT(data: memoryview) -> Receive:
-        _, data = read_uint8(data)  # action
-        _, data = read_uint32(data)  # client ID
-        _, data = read_bytes(data, 1)  # self send
-        _, data = read_string(data)  # messsage
-        _, data = read_uint64(data)  # "data"
-
-        return {}, data
-
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_SERVER_EXTERNAL_CHAT(data: memoryview) -> Receive:
-        _, data = read_string(data)  # source
-        _, data = read_uint16(data)  # color
-        _, data = read_string(data)  # user
-        _, data = read_string(data)  # message
-
-        return {}, data
+            )
+        }, data
 
     @staticmethod
     @data_consumer
@@ -281,26 +271,11 @@ class GameProtocol(TCPProtocol):
         client_id, data = read_uint32(data)  # client ID
         company_id, data = read_uint8(data)  # company ID
 
-        return (
-            PlayerMovement(client_id=client_id, company_id=company_id).to_dict(),
-            data,
-        )
-
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_SERVER_COMPANY_UPDATE(data: memoryview) -> Receive:
-        _, data = read_uint16(data)  # network company passworded
-        # This is a bitmask of companies which have a password set.
-
-        return {}, data
-
-    @staticmethod
-    @data_consumer
-    def receive_PACKET_SERVER_CONFIG_UPDATE(data: memoryview) -> Receive:
-        _, data = read_uint8(data)  # max companies
-        _, data = read_string(data)  # server name
-
-        return {}, data
+        return {
+            "player_movement": PlayerMovement(
+                client_id=client_id, company_id=company_id
+            )
+        }, data
 
     @staticmethod
     @data_consumer
@@ -341,15 +316,11 @@ class GameProtocol(TCPProtocol):
         write_uint8(data, 0)  # used to be language
         return data
 
-    @data_producer
-    def send_PACKET_CLIENT_GAME_INFO(self) -> bytearray:
-        data = write_init(PacketGameType.PACKET_CLIENT_GAME_INFO)
-        return data
+    async def send_PACKET_CLIENT_GAME_INFO(self) -> None:
+        await self.send_packet(CLIENT_GAME_INFO.fill())
 
-    @data_producer
-    def send_PACKET_CLIENT_NEWGRFS_CHECKED(self) -> bytearray:
-        data = write_init(PacketGameType.PACKET_CLIENT_NEWGRFS_CHECKED)
-        return data
+    async def send_PACKET_CLIENT_NEWGRFS_CHECKED(self) -> None:
+        await self.send_packet(CLIENT_NEWGRFS_CHECKED.fill())
 
     @data_producer
     def send_PACKET_CLIENT_GAME_PASSWORD(self, password: str) -> bytearray:
@@ -357,22 +328,14 @@ class GameProtocol(TCPProtocol):
         write_string(data, password)
         return data
 
-    @data_producer
-    def send_PACKET_CLIENT_GETMAP(self) -> bytearray:
-        data = write_init(PacketGameType.PACKET_CLIENT_GETMAP)
-        return data
+    async def send_PACKET_CLIENT_GETMAP(self) -> None:
+        await self.send_packet(CLIENT_GETMAP.fill())
 
-    @data_producer
-    def send_PACKET_CLIENT_MAP_OK(self) -> bytearray:
-        data = write_init(PacketGameType.PACKET_CLIENT_MAP_OK)
-        return data
+    async def send_PACKET_CLIENT_MAP_OK(self) -> None:
+        await self.send_packet(CLIENT_MAP_OK.fill())
 
-    @data_producer
-    def send_PACKET_CLIENT_ACK(self, frame_counter: int, token: int) -> bytearray:
-        data = write_init(PacketGameType.PACKET_CLIENT_ACK)
-        write_uint32(data, frame_counter)
-        write_uint8(data, token)
-        return data
+    async def send_PACKET_CLIENT_ACK(self, frame_counter: int, token: int) -> None:
+        await self.send_packet(CLIENT_ACK.fill(frame_counter, token))
 
     @data_producer
     def send_PACKET_CLIENT_MOVE(
@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Optional, cast
+from typing import Optional, cast
 
 from .bot_structures import RemoteServer, ServerError
 from .config import Config
@@ -27,9 +27,8 @@ class IpFinder:
 
     @app_consumer(logger)
     async def receive_PACKET_COORDINATOR_GC_ERROR(
-        self, **kwargs: dict[str, Any]
+        self, server_error: ServerError
     ) -> None:
-        server_error: ServerError = ServerError.from_dict(kwargs)
         logger.error(
             "Received server error %d: %s",
             server_error.error_code,
@@ -37,19 +36,15 @@ class IpFinder:
         )
         raise Exception("Cannot retrieve server IP")
 
-    @app_consumer(logger)
-    async def receive_PACKET_COORDINATOR_GC_CONNECTING(self) -> None:
-        pass
-
     @app_consumer(logger)
     async def receive_PACKET_COORDINATOR_GC_CONNECT_FAILED(self) -> None:
         raise Exception("Cannot retrieve server IP")
 
     @app_consumer(logger)
     async def receive_PACKET_COORDINATOR_GC_DIRECT_CONNECT(
-        self, **kwargs: dict[str, Any]
+        self, remote_server: RemoteServer
     ) -> None:
-        self.remote_server = RemoteServer.from_dict(kwargs)
+        self.remote_server = remote_server
 
         self.protocol.task.cancel()
 
@@ -1,50 +1,54 @@
 import asyncio
 import logging
+import multiprocessing
 import sys
-from typing import cast
+from typing import Union
+
+from .config import Config, FleetConfig, load_config
+from .event_loop import run
+from .fleet import LOG_FORMAT, bot_name, run_fleet, start_profiler
+from .metrics import current_bot, start_exporter
+from .server_connector import run_bot
+
+
+async def main_async(config: Union[Config, FleetConfig]) -> None:
+    if config.bot.metrics_port is not None:
+        await start_exporter(config.bot.metrics_host, config.bot.metrics_port)
+    profiler_task = None
+    if config.bot.profile_file:
+        profiler_task = start_profiler(config.bot, config.bot.profile_file)
+
+    try:
+        if isinstance(config, FleetConfig):
+            await run_fleet(config)
+        else:
+            current_bot.set(bot_name(config.server))
+            await run_bot(config, asyncio.get_running_loop())
+    finally:
+        if profiler_task is not None:
+            # Writes the final summary
+            profiler_task.cancel()
+            await asyncio.wait([profiler_task])
 
-from .bot_structures import RemoteServer
-from .client_runner import run_client
-from .config import Config
-from .coordinator_protocol import CoordinatorProtocol
-from .ip_finder import IpFinder
-from .server_connector import connect_to_server
 
+def main() -> None:
+    # Map decoding processes re-run the executable when the bot is frozen
+    multiprocessing.freeze_support()
+
+    if len(sys.argv) != 2:
+        print("Usage:", sys.argv[0], "[config file]")
+        sys.exit(1)
 
-async def main_async(filename: str) -> None:
     if not sys.warnoptions:
         import warnings
 
         warnings.simplefilter("default")
 
-    config = cast(Config, Config.from_yaml_file(filename))
-
-    logging.basicConfig(level=config.bot.log_level)
-
-    loop = asyncio.get_running_loop()
-
-    if config.server.server_host is not None:
-        remote_server = RemoteServer(
-            config.server.server_host, config.server.server_port
-        )
+    config = load_config(sys.argv[1])
+    if isinstance(config, FleetConfig):
+        logging.basicConfig(level=config.bot.log_level, format=LOG_FORMAT)
     else:
-        ip_finder = await run_client(
-            loop,
-            RemoteServer(config.ottd.coordinator_host, config.ottd.coordinator_port),
-            IpFinder(config),
-            CoordinatorProtocol,
-            IpFinder.set_protocol_and_query,
-        )
-        if ip_finder.remote_server is None:
-            raise Exception("Remote server was not set")
-        remote_server = ip_finder.remote_server
-
-    await connect_to_server(config, loop, remote_server)
-
-
-def main() -> None:
-    if len(sys.argv) != 2:
-        print("Usage:", sys.argv[0], "[config file]")
-        sys.exit(1)
+        logging.basicConfig(level=config.bot.log_level)
 
-    asyncio.run(main_async(sys.argv[1]))
+    # Chosen before starting the event loop, so the config is loaded beforehand
+    run(main_async(config), config.bot.event_loop)
@@ -0,0 +1,179 @@
+import logging
+import mmap
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AbstractContextManager, contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Iterator, Optional, Protocol
+
+from .bot_structures import CompanyId
+from .compression import DECOMPRESS_PIECE_SIZE
+from .saveload import ChTable, SaveloadBuffer
+
+logger = logging.getLogger(__name__)
+
+_decode_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_decode_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Pool of processes that decode map data. It is kept around for the lifetime of the
+    program, so that reconnecting doesn't have to start new processes.
+    """
+    global _decode_pool
+    if _decode_pool is None:
+        logger.debug("Starting %d map decoding processes", workers)
+        _decode_pool = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _decode_pool
+
+
+def shutdown_decode_pool() -> None:
+    """
+    Stop the decoding processes. Processes started by multiprocessing have to call it
+    before they exit, since they wait for their children to exit first.
+    """
+    global _decode_pool
+    if _decode_pool is not None:
+        _decode_pool.shutdown()
+        _decode_pool = None
+
+
+def discard_decode_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Forget a pool that broke because one of its processes died, for instance when it
+    ran out of memory, so that the next map gets decoded by a new one
+    """
+    global _decode_pool
+    if _decode_pool is pool:
+        _decode_pool = None
+    pool.shutdown(wait=False)
+
+
+class MapBuffer(Protocol):
+    """
+    Holds the map data as it is downloaded, somewhere a decoding process can read it
+    from by name without it being copied or pickled.
+    """
+
+    name: str
+    length: int
+
+    def append(self, data: memoryview) -> None: ...
+
+    def finish(self) -> None:
+        """Make all of the map data visible to the decoding process"""
+        ...
+
+    def close(self) -> None: ...
+
+    @staticmethod
+    def attach(name: str, length: int) -> AbstractContextManager[memoryview]:
+        """Map the map data into the decoding process"""
+        ...
+
+
+class SharedMapBuffer:
+    """Map data in shared memory"""
+
+    def __init__(self, size: int) -> None:
+        self.shm = SharedMemory(create=True, size=max(size, 1))
+        self.name = self.shm.name
+        self.size = size
+        self.length = 0
+
+    def append(self, data: memoryview) -> None:
+        end = self.length + len(data)
+        if end > self.size:
+            raise Exception("Got more map data than announced ", end, self.size)
+        assert self.shm.buf is not None
+        self.shm.buf[self.length : end] = data
+        self.length = end
+
+    def finish(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+    @staticmethod
+    @contextmanager
+    def attach(name: str, length: int) -> Iterator[memoryview]:
+        shm = SharedMemory(name)
+        assert shm.buf is not None
+        try:
+            with shm.buf[:length] as data:
+                yield data
+        finally:
+            shm.close()
+
+
+class FileMapBuffer:
+    """
+    Map data in a temporary file, for maps too big to keep in memory. The decoding
+    process maps the file into memory, so the OS can page it in and out as needed.
+    """
+
+    def __init__(self, size: int) -> None:
+        fd, self.name = tempfile.mkstemp(prefix="ottd-prayer-map-", suffix=".sav")
+        self.file = os.fdopen(fd, "wb")
+        self.size = size
+        self.length = 0
+
+    def append(self, data: memoryview) -> None:
+        end = self.length + len(data)
+        if end > self.size:
+            raise Exception("Got more map data than announced ", end, self.size)
+        self.file.write(data)
+        self.length = end
+
+    def finish(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+        try:
+            os.unlink(self.name)
+        except OSError as e:
+            logger.warning("Cannot remove map data file %s: %s", self.name, e)
+
+    @staticmethod
+    @contextmanager
+    def attach(name: str, length: int) -> Iterator[memoryview]:
+        if length == 0:
+            yield memoryview(b"")
+            return
+        with (
+            open(name, "rb") as f,
+            mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as m,
+            memoryview(m) as data,
+        ):
+            yield data
+
+
+def find_company_id(chunks: dict[str, Any], company_name: str) -> Optional[CompanyId]:
+    plyr = chunks["PLYR"]
+    assert isinstance(plyr, ChTable)
+    name = company_name.encode("UTF-8")
+    return next(
+        (i for i, v in enumerate(plyr.elements) if "name" in v and v["name"] == name),
+        None,
+    )
+
+
+def decode_company_id(
+    buffer_type: type[MapBuffer], name: str, length: int, company_name: str
+) -> Optional[CompanyId]:
+    """Look up the company ID in map data held in a map buffer. Runs in the pool."""
+    saveload = SaveloadBuffer(wanted_chunks={"PLYR"})
+    with buffer_type.attach(name, length) as data:
+        for offset in range(0, length, DECOMPRESS_PIECE_SIZE):
+            with data[offset : offset + DECOMPRESS_PIECE_SIZE] as piece:
+                saveload.append(piece)
+            if saveload.is_complete:
+                break
+    return find_company_id(saveload.decode(), company_name)
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+# Name of the bot that the running task belongs to, in log records and metric labels
+current_bot: ContextVar[str] = ContextVar("current_bot", default="-")
+# Whether anything is being recorded. Checked before every recording, so that
+# metrics cost next to nothing while the exporter is off.
+enabled = False
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names: Labels, labels: Labels) -> str:
+    if len(labels) == 0:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, _escape(value)) for name, value in zip(label_names, labels)
+    )
+
+
+class Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: Labels) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        REGISTRY.append(self)
+
+    def render(self) -> list[str]:
+        return [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s %s" % (self.name, self.TYPE),
+        ] + self._render_samples()
+
+    def _render_samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Labels) -> None:
+        super().__init__(name, help, label_names)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def _render_samples(self) -> list[str]:
+        return [
+            "%s%s %s" % (self.name, _format_labels(self.label_names, labels), value)
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def set(self, labels: Labels, value: float) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self, name: str, help: str, label_names: Labels, buckets: tuple[float, ...]
+    ) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = buckets
+        # Observations per bucket, the last one being +Inf, then their sum
+        self.values: dict[Labels, list[float]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _render_samples(self) -> list[str]:
+        label_names = self.label_names + ("le",)
+        samples = []
+        for labels, counts in self.values.items():
+            cumulative = 0.0
+            for bucket, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bucket == float("inf") else repr(bucket)
+                samples.append(
+                    "%s_bucket%s %d"
+                    % (
+                        self.name,
+                        _format_labels(label_names, labels + (le,)),
+                        cumulative,
+                    )
+                )
+            samples.append(
+                "%s_sum%s %s"
+                % (self.name, _format_labels(self.label_names, labels), counts[-1])
+            )
+            samples.append(
+                "%s_count%s %d"
+                % (self.name, _format_labels(self.label_names, labels), cumulative)
+            )
+        return samples
+
+
+class StateTime(Counter):
+    """Seconds spent in every state, including the time so far in the current one"""
+
+    def __init__(self, name: str, help: str, label_names: Labels) -> None:
+        super().__init__(name, help, label_names + ("state",))
+        self.current: dict[Labels, tuple[str, float]] = {}
+
+    def enter(self, labels: Labels, state: str) -> None:
+        self.leave(labels)
+        self.current[labels] = state, time.monotonic()
+
+    def leave(self, labels: Labels) -> None:
+        current = self.current.pop(labels, None)
+        if current is not None:
+            state, since = current
+            self.inc(labels + (state,), time.monotonic() - since)
+
+    def _render_samples(self) -> list[str]:
+        values = dict(self.values)
+        now = time.monotonic()
+        for labels, (state, since) in self.current.items():
+            key = labels + (state,)
+            values[key] = values.get(key, 0) + now - since
+        return [
+            "%s%s %s" % (self.name, _format_labels(self.label_names, labels), value)
+            for labels, value in values.items()
+        ]
+
+
+REGISTRY: list[Metric] = []
+SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+MAP_SECONDS_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+MAP_BYTES_BUCKETS = tuple(float(1 << shift) for shift in range(16, 31, 2))
+
+packets_received = Counter(
+    "ottd_prayer_packets_received_total",
+    "Packets received, including ignored ones",
+    ("bot", "packet"),
+)
+bytes_received = Counter(
+    "ottd_prayer_bytes_received_total",
+    "Bytes of packets received, including ignored ones",
+    ("bot", "packet"),
+)
+packets_sent = Counter(
+    "ottd_prayer_packets_sent_total", "Packets sent", ("bot", "packet")
+)
+bytes_sent = Counter(
+    "ottd_prayer_bytes_sent_total", "Bytes of packets sent", ("bot", "packet")
+)
+handler_seconds = Histogram(
+    "ottd_prayer_handler_seconds",
+    "Time the bot took to handle a packet",
+    ("bot", "packet"),
+    SECONDS_BUCKETS,
+)
+map_download_bytes = Histogram(
+    "ottd_prayer_map_download_bytes",
+    "Size of downloaded maps",
+    ("bot",),
+    MAP_BYTES_BUCKETS,
+)
+map_download_seconds = Histogram(
+    "ottd_prayer_map_download_seconds",
+    "Time taken to download maps",
+    ("bot",),
+    MAP_SECONDS_BUCKETS,
+)
+map_decode_seconds = Histogram(
+    "ottd_prayer_map_decode_seconds",
+    "Time taken to look up the company in downloaded maps",
+    ("bot",),
+    MAP_SECONDS_BUCKETS,
+)
+reconnects = Counter(
+    "ottd_prayer_reconnects_total",
+    "Reconnects to the server, by the reason for disconnecting",
+    ("bot", "condition"),
+)
+company_seconds = StateTime(
+    "ottd_prayer_company_seconds_total",
+    "Time spent connected, playing in the company or spectating",
+    ("bot",),
+)
+other_clients_playing = Gauge(
+    "ottd_prayer_other_clients_playing",
+    "Other clients playing in any company",
+    ("bot",),
+)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+async def _serve_metrics(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        # Whatever is asked for, the answer is the same
+        while (await reader.readline()).strip():
+            pass
+        body = render().encode("UTF-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            b"Content-Length: %d\r\n"
+            b"Connection: close\r\n\r\n" % len(body)
+        )
+        writer.write(body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_exporter(host: str, port: int) -> asyncio.AbstractServer:
+    """Start serving metrics over HTTP in Prometheus text format, and recording them"""
+    global enabled
+    server = await asyncio.start_server(_serve_metrics, host, port)
+    enabled = True
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return server
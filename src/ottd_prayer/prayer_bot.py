@@ -1,8 +1,14 @@
 import asyncio
 import logging
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from hashlib import md5
-from typing import Any, Optional, cast
+from typing import BinaryIO, Optional, cast
 
+from openttd_protocol.wire.source import Source
+
+from . import metrics
 from .bot_structures import (
     ClientId,
     CompanyId,
@@ -12,10 +18,20 @@ from .bot_structures import (
     ServerFrame,
     ServerProperties,
 )
+from .cache import JsonCache
 from .config import AutoReconnectCondition, Config
 from .decorators import app_consumer
 from .game_protocol import GameProtocol
-from .saveload import ChTable, SaveloadBuffer
+from .map_decoder import (
+    FileMapBuffer,
+    MapBuffer,
+    SharedMapBuffer,
+    decode_company_id,
+    discard_decode_pool,
+    find_company_id,
+    get_decode_pool,
+)
+from .saveload import SaveloadBuffer
 
 logger = logging.getLogger(__name__)
 MAX_COMPANIES = 0x0F
@@ -23,8 +39,26 @@ COMPANY_SPECTATOR = 255
 DAY_TICKS = 74
 
 
+@dataclass
+class BotCaches:
+    """
+    What a bot learns about its server. They outlive every connection, so that it is
+    still known after reconnecting, even without a cache_dir to keep it on disk.
+    """
+
+    company_ids: JsonCache
+    server_info: JsonCache
+
+    @staticmethod
+    def for_config(config: Config) -> "BotCaches":
+        return BotCaches(
+            company_ids=JsonCache(config.bot.cache_file("company_ids.json")),
+            server_info=JsonCache(config.bot.cache_file("server_info.json")),
+        )
+
+
 class PrayerBot:
-    def __init__(self, config: Config) -> None:
+    def __init__(self, config: Config, caches: Optional[BotCaches] = None) -> None:
         self.config = config
 
         self.protocol: GameProtocol
@@ -47,6 +81,23 @@ class PrayerBot:
             AutoReconnectCondition.UNHANDLED in config.bot.auto_reconnect_if
         )
         self.saveload: Optional[SaveloadBuffer] = None
+        self.map_buffer: Optional[MapBuffer] = None
+        self.company_lookup_task: Optional[asyncio.Task[None]] = None
+        self.saveload_dump: Optional[BinaryIO] = None
+        if caches is None:
+            caches = BotCaches.for_config(config)
+        self.company_id_cache = caches.company_ids
+        self.is_company_id_cached: bool = False
+        self.server_info_cache = caches.server_info
+        self.is_server_info_cached: bool = False
+        self.network_revision: Optional[str] = config.ottd.network_revision
+        self.revision_major: Optional[int] = config.ottd.revision_major
+        self.revision_minor: Optional[int] = config.ottd.revision_minor
+        # Why the bot got disconnected, as far as it knows
+        self.disconnect_reason: str = AutoReconnectCondition.CONNECTION_LOST.value
+        self.metrics_labels = (metrics.current_bot.get(),)
+        self.map_download_start: float = 0
+        self.map_bytes_total: int = 0
 
     async def set_protocol_and_join(self, protocol: GameProtocol) -> None:
         logger.debug("Setting protocol")
@@ -60,13 +111,33 @@ class PrayerBot:
             # bail!
             return
 
-        if self.config.ottd.network_revision == None:
+        if self.network_revision is None:
+            server_info = self.server_info_cache.get(self._server_info_cache_key())
+            if server_info is not None:
+                logger.debug(
+                    "Using cached server revision %s", server_info["network_revision"]
+                )
+                self.network_revision = server_info["network_revision"]
+                self.revision_major = server_info["revision_major"]
+                self.revision_minor = server_info["revision_minor"]
+                self.is_server_info_cached = True
+
+        if self.network_revision is None:
             await protocol.send_PACKET_CLIENT_GAME_INFO()
         else:
             await self._join_remote_server()
 
     ### CALLED BY TCPPROTOCOL ###
 
+    def disconnect(self, source: Source) -> None:
+        if self.company_lookup_task is not None:
+            self.company_lookup_task.cancel()
+        self._release_map_buffer()
+        self._close_saveload_dump()
+        if metrics.enabled:
+            metrics.company_seconds.leave(self.metrics_labels)
+            metrics.other_clients_playing.set(self.metrics_labels, 0)
+
     @app_consumer(logger)
     async def receive_PACKET_SERVER_FULL(self) -> None:
         logger.warning("Server is full")
@@ -78,9 +149,7 @@ class PrayerBot:
         self._reconnect_if(AutoReconnectCondition.BANNED)
 
     @app_consumer(logger)
-    async def receive_PACKET_SERVER_ERROR(self, **kwargs: dict[str, Any]) -> None:
-        server_error: ServerError = ServerError.from_dict(kwargs)
-
+    async def receive_PACKET_SERVER_ERROR(self, server_error: ServerError) -> None:
         if server_error.error_code == NetworkErrorCode.NETWORK_ERROR_WRONG_PASSWORD:
             logger.error("Incorrect game password")
             self._reconnect_if(AutoReconnectCondition.WRONG_GAME_PASSWORD)
@@ -88,6 +157,12 @@ class PrayerBot:
             logger.warning("Bot got kicked")
             self._reconnect_if(AutoReconnectCondition.KICKED)
         elif server_error.error_code == NetworkErrorCode.NETWORK_ERROR_WRONG_REVISION:
+            if self.is_server_info_cached:
+                logger.warning("Cached server revision is stale, asking the server")
+                self.server_info_cache.invalidate(self._server_info_cache_key())
+                self.disconnect_reason = "STALE_CACHE"
+                self._disconnect(True)
+                return
             logger.warning("Wrong server revision")
             self._reconnect_if(AutoReconnectCondition.WRONG_REVISION)
         else:
@@ -105,7 +180,19 @@ class PrayerBot:
 
     @app_consumer(logger)
     async def receive_PACKET_SERVER_GAME_INFO(self, server_revision: str) -> None:
-        self.config.ottd.network_revision = server_revision
+        self.network_revision = server_revision
+        if self.revision_major is None or self.revision_minor is None:
+            self.revision_major, self.revision_minor = _revision_version(
+                server_revision
+            )
+        self.server_info_cache.set(
+            self._server_info_cache_key(),
+            {
+                "network_revision": self.network_revision,
+                "revision_major": self.revision_major,
+                "revision_minor": self.revision_minor,
+            },
+        )
         await self._join_remote_server()
 
     @app_consumer(logger)
@@ -126,75 +213,94 @@ class PrayerBot:
         await self.protocol.send_PACKET_CLIENT_GAME_PASSWORD(server_password)
 
     @app_consumer(logger)
-    async def receive_PACKET_SERVER_WELCOME(self, **kwargs: dict[str, Any]) -> None:
-        self.server_properties = ServerProperties.from_dict(kwargs)
+    async def receive_PACKET_SERVER_WELCOME(
+        self, server_properties: ServerProperties
+    ) -> None:
+        self.server_properties = server_properties
+        if metrics.enabled:
+            metrics.company_seconds.enter(self.metrics_labels, "spectating")
+
+        if self.target_company_id is None:
+            cached_company_id = self.company_id_cache.get(self._company_id_cache_key())
+            if cached_company_id is not None:
+                logger.debug("Using cached company ID %d", cached_company_id + 1)
+                self.target_company_id = cached_company_id
+                self.is_company_id_cached = True
 
         await self.protocol.send_PACKET_CLIENT_GETMAP()
 
     @app_consumer(logger)
-    async def receive_PACKET_SERVER_CLIENT_INFO(self, **kwargs: dict[str, Any]) -> None:
-        player_movement: PlayerMovement = PlayerMovement.from_dict(kwargs)
-
+    async def receive_PACKET_SERVER_CLIENT_INFO(
+        self, player_movement: PlayerMovement
+    ) -> None:
         await self._do_player_movement(
             player_movement.client_id, player_movement.company_id
         )
 
-    @app_consumer(logger)
-    async def receive_PACKET_SERVER_WAIT(self) -> None:
-        pass
-
     @app_consumer(logger)
     async def receive_PACKET_SERVER_MAP_BEGIN(self, frame: int) -> None:
         self.frame_counter = frame
+        self.map_download_start = time.monotonic()
         if self.target_company_id is None:
-            self.saveload = SaveloadBuffer()
+            # Without a decoding process, decode the map as it is downloaded
+            if self.config.bot.decode_workers == 0:
+                self.saveload = SaveloadBuffer(wanted_chunks={"PLYR"})
+            if self.config.bot.saveload_dump_file:
+                self.saveload_dump = open(self.config.bot.saveload_dump_file, "wb")
 
     @app_consumer(logger)
-    async def receive_PACKET_SERVER_MAP_SIZE(self) -> None:
-        pass
+    async def receive_PACKET_SERVER_MAP_SIZE(self, bytes_total: int) -> None:
+        self.map_bytes_total = bytes_total
+        if self.target_company_id is None and self.config.bot.decode_workers > 0:
+            spill_threshold = self.config.bot.map_spill_threshold_mib
+            if spill_threshold is not None and bytes_total > spill_threshold << 20:
+                logger.debug("Writing %d bytes of map data to disk", bytes_total)
+                self.map_buffer = FileMapBuffer(bytes_total)
+            else:
+                self.map_buffer = SharedMapBuffer(bytes_total)
 
     @app_consumer(logger)
     async def receive_PACKET_SERVER_MAP_DATA(self, map_data: memoryview) -> None:
+        if self.saveload_dump is not None:
+            self.saveload_dump.write(map_data)
         if self.saveload is not None:
             logger.debug("Appending %d bytes of map data", len(map_data))
             self.saveload.append(map_data)
+        elif self.map_buffer is not None:
+            self.map_buffer.append(map_data)
 
     @app_consumer(logger)
     async def receive_PACKET_SERVER_MAP_DONE(self) -> None:
+        self._close_saveload_dump()
+        if metrics.enabled:
+            metrics.map_download_seconds.observe(
+                self.metrics_labels, time.monotonic() - self.map_download_start
+            )
+            metrics.map_download_bytes.observe(
+                self.metrics_labels, self.map_bytes_total
+            )
         if self.saveload is not None:
-            if self.config.bot.saveload_dump_file:
-                with open(self.config.bot.saveload_dump_file, "wb") as f:
-                    f.write(self.saveload.to_bytes())
+            decode_start = time.monotonic()
             chunks = self.saveload.decode()
-            plyr = chunks["PLYR"]
-            assert isinstance(plyr, ChTable)
-            company_name = cast(str, self.config.server.company_name).encode("UTF-8")
-            target_company_id = next(
-                (
-                    i
-                    for i, v in enumerate(plyr.elements)
-                    if "name" in v and v["name"] == company_name
-                ),
-                None,
-            )
-            if target_company_id is None:
-                logger.error("Cannot find specified company")
-                self._reconnect_if(AutoReconnectCondition.COMPANY_NOT_FOUND)
-                return
-            self.target_company_id = target_company_id
-            logger.debug("Setting target company ID to %d", target_company_id + 1)
             self.saveload = None  # no longer needed
+            if metrics.enabled:
+                metrics.map_decode_seconds.observe(
+                    self.metrics_labels, time.monotonic() - decode_start
+                )
+            if not self._set_target_company_id(
+                find_company_id(chunks, cast(str, self.config.server.company_name))
+            ):
+                return
+        elif self.map_buffer is not None:
+            # Keep the connection going while the map gets decoded in the background
+            self.company_lookup_task = asyncio.create_task(self._look_up_company_id())
+            await self.protocol.send_PACKET_CLIENT_MAP_OK()
+            return
         self.ready_to_play = True
         await self.protocol.send_PACKET_CLIENT_MAP_OK()
 
     @app_consumer(logger)
-    async def receive_PACKET_SERVER_JOIN(self) -> None:
-        pass
-
-    @app_consumer(logger)
-    async def receive_PACKET_SERVER_FRAME(self, **kwargs: dict[str, Any]) -> None:
-        server_frame: ServerFrame = ServerFrame.from_dict(kwargs)
-
+    async def receive_PACKET_SERVER_FRAME(self, server_frame: ServerFrame) -> None:
         if server_frame.token != None:
             assert server_frame.token is not None
             self.token = server_frame.token
@@ -209,37 +315,11 @@ class PrayerBot:
             await self.protocol.send_PACKET_CLIENT_ACK(self.frame_counter, self.token)
 
     @app_consumer(logger)
-    async def receive_PACKET_SERVER_SYNC(self) -> None:
-        pass
-
-    @app_consumer(logger)
-    async def receive_PACKET_SERVER_COMMAND(self) -> None:
-        pass
-
-    @app_consumer(logger)
-    async def receive_PACKET_SERVER_CHAT(self) -> None:
-        pass
-
-    @app_consumer(logger)
-    async def receive_PACKET_SERVER_EXTERNAL_CHAT(self) -> None:
-        pass
-
-    @app_consumer(logger)
-    async def receive_PACKET_SERVER_MOVE(self, **kwargs: dict[str, Any]) -> None:
-        player_movement: PlayerMovement = PlayerMovement.from_dict(kwargs)
-
+    async def receive_PACKET_SERVER_MOVE(self, player_movement: PlayerMovement) -> None:
         await self._do_player_movement(
             player_movement.client_id, player_movement.company_id
         )
 
-    @app_consumer(logger)
-    async def receive_PACKET_SERVER_COMPANY_UPDATE(self) -> None:
-        pass
-
-    @app_consumer(logger)
-    async def receive_PACKET_SERVER_CONFIG_UPDATE(self) -> None:
-        pass
-
     @app_consumer(logger)
     async def receive_PACKET_SERVER_NEWGAME(self) -> None:
         logger.warning("Server is about to restart")
@@ -266,17 +346,13 @@ class PrayerBot:
 
     async def _join_remote_server(self) -> None:
         logger.debug("Joining remote server")
-        assert self.config.ottd.network_revision is not None
-
-        if (
-            self.config.ottd.revision_major == None
-            or self.config.ottd.revision_minor == None
-        ):
-            revision_major = int(self.config.ottd.network_revision.split(".")[0])
-            revision_minor = 0  # ????
+        assert self.network_revision is not None
+
+        if self.revision_major is None or self.revision_minor is None:
+            revision_major, revision_minor = _revision_version(self.network_revision)
         else:
-            revision_major = self.config.ottd.revision_major
-            revision_minor = self.config.ottd.revision_minor
+            revision_major = self.revision_major
+            revision_minor = self.revision_minor
         newgrf_version = (
             (revision_major + 16) << 24
             | revision_minor << 20
@@ -286,23 +362,96 @@ class PrayerBot:
 
         logger.debug(
             "Joining with revision %s NewGRF version %d",
-            self.config.ottd.network_revision,
+            self.network_revision,
             newgrf_version,
         )
         await self.protocol.send_PACKET_CLIENT_JOIN(
-            self.config.ottd.network_revision,
+            self.network_revision,
             newgrf_version,
             self.config.server.player_name,
             COMPANY_SPECTATOR,
         )
 
     def _reconnect_if(self, condition: AutoReconnectCondition) -> None:
-        self.should_reconnect = condition in self.config.bot.auto_reconnect_if
+        self.disconnect_reason = condition.value
+        self._disconnect(condition in self.config.bot.auto_reconnect_if)
+
+    def _disconnect(self, should_reconnect: bool) -> None:
+        self.should_reconnect = should_reconnect
         self.ban_check_task.cancel()
         if self.company_move_task is not None:
             self.company_move_task.cancel()
+        if self.company_lookup_task is not None:
+            self.company_lookup_task.cancel()
         self.protocol.task.cancel()
 
+    async def _look_up_company_id(self) -> None:
+        map_buffer = cast(MapBuffer, self.map_buffer)
+        decode_start = time.monotonic()
+        decode_pool = get_decode_pool(self.config.bot.decode_workers)
+        try:
+            map_buffer.finish()
+            target_company_id = await asyncio.get_running_loop().run_in_executor(
+                decode_pool,
+                decode_company_id,
+                type(map_buffer),
+                map_buffer.name,
+                map_buffer.length,
+                cast(str, self.config.server.company_name),
+            )
+        except BrokenProcessPool:
+            logger.exception("Map decoding process died, starting new ones")
+            discard_decode_pool(decode_pool)
+            self._reconnect_if(AutoReconnectCondition.UNHANDLED)
+            return
+        except Exception:
+            logger.exception("Cannot decode map")
+            self._reconnect_if(AutoReconnectCondition.UNHANDLED)
+            return
+        finally:
+            self._release_map_buffer()
+        if metrics.enabled:
+            metrics.map_decode_seconds.observe(
+                self.metrics_labels, time.monotonic() - decode_start
+            )
+
+        if self._set_target_company_id(target_company_id):
+            self.ready_to_play = True
+            await self._try_joining_company()
+
+    def _set_target_company_id(self, target_company_id: Optional[CompanyId]) -> bool:
+        if target_company_id is None:
+            logger.error("Cannot find specified company")
+            self._reconnect_if(AutoReconnectCondition.COMPANY_NOT_FOUND)
+            return False
+        self.target_company_id = target_company_id
+        logger.debug("Setting target company ID to %d", target_company_id + 1)
+        self.company_id_cache.set(self._company_id_cache_key(), target_company_id)
+        return True
+
+    def _release_map_buffer(self) -> None:
+        if self.map_buffer is not None:
+            self.map_buffer.close()
+            self.map_buffer = None
+
+    def _close_saveload_dump(self) -> None:
+        if self.saveload_dump is not None:
+            self.saveload_dump.close()
+            self.saveload_dump = None
+
+    def _company_id_cache_key(self) -> str:
+        return "%s:%d:%s" % (
+            self.server_properties.server_id,
+            self.server_properties.game_seed,
+            self.config.server.company_name,
+        )
+
+    def _server_info_cache_key(self) -> str:
+        server = self.config.server
+        if server.server_host is not None:
+            return "%s:%d" % (server.server_host, server.server_port)
+        return cast(str, server.invite_code)
+
     # GenerateCompanyPasswordHash from src/network/network.cpp
     def _company_password_hash(self) -> str:
         password_str = self.config.server.company_password
@@ -331,16 +480,28 @@ class PrayerBot:
         # Set/unset own company ID if the player movement is for us, join anyways
         if client_id == self.server_properties.client_id:
             self.is_playing = company_id == self.target_company_id
+            if metrics.enabled:
+                metrics.company_seconds.enter(
+                    self.metrics_labels, "playing" if self.is_playing else "spectating"
+                )
             await self._try_joining_company()
 
         # Track other players playing, play ourselves if we haven't yet
         elif company_id <= MAX_COMPANIES:
             self.other_clients_playing.add(client_id)
+            if metrics.enabled:
+                metrics.other_clients_playing.set(
+                    self.metrics_labels, len(self.other_clients_playing)
+                )
             await self._try_joining_company()
 
         # Track other players leaving/spectating, spectate ourselves if desired
         else:
             self.other_clients_playing.discard(client_id)
+            if metrics.enabled:
+                metrics.other_clients_playing.set(
+                    self.metrics_labels, len(self.other_clients_playing)
+                )
             if (
                 self.ready_to_play
                 and self.is_playing
@@ -370,5 +531,19 @@ class PrayerBot:
     async def _wait_for_move_or_disconnect(self) -> None:
         logger.debug("Waiting to confirm if the move was successful")
         await asyncio.sleep(1)
+        if self.is_company_id_cached:
+            logger.warning("Cached company ID is stale, looking it up again")
+            self.company_id_cache.invalidate(self._company_id_cache_key())
+            self.disconnect_reason = "STALE_CACHE"
+            self._disconnect(True)
+            return
         logger.error("Bot was not moved to the requested company")
         self._reconnect_if(AutoReconnectCondition.CANNOT_MOVE)
+
+
+def _revision_version(network_revision: str) -> tuple[int, int]:
+    """Guesses the major and minor version from a revision like 14.1 or 13.0-RC1"""
+    version = network_revision.split("-")[0].split(".")
+    revision_major = int(version[0])
+    revision_minor = int(version[1]) if len(version) > 1 and version[1].isdigit() else 0
+    return revision_major, revision_minor
@@ -0,0 +1,127 @@
+import asyncio
+import itertools
+import logging
+import os
+import struct
+import time
+from typing import Any, BinaryIO, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+MAGIC = b"OTTDREC\x01"
+# Microseconds since the previous packet, followed by the packet as it was framed
+RECORD_HEADER = struct.Struct("<I")
+MAX_DELAY_US = (1 << 32) - 1
+_recording_ids = itertools.count(1)
+
+
+class Recorder:
+    """
+    Writes every packet received on a connection to a file, along with when it
+    arrived, so that the connection can be replayed later without a server. Packets
+    that arrived together are recorded 0 microseconds apart.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        self.file: BinaryIO = open(filename, "wb")
+        self.file.write(MAGIC)
+        self.last_time = time.monotonic()
+
+    def record(self, packet: Union[bytes, memoryview], now: float) -> None:
+        delay_us = min(int((now - self.last_time) * 1e6), MAX_DELAY_US)
+        self.last_time = now
+        self.file.write(RECORD_HEADER.pack(delay_us))
+        self.file.write(packet)
+
+    def close(self) -> None:
+        self.file.close()
+        logger.info("Recorded the connection to %s", self.filename)
+
+
+def recording_filename(record_dir: str) -> str:
+    return os.path.join(
+        record_dir,
+        "%s-%d-%d.ottdrec"
+        % (time.strftime("%Y%m%d-%H%M%S"), os.getpid(), next(_recording_ids)),
+    )
+
+
+def read_recording(filename: str) -> Iterator[tuple[float, bytes]]:
+    """
+    Yields the packets of a recording as they arrived: every item is when a bunch of
+    packets arrived, in seconds since the first one, and the packets themselves
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError("%s is not a recording" % filename)
+
+    offset = len(MAGIC)
+    elapsed = 0.0
+    chunk = bytearray()
+    chunk_elapsed = 0.0
+    while offset < len(data):
+        if offset + RECORD_HEADER.size + 3 > len(data):
+            # The bot was killed before it could finish writing
+            logger.warning("%s is truncated, stopping early", filename)
+            break
+        (delay_us,) = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        length = data[offset] | data[offset + 1] << 8
+        if length < 3:
+            raise ValueError("%s is corrupt" % filename)
+        if offset + length > len(data):
+            logger.warning("%s is truncated, stopping early", filename)
+            break
+
+        if delay_us != 0 and len(chunk) != 0:
+            yield chunk_elapsed, bytes(chunk)
+            chunk = bytearray()
+        elapsed += delay_us / 1e6
+        if len(chunk) == 0:
+            chunk_elapsed = elapsed
+        chunk += data[offset : offset + length]
+        offset += length
+    if len(chunk) != 0:
+        yield chunk_elapsed, bytes(chunk)
+
+
+class ReplayTransport(asyncio.Transport):
+    """Transport that counts what the bot sends back during a replay"""
+
+    def __init__(self, protocol: asyncio.Protocol) -> None:
+        super().__init__()
+        self.protocol = protocol
+        self.closing = False
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        if name == "peername":
+            return ("127.0.0.1", 0)
+        return default
+
+    def set_write_buffer_limits(
+        self, high: Optional[int] = None, low: Optional[int] = None
+    ) -> None:
+        pass
+
+    def write(self, data: Any) -> None:
+        self.packets_sent += 1
+        self.bytes_sent += len(data)
+
+    def writelines(self, list_of_data: Any) -> None:
+        for data in list_of_data:
+            self.write(data)
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    def close(self) -> None:
+        if not self.closing:
+            self.closing = True
+            self.protocol.connection_lost(None)
+
+    def abort(self) -> None:
+        self.close()
@@ -1,42 +1,164 @@
 from __future__ import annotations
 
+import argparse
+import importlib
+import json
 import logging
-import lzma
 import struct
-import sys
-from dataclasses import dataclass
-from typing import Any
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Generator, Iterator, Optional, TypeVar
 
 from openttd_protocol.wire.exceptions import PacketTooShort
-from openttd_protocol.wire.read import (
-    read_bytes,
-    read_uint8,
-    read_uint16,
-    read_uint32,
-    read_uint64,
-)
+from openttd_protocol.wire.read import read_bytes, read_uint16
+from openttd_protocol.wire.write import SEND_TCP_MTU
+
+from .compression import StreamDecompressor, create_decompressor
 
 logger = logging.getLogger(__name__)
 LOGLEVEL_TRACE = 5
 SPECIAL_CHUNKS: list[bytes] = [b"AIPL", b"GSDT"]
 MIN_SAVELOAD_VERSION = 296
+SAVELOAD_HEADER_SIZE = 8
+CHUNK_TYPE_NAMES = {0: "RIFF", 3: "TABLE", 4: "SPARSE_TABLE"}
+# State of an SQSL array or table that is still open while skipping script data
+SQSL_ARRAY = 0
+SQSL_TABLE_KEY = 1
+SQSL_TABLE_VALUE = 2
+
+T = TypeVar("T")
+# Parsers yield the number of bytes they need next, and get sent exactly that many.
+# A negative number means that many bytes are to be skipped, and nothing is sent.
+Parser = Generator[int, memoryview, T]
 
 
 def _trace(msg: str, *args: object) -> None:
     logger.log(LOGLEVEL_TRACE, msg, *args)
 
 
+class Cursor:
+    """
+    Reads values from a buffer by moving an offset along it, rather than slicing off
+    a new memoryview for every value read. All values are big-endian, as in OpenTTD.
+    """
+
+    __slots__ = ("buf", "pos")
+    _uint24 = struct.Struct(">BH")
+
+    def __init__(self, buf: memoryview) -> None:
+        self.buf = buf
+        self.pos = 0
+
+    def remaining(self) -> int:
+        return len(self.buf) - self.pos
+
+    def skip(self, length: int) -> None:
+        if self.pos + length > len(self.buf):
+            raise PacketTooShort
+        self.pos += length
+
+    def read_uint8(self) -> int:
+        try:
+            value = self.buf[self.pos]
+        except IndexError:
+            raise PacketTooShort from None
+        self.pos += 1
+        return value
+
+    def peek_uint8(self) -> int:
+        try:
+            return self.buf[self.pos]
+        except IndexError:
+            raise PacketTooShort from None
+
+    def read_uint24(self) -> int:
+        try:
+            high, low = self._uint24.unpack_from(self.buf, self.pos)
+        except struct.error:
+            raise PacketTooShort from None
+        self.pos += 3
+        return int(high << 16 | low)
+
+    def read_bytes(self, length: int) -> bytes:
+        pos = self.pos
+        if pos + length > len(self.buf):
+            raise PacketTooShort
+        self.pos = pos + length
+        return self.buf[pos : pos + length].tobytes()
+
+    def read_gamma(self) -> int:
+        buf = self.buf
+        pos = self.pos
+        try:
+            res = buf[pos]
+            if res >= 0x80:
+                extra = 1 if res < 0xC0 else 2 if res < 0xE0 else 3 if res < 0xF0 else 4
+                res &= 0x7F >> extra
+                for pos in range(pos + 1, pos + extra + 1):
+                    res = (res << 8) | buf[pos]
+        except IndexError:
+            raise PacketTooShort from None
+        self.pos = pos + 1
+        return res
+
+
 @dataclass
 class ChRiff:
     chunk: bytes
 
     @staticmethod
-    def create(type: int, data: memoryview) -> tuple[ChRiff, memoryview]:
-        length, data = read_uint24(data)
+    def parse(type: int) -> Parser[ChRiff]:
+        length = Cursor((yield 3)).read_uint24()
         length |= (type >> 4) << 24
         _trace("RIFF size should be %d", length)
-        chunk, data = read_bytes(data, length)
-        return ChRiff(chunk=chunk), data
+        chunk = (yield length).tobytes()
+        return ChRiff(chunk=chunk)
+
+    @staticmethod
+    def skip(type: int) -> Parser[None]:
+        length = Cursor((yield 3)).read_uint24()
+        length |= (type >> 4) << 24
+        _trace("Skipping RIFF of size %d", length)
+        yield -length
+
+
+# Size in bytes of the fixed-width field types, as found in table headers
+FIELD_WIDTHS: dict[int, int] = {1: 1, 2: 1, 3: 2, 4: 2, 5: 4, 6: 4, 7: 8, 8: 8, 9: 2}
+# Decodes a (sub)struct of a row
+RowDecoder = Callable[[Cursor], dict[str, Any]]
+# Decodes a single field of a row, storing the value in the row if it is kept
+FieldDecoder = Callable[[Cursor, dict[str, Any]], None]
+
+
+def _skip_field(width: int) -> FieldDecoder:
+    def skip_field(cursor: Cursor, row: dict[str, Any]) -> None:
+        cursor.skip(width)
+
+    return skip_field
+
+
+def _skip_repeated_field(width: int) -> FieldDecoder:
+    def skip_repeated_field(cursor: Cursor, row: dict[str, Any]) -> None:
+        cursor.skip(cursor.read_gamma() * width)
+
+    return skip_repeated_field
+
+
+def _bytes_field(key: str, has_length: bool) -> FieldDecoder:
+    def bytes_field(cursor: Cursor, row: dict[str, Any]) -> None:
+        row[key] = cursor.read_bytes(cursor.read_gamma() if has_length else 1)
+
+    return bytes_field
+
+
+def _struct_field(decode_row_struct: RowDecoder, has_length: bool) -> FieldDecoder:
+    def struct_field(cursor: Cursor, row: dict[str, Any]) -> None:
+        for _ in range(cursor.read_gamma() if has_length else 1):
+            decode_row_struct(cursor)
+
+    return struct_field
 
 
 class ChTableReader:
@@ -51,41 +173,34 @@ class ChTableReader:
             ChTableReader.root_struct_key
         ]
         self.special = False
+        self.skip_script_data = False
 
-    def read_header(self, data: memoryview) -> memoryview:
-        header_size, data = gamma(data)
+    def parse_header(self) -> Parser[None]:
+        header_size = yield from parse_gamma()
         _trace("Table header size should be %d", header_size - 1)
-        expected_remaining_size = len(data) - header_size + 1
+        cursor = Cursor((yield header_size - 1))
 
         while len(self.structs_to_process) != 0:
             key = self.structs_to_process.pop(0)
             _trace("Reading header struct %s", key)
-            header_struct, data = self._read_header_struct(key, data)
-            self.structs[key] = header_struct
+            self.structs[key] = self._read_header_struct(key, cursor)
 
-        if len(data) < expected_remaining_size:
+        if cursor.remaining() != 0:
             raise Exception(
-                "Table header size mismatch: expected ",
-                expected_remaining_size,
-                " bytes to remain, got ",
-                len(data),
+                "Table header size mismatch: ", cursor.remaining(), " bytes left over"
             )
 
-        return data
+        self.decode_row_struct = self._compile_row_struct(ChTableReader.root_struct_key)
 
-    def _read_header_struct(
-        self, struct_name: StructKey, data: memoryview
-    ) -> tuple[Header, memoryview]:
+    def _read_header_struct(self, struct_name: StructKey, cursor: Cursor) -> Header:
         structs_to_process_idx = 0
         header: ChTableReader.Header = []
         while True:
-            field_type, data = read_uint8(data)
+            field_type = cursor.read_uint8()
             if field_type == 0:
-                return header, data
+                return header
 
-            key_length, data = gamma(data)
-            key_raw, data = read_bytes(data, key_length)
-            key = key_raw.decode("UTF-8")
+            key = cursor.read_bytes(cursor.read_gamma()).decode("UTF-8")
             _trace("Read field type %d named %s", field_type, key)
             header.append((field_type, key))
 
@@ -95,212 +210,587 @@ class ChTableReader:
                 )
                 structs_to_process_idx += 1
 
-    def read_row(self, row_size: int, data: memoryview) -> tuple[Row, memoryview]:
+    def read_row(self, row_size: int, cursor: Cursor) -> Row:
         _trace("Table row size should be %d", row_size - 1)
         if row_size == 1:
             # This is an array with unallocated data
-            return {}, data
-        expected_remaining_size = len(data) - row_size + 1
-        row, data = self._read_row_struct(ChTableReader.root_struct_key, data)
-        if len(data) != expected_remaining_size and self.special:
-            has_script_data, data = read_uint8(data)
-            if has_script_data != 0:
+            return {}
+        expected_remaining_size = cursor.remaining() - row_size + 1
+        row = self.decode_row_struct(cursor)
+        if cursor.remaining() != expected_remaining_size and self.special:
+            has_script_data = cursor.read_uint8()
+            if has_script_data != 0 and self.skip_script_data:
+                _trace("Skipping script data")
+                cursor.skip(cursor.remaining() - expected_remaining_size)
+            elif has_script_data != 0:
                 _trace("Reading script data")
-                _, data = self._read_script_data(data)
-        if len(data) != expected_remaining_size:
+                self._read_script_data(cursor)
+        if cursor.remaining() != expected_remaining_size:
             raise Exception(
                 "Table row size mismatch: expected ",
                 expected_remaining_size,
                 " bytes to remain, got ",
-                len(data),
+                cursor.remaining(),
             )
-        return row, data
-
-    def _read_row_struct(
-        self, struct_name: StructKey, data: memoryview
-    ) -> tuple[Row, memoryview]:
-        row: ChTableReader.Row = {}
+        return row
+
+    def _compile_row_struct(self, struct_name: StructKey) -> RowDecoder:
+        """
+        Turn a header struct into a decoder for its rows. Runs of fixed-width fields are
+        skipped over in one go, since their values are not kept anyway.
+        """
+        ops: list[FieldDecoder] = []
+        fixed_width = 0
         for field_type, key in self.structs[struct_name]:
-            repeat = 1
-            value = None
-            if field_type & 0x10:
-                repeat, data = gamma(data)
-            _trace("Reading field '%s' %d time(s)", key, repeat)
+            width = FIELD_WIDTHS.get(field_type & 0xF)
+            if width is not None and not field_type & 0x10:
+                fixed_width += width
+                continue
+
+            if fixed_width != 0:
+                ops.append(_skip_field(fixed_width))
+                fixed_width = 0
             match field_type & 0xF:
-                case 1 | 2:
-                    for _ in range(repeat):
-                        _, data = read_uint8(data)
-                case 3 | 4 | 9:
-                    for _ in range(repeat):
-                        _, data = read_uint16(data)
-                case 5 | 6:
-                    for _ in range(repeat):
-                        _, data = read_uint32(data)
-                case 7 | 8:
-                    for _ in range(repeat):
-                        _, data = read_uint64(data)
+                case _ if width is not None:
+                    ops.append(_skip_repeated_field(width))
                 case 10:
-                    value, data = read_bytes(data, repeat)
+                    ops.append(_bytes_field(key, field_type & 0x10 != 0))
                 case 11:
-                    for _ in range(repeat):
-                        _, data = self._read_row_struct(struct_name + (key,), data)
+                    ops.append(
+                        _struct_field(
+                            self._compile_row_struct(struct_name + (key,)),
+                            field_type & 0x10 != 0,
+                        )
+                    )
                 case _ as x:
                     raise Exception("Unhandled field type ", x)
-            row[key] = value
-        return row, data
-
-    def _read_script_data(self, data: memoryview) -> tuple[None, memoryview]:
-        field_type, data = read_uint8(data)
-        _trace("Reading SQSL field type %d", field_type)
-        match field_type:
-            case 0:
-                _, data = read_uint64(data)
-            case 1:
-                size, data = read_uint8(data)
-                _, data = read_bytes(data, size)
-            case 2:
-                marker, post_marker_data = read_uint8(data)
-                while marker != 0xFF:
-                    _trace("Reading SQSL array element")
-                    _, data = self._read_script_data(data)
-                    marker, post_marker_data = read_uint8(data)
-                _trace("No more SQSL array elements")
-                data = post_marker_data
-            case 3:
-                marker, post_marker_data = read_uint8(data)
-                while marker != 0xFF:
-                    _trace("Reading SQSL table key")
-                    _, data = self._read_script_data(data)
-                    _trace("Reading SQSL table value")
-                    _, data = self._read_script_data(data)
-                    marker, post_marker_data = read_uint8(data)
-                _trace("No more SQSL table elements")
-                data = post_marker_data
-            case 4:
-                _, data = read_uint8(data)
-            case 5:
-                pass
-            case _ as x:
-                raise Exception("Unhandled SQSL field type", x)
-
-        return (None, data)
+        if fixed_width != 0:
+            ops.append(_skip_field(fixed_width))
+
+        empty_row = dict.fromkeys(key for _, key in self.structs[struct_name])
+
+        def decode_row_struct(cursor: Cursor) -> ChTableReader.Row:
+            row = empty_row.copy()
+            for op in ops:
+                op(cursor, row)
+            return row
+
+        return decode_row_struct
+
+    def _read_script_data(self, cursor: Cursor) -> None:
+        """
+        Skip over SQSL data, as saved by ScriptInstance::SaveObject. Scripts can nest
+        arrays and tables as deep as they like, so rather than recursing, keep a stack
+        of the ones that are still open.
+        """
+        buf = cursor.buf
+        pos = cursor.pos
+        stack: list[int] = []
+        try:
+            while True:
+                field_type = buf[pos]
+                pos += 1
+                match field_type:
+                    case 0:
+                        pos += 8
+                    case 1:
+                        pos += 1 + buf[pos]
+                    case 2:
+                        stack.append(SQSL_ARRAY)
+                        continue
+                    case 3:
+                        stack.append(SQSL_TABLE_KEY)
+                        continue
+                    case 4:
+                        pos += 1
+                    case 5:
+                        pass
+                    case 0xFF if len(stack) != 0 and stack[-1] != SQSL_TABLE_VALUE:
+                        stack.pop()
+                    case 0xFF:
+                        raise Exception("Unexpected end of SQSL array or table")
+                    case _ as x:
+                        raise Exception("Unhandled SQSL field type", x)
+
+                # A whole value has been read
+                if len(stack) == 0:
+                    break
+                if stack[-1] == SQSL_TABLE_KEY:
+                    stack[-1] = SQSL_TABLE_VALUE
+                elif stack[-1] == SQSL_TABLE_VALUE:
+                    stack[-1] = SQSL_TABLE_KEY
+        except IndexError:
+            raise PacketTooShort from None
+        if pos > len(buf):
+            raise PacketTooShort
+        cursor.pos = pos
 
 
 @dataclass
 class ChTable:
     elements: list[dict[str, Any]]
+    structs: dict[ChTableReader.StructKey, ChTableReader.Header] = field(
+        default_factory=dict, repr=False
+    )
 
     @staticmethod
-    def create(data: memoryview, special: bool) -> tuple[ChTable, memoryview]:
+    def parse(special: bool, skip_script_data: bool = False) -> Parser[ChTable]:
         elements: list[dict[str, Any]] = []
         reader = ChTableReader()
-        data = reader.read_header(data)
+        yield from reader.parse_header()
         reader.special = special
+        reader.skip_script_data = skip_script_data
         while True:
-            row_size, data = gamma(data)
+            row_size = yield from parse_gamma()
             if row_size == 0:
                 break
-            row, data = reader.read_row(row_size, data)
+            row = reader.read_row(row_size, Cursor((yield row_size - 1)))
             elements.append(row)
-        return ChTable(elements=elements), data
+        return ChTable(elements=elements, structs=reader.structs)
 
 
 @dataclass
 class ChSparseTable:
     elements: dict[int, dict[str, Any]]
+    structs: dict[ChTableReader.StructKey, ChTableReader.Header] = field(
+        default_factory=dict, repr=False
+    )
 
     @staticmethod
-    def create(data: memoryview) -> tuple[ChSparseTable, memoryview]:
+    def parse() -> Parser[ChSparseTable]:
         elements: dict[int, dict[str, Any]] = {}
         reader = ChTableReader()
-        data = reader.read_header(data)
+        yield from reader.parse_header()
         while True:
-            total_row_size, data = gamma(data)
+            total_row_size = yield from parse_gamma()
             if total_row_size == 0:
                 break
-            last_data_len = len(data)
-            idx, data = gamma(data)
+            cursor = Cursor((yield total_row_size - 1))
+            idx = cursor.read_gamma()
             _trace("Set table index to %d", idx)
-            row_size = total_row_size - last_data_len + len(data)
-            row, data = reader.read_row(row_size, data)
-            elements[idx] = row
-        return ChSparseTable(elements=elements), data
+            elements[idx] = reader.read_row(cursor.remaining() + 1, cursor)
+        return ChSparseTable(elements=elements, structs=reader.structs)
 
 
-class SaveloadBuffer:
-    """TODO use incremental decompression"""
+def skip_table() -> Parser[None]:
+    """Skip over a table or sparse table without decoding its header or rows"""
+    header_size = yield from parse_gamma()
+    _trace("Skipping table header of size %d", header_size - 1)
+    yield -(header_size - 1)
+    while True:
+        row_size = yield from parse_gamma()
+        if row_size == 0:
+            return
+        yield -(row_size - 1)
+
+
+class ByteQueue:
+    """
+    FIFO of decompressed byte pieces. Reads are handed out as contiguous views into
+    the stored pieces, and only get copied when they straddle a piece boundary.
+    """
 
     def __init__(self) -> None:
-        self.buf: list[int] = []
+        self.pieces: deque[bytes] = deque()
+        self.offset = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, b: bytes) -> None:
+        if len(b) != 0:
+            self.pieces.append(b)
+            self.size += len(b)
+
+    def take(self, n: int) -> memoryview:
+        if n == 0:
+            # Empty rows and chunks, possibly with nothing left to read
+            return memoryview(b"")
+        if n > self.size:
+            raise PacketTooShort
+        self.size -= n
+
+        first = self.pieces[0] if len(self.pieces) != 0 else b""
+        end = self.offset + n
+        if end <= len(first):
+            view = memoryview(first)[self.offset : end]
+            self._advance(end)
+            return view
+
+        joined = bytearray()
+        while len(joined) < n:
+            piece = self.pieces[0]
+            end = min(len(piece), self.offset + n - len(joined))
+            joined += memoryview(piece)[self.offset : end]
+            self._advance(end)
+        return memoryview(joined)
+
+    def skip(self, n: int) -> int:
+        """Discard up to n bytes, returning how many were actually discarded"""
+        skipped = 0
+        while skipped < n and len(self.pieces) != 0:
+            end = min(len(self.pieces[0]), self.offset + n - skipped)
+            skipped += end - self.offset
+            self._advance(end)
+        self.size -= skipped
+        return skipped
+
+    def _advance(self, end: int) -> None:
+        if end == len(self.pieces[0]):
+            self.pieces.popleft()
+            self.offset = 0
+        else:
+            self.offset = end
 
-    def append(self, b: memoryview) -> None:
-        self.buf.extend(b)
 
-    def to_bytes(self) -> bytes:
-        return bytes(self.buf)
+class SaveloadBuffer:
+    """
+    Decompresses and parses a savegame as it is being downloaded, so that by the time
+    the last piece of map data arrives, most of the chunks are already decoded.
+
+    If wanted_chunks is set, only those chunks are decoded, everything else is skipped
+    over, and the rest of the map data is ignored once all of them have been read.
+
+    Table chunks in columnar_chunks are decoded into NumPy arrays, one per field,
+    instead of into a dict per row. This needs NumPy to be installed.
+
+    The script data in AIPL and GSDT rows is checked to be well-formed, unless
+    skip_script_data is set, in which case it is jumped over using the row size.
+
+    With a profiler, where the time and memory go is recorded for every chunk.
+    """
+
+    def __init__(
+        self,
+        wanted_chunks: Optional[set[str]] = None,
+        columnar_chunks: Optional[set[str]] = None,
+        skip_script_data: bool = False,
+        profiler: Optional[SaveloadProfiler] = None,
+    ) -> None:
+        self.wanted_chunks = wanted_chunks
+        self.skip_script_data = skip_script_data
+        self.profiler = profiler
+        self.columnar_chunks = columnar_chunks or set()
+        if self.columnar_chunks:
+            # Rather fail now than halfway through the map if NumPy is missing
+            importlib.import_module(".columnar", __package__)
+        self.header = b""
+        self.decompressor: Optional[StreamDecompressor] = None
+        self.pending = ByteQueue()
+        self.chunks: dict[str, Any] = {}
+        self.parser: Optional[Parser[None]] = self._parse_chunks()
+        self.needed = next(self.parser)
+
+    @property
+    def is_complete(self) -> bool:
+        """Whether all the chunks have been read, so that no more data is needed"""
+        return self.parser is None
+
+    def append(self, b: memoryview) -> None:
+        if self.is_complete and self.wanted_chunks is not None:
+            # Got everything that is wanted, don't even decompress the rest
+            return
+        if self.decompressor is None:
+            missing = SAVELOAD_HEADER_SIZE - len(self.header)
+            self.header += b[:missing].tobytes()
+            b = b[missing:]
+            if len(self.header) < SAVELOAD_HEADER_SIZE:
+                return
+            self.decompressor = self._read_header()
+            if self.profiler is not None:
+                self.decompressor = self.profiler.time_decompressor(self.decompressor)
+
+        if self.profiler is not None:
+            self.profiler.compressed += len(b)
+        for piece in self.decompressor.decompress(b):
+            if self.is_complete and self.wanted_chunks is not None:
+                return
+            self._feed(piece)
 
     def decode(self) -> dict[str, Any]:
-        raw_data = memoryview(self.to_bytes())
-        compression, raw_data = read_bytes(raw_data, 4)
-        version, raw_data = read_uint16(raw_data)
-        _, raw_data = read_uint16(raw_data)
+        if self.decompressor is None:
+            raise Exception("Unexpected end of data, savegame header is incomplete")
+        if self.parser is not None:
+            raise Exception("Unexpected end of data, savegame is incomplete")
+        if self.wanted_chunks is None and len(self.pending) != 0:
+            raise Exception(
+                "Unexpected end of data, still got ", len(self.pending), " bytes to go"
+            )
+        return self.chunks
+
+    def _read_header(self) -> StreamDecompressor:
+        data = memoryview(self.header)
+        compression, data = read_bytes(data, 4)
+        version, data = read_uint16(data)
+        _, data = read_uint16(data)
         if version < MIN_SAVELOAD_VERSION:
             raise Exception("Unsupported version ", version)
 
-        match compression:
-            case b"OTTN":
-                data = raw_data
-            case b"OTTX":
-                decompressed_data = lzma.decompress(raw_data)
-                data = memoryview(decompressed_data)
-            case _:
-                raise Exception("Unsupported compression mode ", compression)
+        return create_decompressor(compression)
+
+    def _feed(self, data: bytes) -> None:
+        self.pending.append(data)
+        while self.parser is not None:
+            if self.needed < 0:
+                self.needed += self.pending.skip(-self.needed)
+                if self.needed < 0:
+                    break
+                unit = memoryview(b"")
+            elif self.needed <= len(self.pending):
+                unit = self.pending.take(self.needed)
+            else:
+                break
+
+            try:
+                self.needed = self.parser.send(unit)
+            except StopIteration:
+                self.parser = None
 
-        chunks: dict[str, Any] = {}
+    def _parse_chunks(self) -> Parser[None]:
         while True:
-            chunk_name, data = read_bytes(data, 4)
+            chunk_name = (yield 4).tobytes()
             if chunk_name == b"\x00\x00\x00\x00":
-                if len(data) != 0:
-                    raise Exception(
-                        "Unexpected end of data, still got ", len(data), " bytes to go"
-                    )
-                return chunks
+                return
 
             _trace("Got header %s", chunk_name)
-            chunk_type, data = read_uint8(data)
+            chunk_type = (yield 1)[0]
+            name = chunk_name.decode("UTF-8")
+            if self.profiler is not None:
+                self.profiler.chunk_started(name, chunk_type, len(self.pending))
+            if self.wanted_chunks is not None and name not in self.wanted_chunks:
+                match chunk_type & 0xF:
+                    case 0:
+                        yield from ChRiff.skip(chunk_type)
+                    case 3 | 4:
+                        yield from skip_table()
+                    case _ as x:
+                        raise Exception("Unhandled chunk type ", x)
+                if self.profiler is not None:
+                    self.profiler.chunk_finished(None, len(self.pending))
+                continue
+
             chunk: Any
             match chunk_type & 0xF:
                 case 0:
-                    chunk, data = ChRiff.create(chunk_type, data)
+                    chunk = yield from ChRiff.parse(chunk_type)
+                case 3 | 4 as x if name in self.columnar_chunks:
+                    from .columnar import ChColumns
+
+                    chunk = yield from ChColumns.parse(
+                        x == 4, chunk_name in SPECIAL_CHUNKS
+                    )
                 case 3:
-                    chunk, data = ChTable.create(data, chunk_name in SPECIAL_CHUNKS)
+                    chunk = yield from ChTable.parse(
+                        chunk_name in SPECIAL_CHUNKS, self.skip_script_data
+                    )
                 case 4:
-                    chunk, data = ChSparseTable.create(data)
-            chunks[chunk_name.decode("UTF-8")] = chunk
-
-
-def gamma(data: memoryview) -> tuple[int, memoryview]:
-    res, data = read_uint8(data)
-    mask = 0x80
-    while res & mask != 0:
-        next_byte, data = read_uint8(data)
-        res = ((res & ~mask) << 8) | next_byte
-        mask <<= 7
-    return res, data
+                    chunk = yield from ChSparseTable.parse()
+                case _ as x:
+                    raise Exception("Unhandled chunk type ", x)
+            self.chunks[name] = chunk
+            if self.profiler is not None:
+                self.profiler.chunk_finished(chunk, len(self.pending))
+            if (
+                self.wanted_chunks is not None
+                and self.wanted_chunks <= self.chunks.keys()
+            ):
+                _trace("Got all wanted chunks")
+                return
 
 
-def read_uint24(data: memoryview) -> tuple[int, memoryview]:
-    try:
-        buf = b"\x00" + bytes(data[:3])
-        value = struct.unpack_from(">I", buf, 0)
-    except struct.error:
-        raise PacketTooShort from None
-    return value[0], data[3:]
+@dataclass
+class ChunkProfile:
+    name: str
+    type: str
+    compressed: int
+    decompressed: int
+    rows: Optional[int]
+    struct_depth: Optional[int]
+    parse_time: float
+    allocated: Optional[int]
+    skipped: bool
+
+
+class SaveloadProfiler:
+    """
+    Records how long every chunk takes to parse and how much memory it needs, with
+    decompression timed separately. Chunks don't line up with what the decompressor
+    is fed, so the compressed size of a chunk is only as precise as the size of the
+    pieces passed to SaveloadBuffer.append. With trace_memory, allocations are
+    traced by tracemalloc, which slows everything down.
+    """
+
+    def __init__(self, trace_memory: bool = True) -> None:
+        self.trace_memory = trace_memory
+        self.chunks: list[ChunkProfile] = []
+        self.compressed = 0
+        self.decompressed = 0
+        self.decompress_time = 0.0
+        self.start_time = time.perf_counter()
+        if trace_memory:
+            tracemalloc.start()
+
+    def time_decompressor(self, decompressor: StreamDecompressor) -> StreamDecompressor:
+        profiler = self
+
+        class TimedDecompressor:
+            def decompress(self, data: memoryview) -> Iterator[bytes]:
+                pieces = decompressor.decompress(data)
+                while True:
+                    start = time.perf_counter()
+                    piece = next(pieces, None)
+                    profiler.decompress_time += time.perf_counter() - start
+                    if piece is None:
+                        return
+                    profiler.decompressed += len(piece)
+                    yield piece
+
+        return TimedDecompressor()
+
+    def chunk_started(self, name: str, chunk_type: int, pending: int) -> None:
+        # The chunk name and type have been read already
+        self.chunk_decompressed = self.decompressed - pending - 5
+        self.chunk_compressed = self.compressed
+        self.chunk_name = name
+        self.chunk_type = chunk_type
+        self.chunk_decompress_time = self.decompress_time
+        self.chunk_start_time = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self.chunk_start_memory = tracemalloc.get_traced_memory()[0]
+
+    def chunk_finished(self, chunk: Any, pending: int) -> None:
+        elapsed = time.perf_counter() - self.chunk_start_time
+        rows = None
+        struct_depth = None
+        if hasattr(chunk, "structs"):
+            rows = len(chunk.index if hasattr(chunk, "index") else chunk.elements)
+            struct_depth = max(len(key) for key in chunk.structs) + 1
+        self.chunks.append(
+            ChunkProfile(
+                name=self.chunk_name,
+                type=CHUNK_TYPE_NAMES.get(self.chunk_type & 0xF, "UNKNOWN"),
+                compressed=self.compressed - self.chunk_compressed,
+                decompressed=self.decompressed - pending - self.chunk_decompressed,
+                rows=rows,
+                struct_depth=struct_depth,
+                parse_time=elapsed
+                - (self.decompress_time - self.chunk_decompress_time),
+                allocated=(
+                    tracemalloc.get_traced_memory()[1] - self.chunk_start_memory
+                    if self.trace_memory
+                    else None
+                ),
+                skipped=chunk is None,
+            )
+        )
+
+    def stop(self) -> None:
+        self.total_time = time.perf_counter() - self.start_time
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "chunks": [asdict(chunk) for chunk in self.chunks],
+            "compressed": self.compressed,
+            "decompressed": self.decompressed,
+            "decompress_time": self.decompress_time,
+            "parse_time": sum(chunk.parse_time for chunk in self.chunks),
+            "total_time": self.total_time,
+        }
+
+    def report(self) -> str:
+        lines = [
+            f"{'chunk':5} {'type':12} {'compressed':>11} {'decompressed':>12}"
+            f" {'rows':>8} {'depth':>5} {'parse ms':>9} {'alloc KiB':>10}"
+        ]
+        for chunk in sorted(self.chunks, key=lambda c: c.parse_time, reverse=True):
+            lines.append(
+                f"{chunk.name:5} {chunk.type + ('*' if chunk.skipped else ''):12}"
+                f" {chunk.compressed:11d} {chunk.decompressed:12d}"
+                f" {'' if chunk.rows is None else chunk.rows:>8}"
+                f" {'' if chunk.struct_depth is None else chunk.struct_depth:>5}"
+                f" {chunk.parse_time * 1000:9.1f}"
+                f" {'' if chunk.allocated is None else chunk.allocated >> 10:>10}"
+            )
+        totals = self.to_json()
+        lines.append("")
+        lines.append(f"decompression: {totals['decompress_time'] * 1000:10.1f} ms")
+        lines.append(f"parsing:       {totals['parse_time'] * 1000:10.1f} ms")
+        lines.append(f"total:         {totals['total_time'] * 1000:10.1f} ms")
+        if any(chunk.skipped for chunk in self.chunks):
+            lines.append("* skipped without decoding")
+        return "\n".join(lines)
+
+
+def parse_gamma() -> Parser[int]:
+    first = (yield 1)[0]
+    if first < 0x80:
+        return first
+    extra = 1 if first < 0xC0 else 2 if first < 0xE0 else 3 if first < 0xF0 else 4
+    res = first & (0x7F >> extra)
+    for next_byte in (yield extra):
+        res = (res << 8) | next_byte
+    return res
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=LOGLEVEL_TRACE)
-    saveload = SaveloadBuffer()
-    with open(sys.argv[1], "rb") as f:
-        saveload.append(memoryview(f.read()))
-    saveload.decode()
+    parser = argparse.ArgumentParser(
+        description="Decode a savegame, logging as it goes"
+    )
+    parser.add_argument("savegame")
+    parser.add_argument(
+        "--columnar",
+        action="append",
+        metavar="CHUNK",
+        help="decode this table chunk into NumPy arrays, and log their shapes",
+    )
+    parser.add_argument(
+        "--chunk", action="append", help="only decode these chunks, skip the rest"
+    )
+    parser.add_argument("--skip-script-data", action="store_true")
+    parser.add_argument(
+        "--profile",
+        choices=["table", "json"],
+        help="instead of logging, report where the time and memory go per chunk",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="don't trace memory when profiling, which makes the timings more accurate",
+    )
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile is not None:
+        logging.basicConfig(level=logging.INFO)
+        profiler = SaveloadProfiler(trace_memory=not args.no_memory)
+    else:
+        logging.basicConfig(level=LOGLEVEL_TRACE)
+    saveload = SaveloadBuffer(
+        wanted_chunks=set(args.chunk) if args.chunk else None,
+        columnar_chunks=set(args.columnar or []),
+        skip_script_data=args.skip_script_data,
+        profiler=profiler,
+    )
+    with open(args.savegame, "rb") as f:
+        savegame = memoryview(f.read())
+    # Feed the savegame the size of MAP_DATA packets, like when it is downloaded
+    for offset in range(0, len(savegame), SEND_TCP_MTU - 3):
+        saveload.append(savegame[offset : offset + SEND_TCP_MTU - 3])
+    chunks = saveload.decode()
+
+    if profiler is not None:
+        profiler.stop()
+        if args.profile == "json":
+            print(json.dumps(profiler.to_json(), indent=2))
+        else:
+            print(profiler.report())
+    for name, chunk in chunks.items():
+        if name in saveload.columnar_chunks:
+            for field_name, column in chunk.columns.items():
+                logger.info(
+                    "%s.%s: %s %s", name, field_name, column.dtype, column.shape
+                )
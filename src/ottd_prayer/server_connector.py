@@ -1,34 +1,121 @@
 import asyncio
 import logging
+from dataclasses import asdict
+from functools import partial
+from typing import Optional, cast
 
+from . import metrics
 from .bot_structures import RemoteServer
+from .cache import JsonCache
 from .client_runner import run_client
 from .config import AutoReconnectCondition, Config
+from .coordinator_protocol import CoordinatorProtocol
 from .game_protocol import GameProtocol
-from .prayer_bot import PrayerBot
+from .ip_finder import IpFinder
+from .prayer_bot import BotCaches, PrayerBot
+from .recording import recording_filename
 
 logger = logging.getLogger(__name__)
 
 
+async def run_bot(config: Config, loop: asyncio.AbstractEventLoop) -> None:
+    await connect_to_server(
+        config, loop, ServerAddressFinder(config, loop), BotCaches.for_config(config)
+    )
+
+
+class ServerAddressFinder:
+    """
+    Finds the address of the server, asking the coordinator for it if the server
+    is given by invite code. The address is reused for every reconnect, and is
+    cached on disk for invite_code_cache_ttl seconds, so that restarting doesn't go
+    through the coordinator every time either. The coordinator is only asked again
+    if the server can't be reached at an address that was reused.
+    """
+
+    def __init__(self, config: Config, loop: asyncio.AbstractEventLoop) -> None:
+        self.config = config
+        self.loop = loop
+        self.cache = JsonCache(config.bot.cache_file("server_addresses.json"))
+        self.address: Optional[RemoteServer] = None
+        self.is_reused = False
+
+    async def find(self) -> RemoteServer:
+        server = self.config.server
+        if server.server_host is not None:
+            return RemoteServer(server.server_host, server.server_port)
+
+        invite_code = cast(str, server.invite_code)
+        ttl = self.config.bot.invite_code_cache_ttl
+        if self.address is None and ttl > 0:
+            cached_address = self.cache.get(invite_code, max_age=ttl)
+            if cached_address is not None:
+                logger.debug("Using cached address of %s", invite_code)
+                self.address = RemoteServer(**cached_address)
+        if self.address is not None:
+            self.is_reused = True
+            return self.address
+
+        self.is_reused = False
+        ip_finder = await run_client(
+            self.loop,
+            RemoteServer(
+                self.config.ottd.coordinator_host, self.config.ottd.coordinator_port
+            ),
+            IpFinder(self.config),
+            CoordinatorProtocol,
+            IpFinder.set_protocol_and_query,
+        )
+        if ip_finder.remote_server is None:
+            raise Exception("Remote server was not set")
+        self.address = ip_finder.remote_server
+        if ttl > 0:
+            self.cache.set(invite_code, asdict(self.address))
+        return self.address
+
+    def invalidate(self) -> bool:
+        """
+        Forget the address if it was reused, returning whether it was, in which case
+        the coordinator should be asked for it again
+        """
+        if not self.is_reused:
+            return False
+        self.cache.invalidate(cast(str, self.config.server.invite_code))
+        self.address = None
+        self.is_reused = False
+        return True
+
+
 async def connect_to_server(
-    config: Config, loop: asyncio.AbstractEventLoop, remote_server: RemoteServer
+    config: Config,
+    loop: asyncio.AbstractEventLoop,
+    address_finder: ServerAddressFinder,
+    caches: BotCaches,
 ) -> None:
     while True:
         reconnect_count = 1
+        remote_server = await address_finder.find()
 
         while True:
             try:
                 logger.info("Attempt %d to connect to remote server", reconnect_count)
+                record_file = None
+                if config.bot.record_dir:
+                    record_file = recording_filename(config.bot.record_dir)
                 bot = await run_client(
                     loop,
                     remote_server,
-                    PrayerBot(config),
-                    GameProtocol,
+                    PrayerBot(config, caches),
+                    partial(GameProtocol, record_file=record_file),
                     PrayerBot.set_protocol_and_join,
                 )
                 break
             except ConnectionRefusedError as e:
                 logger.error("Cannot connect to remote server: %s", e)
+                if address_finder.invalidate():
+                    logger.info("Server address is stale, looking it up again")
+                    remote_server = await address_finder.find()
+                    continue
 
             reconnect_count += 1
             if (
@@ -37,12 +124,21 @@ async def connect_to_server(
                 or reconnect_count > config.bot.reconnect_count
             ):
                 raise Exception("Connection to remote server lost")
+            if metrics.enabled:
+                metrics.reconnects.inc(
+                    (
+                        metrics.current_bot.get(),
+                        AutoReconnectCondition.CONNECTION_LOST.value,
+                    )
+                )
 
             await _sleep(config)
 
         if not bot.should_reconnect:
             logger.warning("Not reconnecting any more")
             return
+        if metrics.enabled:
+            metrics.reconnects.inc((metrics.current_bot.get(), bot.disconnect_reason))
 
         await _sleep(config)
 
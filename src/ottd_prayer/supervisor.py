@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from dataclasses import dataclass, field, replace
+from multiprocessing.context import SpawnProcess
+from multiprocessing.queues import Queue
+from typing import Optional
+
+from .config import Config, FleetConfig, Server, load_config
+from .event_loop import run
+from .fleet import BotState, Fleet, add_bot_context_filter, bot_name, start_profiler
+from .map_decoder import shutdown_decode_pool
+from .metrics import start_exporter
+
+logger = logging.getLogger(__name__)
+SUPERVISOR_LOG_FORMAT = "%(levelname)s:%(processName)s:%(bot)s:%(name)s:%(message)s"
+# Longest time to wait before restarting a crashed worker, in seconds
+MAX_RESTART_WAIT = 60
+# Workers that ran for this long before crashing start counting restarts afresh
+STABLE_RUN_TIME = 600
+
+
+@dataclass
+class WorkerStatus:
+    index: int
+    pid: int
+    # States of the bots by their number in the fleet
+    bots: dict[int, BotState]
+    cpu_time: float
+
+
+@dataclass
+class Worker:
+    """A process running a shard of the fleet, as seen by the supervisor"""
+
+    index: int
+    # Servers of the bots it runs, by their number in the fleet
+    servers: dict[int, Server]
+    process: Optional[SpawnProcess] = None
+    # Bots moved over to the running process, a new one for every process, since a
+    # process that got killed while waiting on it leaves it locked
+    inbox: Optional["Queue[Optional[tuple[int, Server]]]"] = None
+    restarts: int = 0
+    restart_at: Optional[float] = None
+    retired: bool = False
+    status: Optional[WorkerStatus] = None
+    started_at: float = field(default_factory=time.monotonic)
+
+
+class Supervisor:
+    """
+    Runs a fleet of bots over several worker processes, so that decoding maps and
+    talking to servers is spread over CPU cores. Servers are split into one shard
+    per worker. A worker that crashes is restarted with all of its bots, waiting
+    longer after every crash. Once a worker has crashed more than max_restarts
+    times in a row, it is retired and its bots are handed to the least busy
+    workers left. So are bots handed to a worker that was already on its way out.
+    """
+
+    def __init__(
+        self,
+        fleet_config: FleetConfig,
+        workers: int,
+        max_restarts: int,
+        status_interval: float,
+    ) -> None:
+        self.fleet_config = fleet_config
+        self.max_restarts = max_restarts
+        self.status_interval = status_interval
+        self.context = multiprocessing.get_context("spawn")
+        self.status_queue: Queue[WorkerStatus] = self.context.Queue()
+
+        workers = max(1, min(workers, len(fleet_config.servers)))
+        self.workers = [
+            Worker(
+                index=i,
+                servers={
+                    bot: server
+                    for bot, server in enumerate(fleet_config.servers)
+                    if bot % workers == i
+                },
+            )
+            for i in range(workers)
+        ]
+
+    def run(self) -> None:
+        logger.info(
+            "Running %d bots in %d workers",
+            len(self.fleet_config.servers),
+            len(self.workers),
+        )
+        for worker in self.workers:
+            self._start(worker)
+
+        next_status_log = time.monotonic() + self.status_interval
+        try:
+            while any(self._is_active(worker) for worker in self.workers):
+                self._collect_status(timeout=1)
+                for worker in self.workers:
+                    self._check(worker)
+                if time.monotonic() >= next_status_log:
+                    self._log_status()
+                    next_status_log += self.status_interval
+        finally:
+            for worker in self.workers:
+                if worker.process is not None and worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join()
+        logger.info("All bots stopped")
+
+    def _start(self, worker: Worker) -> None:
+        # Servers moved to the worker so far are in worker.servers already
+        worker.inbox = self.context.Queue()
+        worker.process = self.context.Process(
+            target=run_worker,
+            args=(
+                worker.index,
+                replace(self.fleet_config, servers=list(worker.servers.values())),
+                list(worker.servers),
+                worker.inbox,
+                self.status_queue,
+                self.status_interval,
+            ),
+            name="worker-%d" % worker.index,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        logger.info(
+            "Started worker %d (pid %d) with %d bots",
+            worker.index,
+            worker.process.pid,
+            len(worker.servers),
+        )
+
+    def _is_active(self, worker: Worker) -> bool:
+        if worker.retired:
+            return False
+        if worker.restart_at is not None:
+            return True
+        return worker.process is not None and (
+            worker.process.is_alive() or worker.process.exitcode != 0
+        )
+
+    def _collect_status(self, timeout: float) -> None:
+        try:
+            status = self.status_queue.get(timeout=timeout)
+            while True:
+                self.workers[status.index].status = status
+                status = self.status_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _check(self, worker: Worker) -> None:
+        if worker.retired or worker.process is None:
+            return
+        if worker.restart_at is not None:
+            if time.monotonic() >= worker.restart_at:
+                self._start(worker)
+            return
+        if worker.process.is_alive():
+            return
+        if worker.process.exitcode == 0:
+            self._move_untaken(worker)
+            return
+
+        worker.status = None
+        if time.monotonic() - worker.started_at >= STABLE_RUN_TIME:
+            worker.restarts = 0
+        worker.restarts += 1
+        if worker.restarts > self.max_restarts:
+            logger.error(
+                "Worker %d crashed %d times, retiring it",
+                worker.index,
+                worker.restarts,
+            )
+            worker.retired = True
+            self._move(worker.servers, worker)
+            worker.servers = {}
+            return
+        wait = min(2**worker.restarts, MAX_RESTART_WAIT)
+        logger.warning(
+            "Worker %d exited with code %d, restarting it in %d seconds",
+            worker.index,
+            worker.process.exitcode,
+            wait,
+        )
+        worker.restart_at = time.monotonic() + wait
+
+    def _move_untaken(self, finished: Worker) -> None:
+        """
+        Bots moved to a worker that was already stopping never ran there, so move
+        them on to another one
+        """
+        # Its last status has to be in, to know which bots it took
+        self._collect_status(timeout=0)
+        if finished.status is None:
+            return
+        untaken = {
+            bot: server
+            for bot, server in finished.servers.items()
+            if bot not in finished.status.bots
+        }
+        if len(untaken) != 0:
+            self._move(untaken, finished)
+            for bot in untaken:
+                del finished.servers[bot]
+
+    def _move(self, servers: dict[int, Server], source: Worker) -> None:
+        live_workers = [
+            worker
+            for worker in self.workers
+            if worker is not source
+            and not worker.retired
+            and worker.process is not None
+            and worker.process.is_alive()
+            and worker.restart_at is None
+            and (worker.status is None or _running_bots(worker) != 0)
+        ]
+        if len(live_workers) == 0:
+            logger.error("No workers left to take over %d bots", len(servers))
+            return
+
+        for bot, server in servers.items():
+            worker = min(live_workers, key=_running_bots)
+            logger.info("Moving %s to worker %d", bot_name(server), worker.index)
+            worker.servers[bot] = server
+            assert worker.inbox is not None
+            worker.inbox.put((bot, server))
+            if worker.status is not None:
+                worker.status.bots[bot] = BotState.RUNNING
+
+    def _log_status(self) -> None:
+        for worker in self.workers:
+            if worker.retired:
+                logger.info("Worker %d: retired", worker.index)
+                continue
+            status = worker.status
+            if status is None:
+                logger.info("Worker %d: starting", worker.index)
+                continue
+            states = list(status.bots.values())
+            logger.info(
+                "Worker %d (pid %d): %s, %.1fs of CPU, %d restarts",
+                worker.index,
+                status.pid,
+                ", ".join(
+                    "%d %s" % (states.count(state), state.value.lower())
+                    for state in BotState
+                ),
+                status.cpu_time,
+                worker.restarts,
+            )
+
+
+def _running_bots(worker: Worker) -> int:
+    if worker.status is None:
+        return len(worker.servers)
+    return list(worker.status.bots.values()).count(BotState.RUNNING)
+
+
+def run_worker(
+    index: int,
+    fleet_config: FleetConfig,
+    bots: list[int],
+    inbox: "Queue[Optional[tuple[int, Server]]]",
+    status_queue: "Queue[WorkerStatus]",
+    status_interval: float,
+) -> None:
+    logging.basicConfig(level=fleet_config.bot.log_level, format=SUPERVISOR_LOG_FORMAT)
+    try:
+        run(
+            _run_worker(
+                index, fleet_config, bots, inbox, status_queue, status_interval
+            ),
+            fleet_config.bot.event_loop,
+        )
+    finally:
+        shutdown_decode_pool()
+
+
+async def _run_worker(
+    index: int,
+    fleet_config: FleetConfig,
+    bots: list[int],
+    inbox: "Queue[Optional[tuple[int, Server]]]",
+    status_queue: "Queue[WorkerStatus]",
+    status_interval: float,
+) -> None:
+    add_bot_context_filter()
+    loop = asyncio.get_running_loop()
+    fleet = Fleet(fleet_config)
+    metrics_port = fleet_config.bot.metrics_port
+    if metrics_port is not None:
+        # Every worker has its own metrics, on the ports after metrics_port
+        await start_exporter(fleet_config.bot.metrics_host, metrics_port + index)
+    profile_file = fleet_config.bot.profile_file
+    profiler_task = None
+    if profile_file:
+        # Every worker writes its own profile
+        profiler_task = start_profiler(
+            fleet_config.bot, "%s.worker-%d" % (profile_file, index)
+        )
+
+    def report() -> None:
+        status_queue.put(
+            WorkerStatus(
+                index=index,
+                pid=os.getpid(),
+                bots=dict(fleet.states),
+                cpu_time=time.process_time(),
+            )
+        )
+
+    async def report_status() -> None:
+        while True:
+            await asyncio.sleep(status_interval)
+            report()
+
+    async def take_bots() -> None:
+        # Bots moved over from other workers, until None
+        while (moved := await loop.run_in_executor(None, inbox.get)) is not None:
+            bot, server = moved
+            logger.info("Taking over %s", bot_name(server))
+            fleet.add(server, bot)
+
+    for bot, server in zip(bots, fleet_config.servers):
+        fleet.add(server, bot)
+    status_task = asyncio.create_task(report_status())
+    inbox_task = asyncio.create_task(take_bots())
+    await fleet.wait()
+    status_task.cancel()
+    if profiler_task is not None:
+        profiler_task.cancel()
+        await asyncio.wait([profiler_task])
+    # The thread waiting on the inbox has to be woken up before the loop can close
+    inbox.put(None)
+    await inbox_task
+    # Bots taken over in the meantime get to run too
+    await fleet.wait()
+    report()
+
+
+def main() -> None:
+    # Workers re-run the executable when the bot is frozen
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(
+        description="Run a fleet of bots over several processes"
+    )
+    parser.add_argument("config", help="config file listing servers")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes, default: one per CPU core",
+    )
+    parser.add_argument(
+        "--max-restarts",
+        type=int,
+        default=5,
+        help="how many times a worker may crash before its bots are moved elsewhere",
+    )
+    parser.add_argument(
+        "--status-interval",
+        type=float,
+        default=60,
+        help="how often to log the status of every worker, in seconds",
+    )
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if isinstance(config, Config):
+        config = FleetConfig(servers=[config.server], bot=config.bot, ottd=config.ottd)
+
+    logging.basicConfig(level=config.bot.log_level, format=SUPERVISOR_LOG_FORMAT)
+    add_bot_context_filter()
+    Supervisor(config, args.workers, args.max_restarts, args.status_interval).run()
@@ -0,0 +1,54 @@
+"""Builds small savegames byte by byte, for the tests to decode"""
+
+import struct
+
+SAVELOAD_VERSION = 300
+
+
+def gamma(value: int) -> bytes:
+    if value < 0x80:
+        return bytes([value])
+    if value < 0x4000:
+        return struct.pack(">H", 0x8000 | value)
+    if value < 0x200000:
+        return struct.pack(">BH", 0xC0 | value >> 16, value & 0xFFFF)
+    return struct.pack(">I", 0xE0000000 | value)
+
+
+def header(*fields: tuple[int, str]) -> bytes:
+    """One struct of a table header, ended by a field of type 0"""
+    return (
+        b"".join(bytes([t]) + gamma(len(key)) + key.encode() for t, key in fields)
+        + b"\x00"
+    )
+
+
+def table(
+    name: bytes, headers: bytes, rows: list[bytes], sparse: bool = False
+) -> bytes:
+    """
+    A table chunk with the given header structs, in the order SaveloadBuffer reads
+    them, and rows without their size
+    """
+    return (
+        name
+        + (b"\x04" if sparse else b"\x03")
+        + gamma(len(headers) + 1)
+        + headers
+        + b"".join(gamma(len(row) + 1) + row for row in rows)
+        + b"\x00"
+    )
+
+
+def riff(name: bytes, data: bytes) -> bytes:
+    return name + b"\x00" + struct.pack(">I", len(data))[1:] + data
+
+
+def savegame(*chunks: bytes, compression: bytes = b"OTTN") -> bytes:
+    """An uncompressed savegame, compress the part after the header for others"""
+    return (
+        compression
+        + struct.pack(">HH", SAVELOAD_VERSION, 0)
+        + b"".join(chunks)
+        + b"\x00\x00\x00\x00"
+    )
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ottd_prayer.cache import JsonCache
+
+
+class JsonCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "sub", "cache.json")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_in_memory(self) -> None:
+        cache = JsonCache(None)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", [1, 2])
+        self.assertEqual(cache.get("a"), [1, 2])
+        self.assertIsNone(JsonCache(None).get("a"))
+
+    def test_shared_through_file(self) -> None:
+        JsonCache(self.filename).set("a", {"x": 1})
+        other = JsonCache(self.filename)
+        self.assertEqual(other.get("a"), {"x": 1})
+        # Every access re-reads the file, to see what other bots wrote
+        JsonCache(self.filename).set("b", 2)
+        self.assertEqual(other.get("b"), 2)
+        self.assertEqual(other.get("a"), {"x": 1})
+
+    def test_max_age(self) -> None:
+        cache = JsonCache(self.filename)
+        with mock.patch("time.time", return_value=1000.0):
+            cache.set("a", 1)
+        with mock.patch("time.time", return_value=1010.0):
+            self.assertEqual(cache.get("a"), 1)
+            self.assertEqual(cache.get("a", max_age=10), 1)
+            self.assertIsNone(cache.get("a", max_age=9))
+
+    def test_invalidate(self) -> None:
+        cache = JsonCache(self.filename)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        self.assertIsNone(JsonCache(self.filename).get("a"))
+        self.assertEqual(JsonCache(self.filename).get("b"), 2)
+
+    def test_unreadable_file(self) -> None:
+        os.makedirs(os.path.dirname(self.filename))
+        with open(self.filename, "w") as f:
+            f.write("{not json")
+        cache = JsonCache(self.filename)
+        with self.assertLogs("ottd_prayer.cache", "WARNING"):
+            self.assertIsNone(cache.get("a"))
+        with self.assertLogs("ottd_prayer.cache", "WARNING"):
+            cache.set("a", 1)
+        with open(self.filename) as f:
+            self.assertEqual(json.load(f)["a"]["value"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
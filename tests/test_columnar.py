@@ -0,0 +1,88 @@
+import struct
+import unittest
+from typing import Any
+
+from savegames import gamma, header, savegame, table
+
+from ottd_prayer.saveload import SaveloadBuffer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+
+def decode(chunk: bytes) -> Any:
+    saveload = SaveloadBuffer(columnar_chunks={"TEST"})
+    saveload.append(memoryview(savegame(chunk)))
+    return saveload.decode()["TEST"]
+
+
+@unittest.skipIf(np is None, "needs NumPy")
+class ColumnarTest(unittest.TestCase):
+    def assertArray(self, array: Any, expected: list[Any], dtype: str) -> None:
+        self.assertEqual(array.dtype, np.dtype(dtype))
+        self.assertEqual(array.tolist(), expected)
+
+    def test_fixed_width_rows(self) -> None:
+        rows = [struct.pack(">Ih", i * 1000, -i) for i in range(5)]
+        chunk = decode(table(b"TEST", header((6, "id"), (3, "x")), rows))
+        self.assertArray(chunk.index, [0, 1, 2, 3, 4], "int64")
+        self.assertArray(chunk.columns["id"], [0, 1000, 2000, 3000, 4000], ">u4")
+        self.assertArray(chunk.columns["x"], [0, -1, -2, -3, -4], ">i2")
+        self.assertEqual(chunk.offsets, {})
+
+    def test_variable_width_rows(self) -> None:
+        headers = (
+            header((0x1A, "name"), (0x14, "list"), (11, "pos"), (0x1B, "items"))
+            + header((2, "x"), (4, "y"))
+            + header(
+                (1, "a"),
+            )
+        )
+
+        def row(
+            name: bytes, values: list[int], x: int, y: int, items: list[int]
+        ) -> bytes:
+            return (
+                gamma(len(name))
+                + name
+                + gamma(len(values))
+                + b"".join(struct.pack(">H", v) for v in values)
+                + struct.pack(">BH", x, y)
+                + gamma(len(items))
+                + b"".join(struct.pack(">b", a) for a in items)
+            )
+
+        rows = [
+            row(b"first", [1, 2, 3], 10, 500, [-1]),
+            b"",
+            row(b"", [], 20, 600, []),
+            row(b"ab", [65535], 30, 700, [5, 6]),
+        ]
+        chunk = decode(table(b"TEST", headers, rows))
+        # The empty row is left out
+        self.assertArray(chunk.index, [0, 2, 3], "int64")
+        self.assertEqual(chunk.columns["name"].tobytes(), b"firstab")
+        self.assertArray(chunk.offsets["name"], [0, 5, 5, 7], "int64")
+        self.assertArray(chunk.columns["list"], [1, 2, 3, 65535], ">u2")
+        self.assertArray(chunk.offsets["list"], [0, 3, 3, 4], "int64")
+        self.assertArray(chunk.columns["pos.x"], [10, 20, 30], "u1")
+        self.assertArray(chunk.columns["pos.y"], [500, 600, 700], ">u2")
+        self.assertArray(chunk.columns["items.a"], [-1, 5, 6], "i1")
+        self.assertArray(chunk.offsets["items"], [0, 1, 1, 3], "int64")
+
+    def test_sparse_table(self) -> None:
+        rows = [gamma(3) + b"\x07", gamma(200) + b"\x08", gamma(9)]
+        chunk = decode(table(b"TEST", header((2, "v")), rows, sparse=True))
+        self.assertArray(chunk.index, [3, 200], "int64")
+        self.assertArray(chunk.columns["v"], [7, 8], "u1")
+
+    def test_row_size_mismatch(self) -> None:
+        rows = [gamma(2) + b"ab"]
+        with self.assertRaises(Exception):
+            decode(table(b"TEST", header((0x1A, "name"), (2, "v")), rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import lzma
+import random
+import struct
+import unittest
+import zlib
+
+from ottd_prayer.compression import (
+    DECOMPRESS_PIECE_SIZE,
+    LZO_BUFFER_SIZE,
+    LzmaDecompressor,
+    LzoDecompressor,
+    ZlibDecompressor,
+    lzo1x_decompress,
+)
+
+try:
+    from lzallright import LZOCompressor  # type: ignore
+except ImportError:
+    LZOCompressor = None
+
+# Literals, matches close by and far away, long runs, and the end of stream marker,
+# as compressed by liblzo2
+LZO_DATA = b"OpenTTD " * 40 + bytes(range(64)) + b"zz" * 100 + b"end"
+LZO_BLOCK = (
+    b"\x19OpenTTD  \x00\x18\x1c\x00\x00/"
+    + bytes(range(64))
+    + b"z \xa6\x03\x00end\x11\x00\x00"
+)
+
+
+def lzo_stream(*blocks: bytes) -> bytes:
+    """Frame compressed blocks like OpenTTD does, with their checksum and size"""
+    stream = b""
+    for block in blocks:
+        size = struct.pack(">I", len(block))
+        stream += struct.pack(">I", zlib.adler32(size + block, 0)) + size + block
+    return stream
+
+
+def decompress(decompressor: LzoDecompressor, data: bytes, piece_size: int) -> bytes:
+    out = b""
+    for offset in range(0, len(data), piece_size):
+        for piece in decompressor.decompress(
+            memoryview(data[offset : offset + piece_size])
+        ):
+            out += piece
+    return out
+
+
+class LzoTest(unittest.TestCase):
+    def test_block(self) -> None:
+        self.assertEqual(lzo1x_decompress(memoryview(LZO_BLOCK)), LZO_DATA)
+
+    def test_truncated_block(self) -> None:
+        with self.assertRaisesRegex(Exception, "overrun"):
+            lzo1x_decompress(memoryview(LZO_BLOCK[:-5]))
+
+    def test_trailing_data(self) -> None:
+        with self.assertRaisesRegex(Exception, "not fully consumed"):
+            lzo1x_decompress(memoryview(LZO_BLOCK + b"\x00"))
+
+    def test_stream_split_anywhere(self) -> None:
+        stream = lzo_stream(LZO_BLOCK, LZO_BLOCK)
+        for piece_size in (1, 7, 12, 100, len(stream)):
+            with self.subTest(piece_size=piece_size):
+                self.assertEqual(
+                    decompress(LzoDecompressor(), stream, piece_size), LZO_DATA * 2
+                )
+
+    def test_bad_checksum(self) -> None:
+        stream = bytearray(lzo_stream(LZO_BLOCK))
+        stream[0] ^= 1
+        with self.assertRaisesRegex(Exception, "checksum"):
+            decompress(LzoDecompressor(), bytes(stream), len(stream))
+
+    def test_bad_block_size(self) -> None:
+        stream = struct.pack(">II", 0, LZO_BUFFER_SIZE * 2)
+        with self.assertRaisesRegex(Exception, "block size"):
+            decompress(LzoDecompressor(), stream, len(stream))
+
+    @unittest.skipIf(LZOCompressor is None, "needs lzallright")
+    def test_round_trip(self) -> None:
+        compressor = LZOCompressor()
+        rng = random.Random(0)
+        blocks = [
+            rng.randbytes(LZO_BUFFER_SIZE),
+            bytes(LZO_BUFFER_SIZE),
+            (rng.randbytes(37) * 300)[:LZO_BUFFER_SIZE],
+            bytes(rng.choice(b"ab\x00") for _ in range(LZO_BUFFER_SIZE)),
+            b"x",
+        ]
+        for block in blocks:
+            self.assertEqual(
+                lzo1x_decompress(memoryview(compressor.compress(block))), block
+            )
+        stream = lzo_stream(*(compressor.compress(block) for block in blocks))
+        self.assertEqual(decompress(LzoDecompressor(), stream, 1460), b"".join(blocks))
+
+
+class BoundedPiecesTest(unittest.TestCase):
+    DATA = bytes(DECOMPRESS_PIECE_SIZE * 3 + 5)
+
+    def test_zlib(self) -> None:
+        pieces = list(
+            ZlibDecompressor().decompress(memoryview(zlib.compress(self.DATA)))
+        )
+        self.assertTrue(all(len(p) <= DECOMPRESS_PIECE_SIZE for p in pieces))
+        self.assertEqual(b"".join(pieces), self.DATA)
+
+    def test_lzma(self) -> None:
+        pieces = list(
+            LzmaDecompressor().decompress(memoryview(lzma.compress(self.DATA)))
+        )
+        self.assertTrue(all(len(p) <= DECOMPRESS_PIECE_SIZE for p in pieces))
+        self.assertEqual(b"".join(pieces), self.DATA)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from ottd_prayer import metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registered = list(metrics.REGISTRY)
+
+    def tearDown(self) -> None:
+        metrics.REGISTRY[:] = self.registered
+
+    def test_counter(self) -> None:
+        counter = metrics.Counter("test_total", "Things", ("bot", "packet"))
+        counter.inc(("a", "X"))
+        counter.inc(("a", "X"), 2)
+        counter.inc(("b", "Y"), 0.5)
+        self.assertEqual(
+            counter.render(),
+            [
+                "# HELP test_total Things",
+                "# TYPE test_total counter",
+                'test_total{bot="a",packet="X"} 3',
+                'test_total{bot="b",packet="Y"} 0.5',
+            ],
+        )
+
+    def test_gauge_without_labels(self) -> None:
+        gauge = metrics.Gauge("test_gauge", "Level", ())
+        gauge.set((), 4)
+        gauge.set((), 2)
+        self.assertEqual(
+            gauge.render(),
+            ["# HELP test_gauge Level", "# TYPE test_gauge gauge", "test_gauge 2"],
+        )
+
+    def test_escaped_labels(self) -> None:
+        counter = metrics.Counter("test_total", "Things", ("bot",))
+        counter.inc(('C "1"\\2\n',))
+        self.assertEqual(counter.render()[-1], 'test_total{bot="C \\"1\\"\\\\2\\n"} 1')
+
+    def test_histogram(self) -> None:
+        histogram = metrics.Histogram("test_seconds", "Time", ("bot",), (0.5, 1.0))
+        for value in (0.25, 0.5, 0.75, 2.0):
+            histogram.observe(("a",), value)
+        self.assertEqual(
+            histogram.render(),
+            [
+                "# HELP test_seconds Time",
+                "# TYPE test_seconds histogram",
+                # Buckets hold every observation up to and including their bound
+                'test_seconds_bucket{bot="a",le="0.5"} 2',
+                'test_seconds_bucket{bot="a",le="1.0"} 3',
+                'test_seconds_bucket{bot="a",le="+Inf"} 4',
+                'test_seconds_sum{bot="a"} 3.5',
+                'test_seconds_count{bot="a"} 4',
+            ],
+        )
+
+    def test_state_time(self) -> None:
+        state_time = metrics.StateTime("test_seconds_total", "Time", ("bot",))
+        with mock.patch("time.monotonic") as monotonic:
+            monotonic.return_value = 10.0
+            state_time.enter(("a",), "playing")
+            monotonic.return_value = 12.5
+            state_time.enter(("a",), "spectating")
+            monotonic.return_value = 13.0
+            state_time.enter(("a",), "playing")
+            monotonic.return_value = 16.0
+            # The time so far in the current state counts, without being recorded
+            rendered = state_time.render()
+            self.assertEqual(
+                rendered[2:],
+                [
+                    'test_seconds_total{bot="a",state="playing"} 5.5',
+                    'test_seconds_total{bot="a",state="spectating"} 0.5',
+                ],
+            )
+            self.assertEqual(state_time.render(), rendered)
+            state_time.leave(("a",))
+            monotonic.return_value = 20.0
+            self.assertEqual(state_time.render(), rendered)
+
+    def test_render(self) -> None:
+        metrics.REGISTRY.clear()
+        counter = metrics.Counter("test_total", "Things", ())
+        metrics.Gauge("test_gauge", "Level", ())
+        counter.inc(())
+        self.assertEqual(
+            metrics.render(),
+            "# HELP test_total Things\n"
+            "# TYPE test_total counter\n"
+            "test_total 1\n"
+            "# HELP test_gauge Level\n"
+            "# TYPE test_gauge gauge\n",
+        )
+
+
+class ExporterTest(unittest.TestCase):
+    def tearDown(self) -> None:
+        metrics.enabled = False
+
+    def test_serves_metrics(self) -> None:
+        async def scrape() -> bytes:
+            server = await metrics.start_exporter("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response
+
+        response = asyncio.run(scrape())
+        self.assertTrue(metrics.enabled)
+        head, body = response.split(b"\r\n\r\n", 1)
+        self.assertTrue(head.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertIn(b"Content-Length: %d\r\n" % len(body), head)
+        self.assertEqual(body, metrics.render().encode("UTF-8"))
@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+from typing import Any
+
+from ottd_prayer.decorators import Profiler
+
+
+class Receivers:
+    @staticmethod
+    def receive_PACKET_SERVER_FRAME(data: bytes) -> dict[str, Any]:
+        return {"data": data}
+
+    async def receive_PACKET_SERVER_SYNC(self) -> None:
+        pass
+
+    def helper(self) -> None:
+        pass
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.originals = dict(vars(Receivers))
+
+    def tearDown(self) -> None:
+        for name, attr in self.originals.items():
+            if name.startswith("receive_"):
+                setattr(Receivers, name, attr)
+
+    def call_receivers(self) -> None:
+        self.assertEqual(Receivers.receive_PACKET_SERVER_FRAME(b"x"), {"data": b"x"})
+        asyncio.run(Receivers().receive_PACKET_SERVER_SYNC())
+
+    def test_times_receivers(self) -> None:
+        profiler = Profiler(1.0)
+        profiler.instrument(Receivers)
+        self.assertIs(vars(Receivers)["helper"], self.originals["helper"])
+        self.call_receivers()
+        self.assertEqual(
+            {key: timing.samples for key, timing in profiler.timings.items()},
+            {("PACKET_SERVER_FRAME", "parse"): 1, ("PACKET_SERVER_SYNC", "handle"): 1},
+        )
+        self.assertIn("PACKET_SERVER_FRAME", profiler.summary())
+
+    def test_instrument_twice(self) -> None:
+        profiler = Profiler(1.0)
+        profiler.instrument(Receivers)
+        timed = dict(vars(Receivers))
+        profiler.instrument(Receivers)
+        Profiler(1.0).instrument(Receivers)
+        self.assertEqual(dict(vars(Receivers)), timed)
+        self.call_receivers()
+        self.assertEqual(
+            [timing.samples for timing in profiler.timings.values()], [1, 1]
+        )
+
+    def test_unsampled(self) -> None:
+        profiler = Profiler(0.0)
+        profiler.instrument(Receivers)
+        self.call_receivers()
+        self.assertEqual(
+            [timing.samples for timing in profiler.timings.values()], [0, 0]
+        )
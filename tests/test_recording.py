@@ -0,0 +1,117 @@
+import asyncio
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from ottd_prayer.recording import (
+    MAGIC,
+    Recorder,
+    ReplayTransport,
+    read_recording,
+    recording_filename,
+)
+
+
+def packet(packet_type: int, payload: bytes = b"") -> bytes:
+    return struct.pack("<HB", 3 + len(payload), packet_type) + payload
+
+
+FRAME = packet(8, b"\x01\x00\x00\x00")
+SYNC = packet(9)
+MAP = packet(11, b"x" * 1000)
+
+
+class RecordingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "sub", "bot.ottdrec")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def record(self, *packets: tuple[float, bytes]) -> None:
+        with mock.patch("time.monotonic", return_value=100.0):
+            recorder = Recorder(self.filename)
+        for now, data in packets:
+            recorder.record(data, now)
+        recorder.close()
+
+    def test_round_trip(self) -> None:
+        self.record(
+            (100.5, FRAME),
+            (100.5, SYNC),
+            (101.0, memoryview(MAP)),
+            (101.25, FRAME),
+            (101.25, FRAME),
+        )
+        # Packets recorded together are read back together
+        self.assertEqual(
+            list(read_recording(self.filename)),
+            [(0.5, FRAME + SYNC), (1.0, MAP), (1.25, FRAME + FRAME)],
+        )
+
+    def test_long_delay(self) -> None:
+        self.record((100.0, FRAME), (100000.0, SYNC))
+        (_, first), (elapsed, second) = read_recording(self.filename)
+        self.assertEqual((first, second), (FRAME, SYNC))
+        # Delays are capped at what fits in the record header
+        self.assertAlmostEqual(elapsed, ((1 << 32) - 1) / 1e6)
+
+    def test_empty(self) -> None:
+        self.record()
+        self.assertEqual(list(read_recording(self.filename)), [])
+
+    def test_truncated(self) -> None:
+        self.record((100.5, FRAME), (101.0, MAP))
+        with open(self.filename, "rb") as f:
+            data = f.read()
+        for end in (len(data) - 1, len(data) - len(MAP) - 2):
+            with self.subTest(end=end):
+                with open(self.filename, "wb") as f:
+                    f.write(data[:end])
+                with self.assertLogs("ottd_prayer.recording", "WARNING"):
+                    self.assertEqual(
+                        list(read_recording(self.filename)), [(0.5, FRAME)]
+                    )
+
+    def test_not_a_recording(self) -> None:
+        filename = os.path.join(self.directory.name, "map.sav")
+        with open(filename, "wb") as f:
+            f.write(b"OTTN" + b"\0" * 20)
+        with self.assertRaisesRegex(ValueError, "not a recording"):
+            list(read_recording(filename))
+
+    def test_corrupt(self) -> None:
+        self.record((100.5, FRAME))
+        with open(self.filename, "ab") as f:
+            f.write(struct.pack("<I", 0) + b"\x02\x00\x00")
+        with self.assertRaisesRegex(ValueError, "corrupt"):
+            list(read_recording(self.filename))
+
+    def test_recording_filenames_differ(self) -> None:
+        self.assertNotEqual(recording_filename("dir"), recording_filename("dir"))
+        self.assertEqual(os.path.dirname(recording_filename("dir")), "dir")
+
+    def test_header(self) -> None:
+        self.record()
+        with open(self.filename, "rb") as f:
+            self.assertEqual(f.read(), MAGIC)
+
+
+class ReplayTransportTest(unittest.TestCase):
+    def test_counts_writes(self) -> None:
+        protocol = mock.Mock(spec=asyncio.Protocol)
+        transport = ReplayTransport(protocol)
+        transport.write(FRAME)
+        transport.writelines([SYNC, MAP])
+        self.assertEqual(transport.packets_sent, 3)
+        self.assertEqual(transport.bytes_sent, len(FRAME + SYNC + MAP))
+        self.assertEqual(transport.get_extra_info("peername"), ("127.0.0.1", 0))
+
+        self.assertFalse(transport.is_closing())
+        transport.close()
+        transport.abort()
+        self.assertTrue(transport.is_closing())
+        protocol.connection_lost.assert_called_once_with(None)
@@ -0,0 +1,109 @@
+import unittest
+
+from openttd_protocol.wire.exceptions import PacketTooShort
+from savegames import header, riff, savegame, table
+
+from ottd_prayer.saveload import (
+    SAVELOAD_HEADER_SIZE,
+    ByteQueue,
+    ChTable,
+    SaveloadBuffer,
+)
+
+# A table with one string field named "a", with an empty row then a row
+SAVEGAME = savegame(table(b"TEST", header((0x1A, "a")), [b"", b"\x02hi"]))
+
+
+def decode(
+    data: bytes, pieces: list[int], wanted_chunks: set[str] | None = None
+) -> SaveloadBuffer:
+    """Feed the savegame split at the given offsets"""
+    saveload = SaveloadBuffer(wanted_chunks=wanted_chunks)
+    for start, end in zip([0] + pieces, pieces + [len(data)]):
+        saveload.append(memoryview(data[start:end]))
+    return saveload
+
+
+class ByteQueueTest(unittest.TestCase):
+    def test_take_within_a_piece_is_a_view(self) -> None:
+        queue = ByteQueue()
+        piece = b"abcdef"
+        queue.append(piece)
+        view = queue.take(3)
+        self.assertEqual(view, b"abc")
+        self.assertIs(view.obj, piece)
+        self.assertEqual(queue.take(3), b"def")
+        self.assertEqual(len(queue), 0)
+
+    def test_take_across_pieces(self) -> None:
+        queue = ByteQueue()
+        for piece in (b"ab", b"", b"c", b"defg"):
+            queue.append(piece)
+        self.assertEqual(queue.take(1), b"a")
+        self.assertEqual(queue.take(4), b"bcde")
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.take(2), b"fg")
+
+    def test_take_nothing_when_empty(self) -> None:
+        queue = ByteQueue()
+        self.assertEqual(queue.take(0), b"")
+        queue.append(b"a")
+        queue.take(1)
+        self.assertEqual(queue.take(0), b"")
+
+    def test_take_too_much(self) -> None:
+        queue = ByteQueue()
+        queue.append(b"abc")
+        with self.assertRaises(PacketTooShort):
+            queue.take(4)
+        self.assertEqual(queue.take(3), b"abc")
+
+    def test_skip(self) -> None:
+        queue = ByteQueue()
+        queue.append(b"abc")
+        queue.append(b"def")
+        self.assertEqual(queue.skip(4), 4)
+        self.assertEqual(len(queue), 2)
+        # Only what is there can be skipped, the rest is up to the caller
+        self.assertEqual(queue.skip(5), 2)
+        self.assertEqual(len(queue), 0)
+        queue.append(b"gh")
+        self.assertEqual(queue.take(2), b"gh")
+
+
+class SaveloadBufferTest(unittest.TestCase):
+    def test_split_anywhere(self) -> None:
+        for wanted_chunks in (None, {"TEST"}):
+            for split in range(1, len(SAVEGAME)):
+                with self.subTest(wanted_chunks=wanted_chunks, split=split):
+                    chunk = decode(SAVEGAME, [split], wanted_chunks).decode()["TEST"]
+                    self.assertIsInstance(chunk, ChTable)
+                    self.assertEqual(chunk.elements, [{}, {"a": b"hi"}])
+
+    def test_empty_riff_chunk(self) -> None:
+        data = savegame(riff(b"EMPT", b""), riff(b"FULL", b"xyz"))
+        for split in range(SAVELOAD_HEADER_SIZE, len(data)):
+            with self.subTest(split=split):
+                chunks = decode(data, [split]).decode()
+                self.assertEqual(chunks["EMPT"].chunk, b"")
+                self.assertEqual(chunks["FULL"].chunk, b"xyz")
+
+    def test_wanted_chunks(self) -> None:
+        data = savegame(
+            riff(b"SKIP", b"x" * 300),
+            table(b"TEST", header((0x1A, "a")), [b"\x02hi"]),
+            riff(b"REST", b"y" * 10),
+        )
+        saveload = decode(data, [20], {"TEST"})
+        self.assertTrue(saveload.is_complete)
+        self.assertEqual(list(saveload.decode()), ["TEST"])
+        # Anything after the wanted chunks is ignored, even if it is garbage
+        saveload.append(memoryview(b"garbage"))
+
+    def test_incomplete(self) -> None:
+        with self.assertRaises(Exception):
+            decode(SAVEGAME[:-1], []).decode()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import struct
+import unittest
+
+from savegames import header, savegame, table
+
+from ottd_prayer.saveload import ChTable, SaveloadBuffer
+
+SCRIPT_HEADER = header((0x1A, "name"), (5, "version"))
+# Values of fixed-width fields are skipped over
+ELEMENTS = [{"name": b"ai", "version": None}]
+
+
+def integer(value: int) -> bytes:
+    return b"\x00" + struct.pack(">q", value)
+
+
+def string(value: bytes) -> bytes:
+    return b"\x01" + bytes([len(value)]) + value
+
+
+def array(*values: bytes) -> bytes:
+    return b"\x02" + b"".join(values) + b"\xff"
+
+
+def sq_table(*items: tuple[bytes, bytes]) -> bytes:
+    return b"\x03" + b"".join(key + value for key, value in items) + b"\xff"
+
+
+def decode(script_data: bytes, skip_script_data: bool) -> ChTable:
+    """Decode an AIPL chunk with one AI, and the given data saved by the AI"""
+    row = b"\x02ai" + struct.pack(">i", 7) + b"\x01" + script_data
+    saveload = SaveloadBuffer(skip_script_data=skip_script_data)
+    saveload.append(memoryview(savegame(table(b"AIPL", SCRIPT_HEADER, [row]))))
+    chunk = saveload.decode()["AIPL"]
+    assert isinstance(chunk, ChTable)
+    return chunk
+
+
+class ScriptDataTest(unittest.TestCase):
+    def check(self, script_data: bytes) -> None:
+        for skip_script_data in (False, True):
+            with self.subTest(skip_script_data=skip_script_data):
+                chunk = decode(script_data, skip_script_data)
+                self.assertEqual(chunk.elements, ELEMENTS)
+
+    def test_values(self) -> None:
+        self.check(
+            sq_table(
+                (string(b"a"), integer(-1)),
+                (string(b"b"), array(b"\x04\x01", b"\x05", string(b""))),
+                (integer(3), sq_table()),
+            )
+        )
+
+    def test_deeply_nested(self) -> None:
+        depth = 20000
+        self.check(b"\x02" * depth + b"\xff" * depth)
+        self.check((b"\x03" + string(b"k")) * depth + b"\x05" + b"\xff" * depth)
+
+    def test_no_script_data(self) -> None:
+        row = b"\x02ai" + struct.pack(">i", 7) + b"\x00"
+        saveload = SaveloadBuffer()
+        saveload.append(memoryview(savegame(table(b"AIPL", SCRIPT_HEADER, [row]))))
+        self.assertEqual(saveload.decode()["AIPL"].elements, ELEMENTS)
+
+    def test_malformed(self) -> None:
+        cases = {
+            "unknown type": b"\x09",
+            "end of nothing": b"\xff",
+            "key without value": sq_table((string(b"k"), b"")),
+            "unterminated": array(b"\x05")[:-1] + b"\x05",
+            "left over": integer(1) + b"\x05",
+        }
+        for name, script_data in cases.items():
+            with self.subTest(name):
+                with self.assertRaises(Exception):
+                    decode(script_data, skip_script_data=False)
+
+
+if __name__ == "__main__":
+    unittest.main()